@@ -1,7 +1,11 @@
 import streamlit as st
 import pandas as pd
-from supabase_client import fetch_quotations, delete_quotation
+from supabase_client import (
+    fetch_quotation_page, find_quotation_id, delete_quotation, clone_quotations, DASHBOARD_PAGE_SIZE,
+    get_master_data
+)
 import time
+from datetime import date
 
 # Page Config
 st.set_page_config(
@@ -147,26 +151,58 @@ else:
         if st.button("➕ New Cost Sheet", type="primary", use_container_width=True):
              st.switch_page("pages/1_Cost_Sheet_Editor.py")
 
+    # Filters (applied server-side)
+    with st.expander("🔎 Filters", expanded=False):
+        f1, f2, f3, f4 = st.columns(4)
+        with f1:
+            date_range = st.date_input("Document Date", value=(), key="dash_dates")
+        with f2:
+            f_team = st.selectbox("Team", ["All", "A1", "A2", "A3", "A4", "A5", "A6", "A7", "A8"], key="dash_team")
+        with f3:
+            f_trader = st.text_input("Trader", key="dash_trader").strip()
+        with f4:
+            f_customer = st.text_input("Customer", key="dash_customer").strip()
+
+    date_from = date_range[0] if len(date_range) > 0 else None
+    date_to = date_range[1] if len(date_range) > 1 else None
+    filters = {
+        "date_from": date_from, "date_to": date_to,
+        "team": None if f_team == "All" else f_team,
+        "trader": f_trader or None, "customer": f_customer or None,
+    }
+
+    # Keyset pagination: stack of cursors, one per visited page (reset when filters change)
+    if st.session_state.get("dash_filters") != filters:
+        st.session_state.dash_filters = filters
+        st.session_state.dash_cursors = [None]
+
     # Fetch Data
     try:
-        data = fetch_quotations()
+        page = fetch_quotation_page(st.session_state.dash_cursors[-1], DASHBOARD_PAGE_SIZE, **filters)
+        data = page["rows"]
         if data:
             df = pd.DataFrame(data)
             
-            # Ensure columns exist
+            # Ensure columns exist (summary columns are missing until db_functions.sql is applied)
             if 'status' not in df.columns:
                 df['status'] = "Draft"
             if 'total_cost' not in df.columns:
                 df['total_cost'] = 0.0
+            # Spot rate on each document date from the FX history (one vectorized lookup)
+            df["spot_rate_doc_date"] = get_master_data().fx_history.rates_as_of(df["currency"], df["doc_date"])
             
             # Formatter for easier reading
             st.dataframe(
-                df,
+                df.drop(columns=["id", "created_at"]),
                 column_config={
                     "doc_date": st.column_config.DateColumn("Date"),
                     "doc_no": "Document No.",
                     "customer_importer": "Customer",
+                    "total_qty": st.column_config.NumberColumn("Total Qty", format="%.2f"),
                     "total_cost": st.column_config.NumberColumn("Total Cost", format="%.2f"),
+                    "spot_rate_doc_date": st.column_config.NumberColumn("Spot @ Doc Date", format="%.2f"),
+                    "total_margin": st.column_config.NumberColumn("Total Margin", format="%.2f"),
+                    "line_count": st.column_config.NumberColumn("Lines"),
                     "status": st.column_config.SelectboxColumn(
                         "Status", options=["Draft", "Approved", "Sent"], required=True
                     )
@@ -174,22 +210,64 @@ else:
                 use_container_width=True,
                 hide_index=True
             )
+
+            # Pager
+            page_no = len(st.session_state.dash_cursors)
+            p1, p2, p3 = st.columns([1, 2, 1])
+            with p1:
+                if st.button("◀ Previous", disabled=page_no == 1, use_container_width=True):
+                    st.session_state.dash_cursors.pop()
+                    st.rerun()
+            with p2:
+                st.markdown(f"<div style='text-align: center;'>Page {page_no}</div>", unsafe_allow_html=True)
+            with p3:
+                if st.button("Next ▶", disabled=page["next_cursor"] is None, use_container_width=True):
+                    st.session_state.dash_cursors.append(page["next_cursor"])
+                    st.rerun()
             
-            # Action Section (Simple Delete)
+            # Action Section (Clone / Simple Delete)
             st.markdown("### Actions")
-            del_doc = st.text_input("Enter Document No. to Delete:")
-            if st.button("🗑️ Delete Quotation"):
+            with st.form("clone_form"):
+                st.write("**Clone Quotation** (copied inside the database, new Document No. is reserved)")
+                k1, k2, k3 = st.columns([2, 1, 1])
+                with k1:
+                    clone_src = st.text_input("Source Document No. (comma-separated for bulk)")
+                with k2:
+                    clone_date = st.date_input("New Document Date", value=date.today())
+                with k3:
+                    clone_rate = st.number_input("New Exchange Rate (0 = keep)", min_value=0.0, value=0.0, format="%.2f")
+                cloned = st.form_submit_button("📄 Clone")
+            if cloned:
+                sources = [d.strip() for d in clone_src.split(",") if d.strip()]
+                overrides = {"doc_date": clone_date}
+                if clone_rate > 0:
+                    overrides["exchange_rate"] = clone_rate
+                if sources:
+                    results = clone_quotations([{"source_doc_no": d, "overrides": overrides} for d in sources])
+                    for r in results:
+                        if r.get("error"):
+                            st.error(f"{r['source_doc_no']}: {r['error']}")
+                        else:
+                            st.success(f"Cloned {r['source_doc_no']} → {r['doc_no']}")
+                    fetch_quotation_page.clear()
+
+            with st.form("delete_form"):
+                del_doc = st.text_input("Enter Document No. to Delete:")
+                submitted = st.form_submit_button("🗑️ Delete Quotation")
+            if submitted:
                 if del_doc:
-                    # Find ID
-                    found = df[df['doc_no'] == del_doc]
-                    if not found.empty:
-                        q_id = found.iloc[0]['id']
+                    # Find ID (any page)
+                    q_id = find_quotation_id(del_doc.strip())
+                    if q_id:
                         delete_quotation(q_id)
+                        fetch_quotation_page.clear()
                         st.success(f"Deleted {del_doc}")
                         time.sleep(1)
                         st.rerun()
                     else:
                         st.error("Document not found.")
+        elif any(filters.values()):
+            st.info("No quotations match the filters.")
         else:
             st.info("No quotations found. Create your first one!")
             
@@ -0,0 +1,594 @@
+-- Database Functions (RPC) for the Quotation App
+-- Run this in Supabase SQL Editor after db_migration.sql
+-- Functions are called from supabase_client.py through PostgREST `rpc`
+
+-- Summary columns on the quotation header, maintained by the save RPCs below
+-- so listings read one narrow row per quotation (no join on production costs).
+ALTER TABLE public.trx_general_infos
+    ADD COLUMN IF NOT EXISTS status TEXT DEFAULT 'Draft',
+    ADD COLUMN IF NOT EXISTS total_qty DECIMAL(14,2) DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS total_cost DECIMAL(16,2) DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS total_margin DECIMAL(16,2) DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS line_count INTEGER DEFAULT 0;
+
+-- "Other expenses" table of the Cost Sheet Editor (10 lines), kept with the
+-- export expenses so a saved quotation can be re-opened as entered:
+-- [{"order_no": 1, "description": "...", "amount": 0.0}, ...]
+ALTER TABLE public.trx_export_expenses
+    ADD COLUMN IF NOT EXISTS other_expenses JSONB;
+
+-- Cost / margin per line at each chosen destination (Cost Sheet Editor), stored
+-- column-oriented instead of one row per (line, destination):
+-- {"destinations": [...], "freight": [...], "insurance_rate": [...], "items": [...],
+--  "total_cost": [[...]], "margin_cost": [[...]], "margin_after": [[...]]}
+ALTER TABLE public.trx_export_expenses
+    ADD COLUMN IF NOT EXISTS dest_matrix JSONB;
+
+-- Every export expense line of the editor as entered, keyed by
+-- master_export_expense.line_code (lines without a column of their own included):
+-- {"truck_cost": 8300.0, "thc_cost": 2800.0, ...}
+ALTER TABLE public.trx_export_expenses
+    ADD COLUMN IF NOT EXISTS expense_lines JSONB;
+
+
+-- Helper: recompute the header summary of the given quotations from
+-- trx_production_costs (one statement for any number of quotations).
+-- total_cost / total_margin are line totals (unit value x quantity).
+CREATE OR REPLACE FUNCTION public._refresh_quotation_summaries(p_quotation_ids UUID[])
+RETURNS VOID
+LANGUAGE sql
+AS $$
+    UPDATE public.trx_general_infos g
+       SET total_qty = COALESCE(s.total_qty, 0),
+           total_cost = COALESCE(s.total_cost, 0),
+           total_margin = COALESCE(s.total_margin, 0),
+           line_count = s.line_count,
+           status = COALESCE(g.status, 'Draft')
+      FROM (
+          SELECT q.id,
+                 SUM(p.quantity) AS total_qty,
+                 SUM(p.total_cost * p.quantity) AS total_cost,
+                 SUM(p.margin_cost * p.quantity) AS total_margin,
+                 COUNT(p.id) AS line_count
+            FROM unnest(p_quotation_ids) AS q(id)
+            LEFT JOIN public.trx_production_costs p ON p.quotation_id = q.id
+           GROUP BY q.id
+      ) s
+     WHERE g.id = s.id;
+$$;
+
+CREATE OR REPLACE FUNCTION public._refresh_quotation_summary(p_quotation_id UUID)
+RETURNS VOID
+LANGUAGE sql
+AS $$
+    SELECT public._refresh_quotation_summaries(ARRAY[p_quotation_id]);
+$$;
+
+-- Backfill quotations saved before the summary columns existed (safe to re-run)
+SELECT public._refresh_quotation_summaries(ARRAY(SELECT id FROM public.trx_general_infos));
+
+
+-- Helper: bulk insert a JSON array of rows (each already carrying its
+-- quotation_id) into one trx_* detail table with a single INSERT.
+-- Each row gets a fresh id and created_at.
+CREATE OR REPLACE FUNCTION public._insert_detail_rows(
+    p_table REGCLASS,
+    p_rows JSONB
+) RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_rows JSONB;
+    v_count INTEGER;
+BEGIN
+    SELECT COALESCE(jsonb_agg(
+               e || jsonb_build_object('id', uuid_generate_v4(), 'created_at', NOW())
+           ), '[]'::jsonb)
+      INTO v_rows
+      FROM jsonb_array_elements(COALESCE(p_rows, '[]'::jsonb)) AS e;
+
+    EXECUTE format(
+        'INSERT INTO %s SELECT * FROM jsonb_populate_recordset(NULL::%s, $1)',
+        p_table, p_table
+    ) USING v_rows;
+
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+    RETURN v_count;
+END;
+$$;
+
+
+-- Helper: insert the detail rows of one quotation into one trx_* table.
+CREATE OR REPLACE FUNCTION public._insert_quotation_details(
+    p_table REGCLASS,
+    p_quotation_id UUID,
+    p_rows JSONB
+) RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_rows JSONB;
+BEGIN
+    IF p_rows IS NULL OR jsonb_typeof(p_rows) = 'null' THEN
+        RETURN 0;
+    END IF;
+
+    -- export_expenses / interests are sent as a single object
+    IF jsonb_typeof(p_rows) = 'object' THEN
+        p_rows := jsonb_build_array(p_rows);
+    END IF;
+
+    SELECT COALESCE(jsonb_agg(e || jsonb_build_object('quotation_id', p_quotation_id)), '[]'::jsonb)
+      INTO v_rows
+      FROM jsonb_array_elements(p_rows) AS e;
+
+    RETURN public._insert_detail_rows(p_table, v_rows);
+END;
+$$;
+
+
+-- Helper: upsert a JSON array of quotation headers (on doc_no) in one
+-- statement and return (doc_no, id) for each. A NULL status keeps the
+-- stored one (new headers get 'Draft' from _refresh_quotation_summaries).
+CREATE OR REPLACE FUNCTION public._upsert_quotation_headers(p_general_infos JSONB)
+RETURNS TABLE (doc_no TEXT, id UUID)
+LANGUAGE sql
+AS $$
+    INSERT INTO public.trx_general_infos AS g (
+        doc_no, doc_date, trader_name, team, customer_importer, customer_end_user,
+        incoterm, ship_date_from, ship_date_to, currency, spot_rate, discount_rate,
+        premium_rate, exchange_rate, dest_1, dest_2, dest_3, dest_4, status
+    )
+    SELECT r.doc_no, r.doc_date, r.trader_name, r.team, r.customer_importer, r.customer_end_user,
+           r.incoterm, r.ship_date_from, r.ship_date_to, r.currency, r.spot_rate, r.discount_rate,
+           r.premium_rate, r.exchange_rate, r.dest_1, r.dest_2, r.dest_3, r.dest_4, r.status
+      FROM jsonb_populate_recordset(NULL::public.trx_general_infos, p_general_infos) AS r
+    ON CONFLICT (doc_no) DO UPDATE SET
+        doc_date = EXCLUDED.doc_date,
+        trader_name = EXCLUDED.trader_name,
+        team = EXCLUDED.team,
+        customer_importer = EXCLUDED.customer_importer,
+        customer_end_user = EXCLUDED.customer_end_user,
+        incoterm = EXCLUDED.incoterm,
+        ship_date_from = EXCLUDED.ship_date_from,
+        ship_date_to = EXCLUDED.ship_date_to,
+        currency = EXCLUDED.currency,
+        spot_rate = EXCLUDED.spot_rate,
+        discount_rate = EXCLUDED.discount_rate,
+        premium_rate = EXCLUDED.premium_rate,
+        exchange_rate = EXCLUDED.exchange_rate,
+        dest_1 = EXCLUDED.dest_1,
+        dest_2 = EXCLUDED.dest_2,
+        dest_3 = EXCLUDED.dest_3,
+        dest_4 = EXCLUDED.dest_4,
+        -- Keep the stored status unless the payload sets one
+        status = COALESCE(EXCLUDED.status, g.status),
+        updated_at = NOW()
+    RETURNING g.doc_no, g.id;
+$$;
+
+
+-- Helper: upsert one quotation header (on doc_no) and return its id.
+CREATE OR REPLACE FUNCTION public._upsert_quotation_header(p_general_info JSONB)
+RETURNS UUID
+LANGUAGE sql
+AS $$
+    SELECT h.id FROM public._upsert_quotation_headers(jsonb_build_array(p_general_info)) AS h;
+$$;
+
+
+-- Helper: bring one trx_* detail table in line with the payload using only
+-- the DELETE / UPDATE / INSERT statements that are needed.
+-- Rows are matched on p_key (item_order / order_no); p_key = NULL means the
+-- table holds a single row per quotation (export expenses, interests).
+-- A payload repeating a key is rejected (the keyed UPDATE would pick one of
+-- the duplicates arbitrarily).
+-- Returns {"inserted": n, "updated": n, "deleted": n}.
+CREATE OR REPLACE FUNCTION public._sync_quotation_details(
+    p_table REGCLASS,
+    p_key TEXT,
+    p_quotation_id UUID,
+    p_rows JSONB
+) RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_cols TEXT;
+    v_src_cols TEXT;
+    v_dst_cols TEXT;
+    v_match TEXT;
+    v_inserted INTEGER := 0;
+    v_updated INTEGER := 0;
+    v_deleted INTEGER := 0;
+    v_duplicate TEXT;
+BEGIN
+    IF p_rows IS NULL OR jsonb_typeof(p_rows) = 'null' THEN
+        p_rows := '[]'::jsonb;
+    ELSIF jsonb_typeof(p_rows) = 'object' THEN
+        p_rows := jsonb_build_array(p_rows);
+    END IF;
+
+    IF p_key IS NOT NULL THEN
+        SELECT r ->> p_key INTO v_duplicate
+          FROM jsonb_array_elements(p_rows) AS r
+         GROUP BY r ->> p_key
+        HAVING COUNT(*) > 1
+         LIMIT 1;
+        IF FOUND THEN
+            RAISE EXCEPTION 'Duplicate % % in % payload', p_key, v_duplicate, p_table
+                USING ERRCODE = 'unique_violation';
+        END IF;
+    END IF;
+
+    -- Data columns: everything except the surrogate id, parent key and audit columns
+    SELECT string_agg(quote_ident(attname), ', ' ORDER BY attnum),
+           string_agg('s.' || quote_ident(attname), ', ' ORDER BY attnum),
+           string_agg('t.' || quote_ident(attname), ', ' ORDER BY attnum)
+      INTO v_cols, v_src_cols, v_dst_cols
+      FROM pg_attribute
+     WHERE attrelid = p_table AND attnum > 0 AND NOT attisdropped
+       AND attname NOT IN ('id', 'quotation_id', 'created_at');
+
+    v_match := CASE WHEN p_key IS NULL THEN 'TRUE' ELSE format('t.%1$I = s.%1$I', p_key) END;
+
+    -- 1. Delete stored rows that are no longer in the payload
+    EXECUTE format(
+        'DELETE FROM %1$s t WHERE t.quotation_id = $2 AND NOT EXISTS ('
+        '  SELECT 1 FROM jsonb_populate_recordset(NULL::%1$s, $1) s WHERE %2$s)',
+        p_table, v_match
+    ) USING p_rows, p_quotation_id;
+    GET DIAGNOSTICS v_deleted = ROW_COUNT;
+
+    -- 2. Update matched rows whose values actually changed
+    EXECUTE format(
+        'UPDATE %1$s t SET (%2$s) = (SELECT %3$s) '
+        '  FROM jsonb_populate_recordset(NULL::%1$s, $1) s '
+        ' WHERE t.quotation_id = $2 AND %4$s AND (%5$s) IS DISTINCT FROM (%3$s)',
+        p_table, v_cols, v_src_cols, v_match, v_dst_cols
+    ) USING p_rows, p_quotation_id;
+    GET DIAGNOSTICS v_updated = ROW_COUNT;
+
+    -- 3. Insert payload rows that have no stored counterpart
+    EXECUTE format(
+        'INSERT INTO %1$s (quotation_id, %2$s) '
+        'SELECT $2, %3$s FROM jsonb_populate_recordset(NULL::%1$s, $1) s '
+        ' WHERE NOT EXISTS (SELECT 1 FROM %1$s t WHERE t.quotation_id = $2 AND %4$s)',
+        p_table, v_cols, v_src_cols, v_match
+    ) USING p_rows, p_quotation_id;
+    GET DIAGNOSTICS v_inserted = ROW_COUNT;
+
+    RETURN jsonb_build_object('inserted', v_inserted, 'updated', v_updated, 'deleted', v_deleted);
+END;
+$$;
+
+
+-- 1. save_quotation_full
+-- Writes the header and all 5 detail sets in one request / one transaction.
+-- Payload shape matches supabase_client.save_quotation():
+-- { general_info: {...}, export_expenses: {...}, interests: {...},
+--   production_costs: [...], loadings: [...], remarks: [...] }
+CREATE OR REPLACE FUNCTION public.save_quotation_full(p_data JSONB)
+RETURNS UUID
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_id UUID;
+BEGIN
+    v_id := public._upsert_quotation_header(p_data->'general_info');
+
+    -- Replace details (same semantics as the client-side path)
+    DELETE FROM public.trx_export_expenses WHERE quotation_id = v_id;
+    DELETE FROM public.trx_interests WHERE quotation_id = v_id;
+    DELETE FROM public.trx_production_costs WHERE quotation_id = v_id;
+    DELETE FROM public.trx_loadings WHERE quotation_id = v_id;
+    DELETE FROM public.trx_remarks WHERE quotation_id = v_id;
+
+    PERFORM public._insert_quotation_details('public.trx_export_expenses', v_id, p_data->'export_expenses');
+    PERFORM public._insert_quotation_details('public.trx_interests', v_id, p_data->'interests');
+    PERFORM public._insert_quotation_details('public.trx_production_costs', v_id, p_data->'production_costs');
+    PERFORM public._insert_quotation_details('public.trx_loadings', v_id, p_data->'loadings');
+    PERFORM public._insert_quotation_details('public.trx_remarks', v_id, p_data->'remarks');
+
+    PERFORM public._refresh_quotation_summary(v_id);
+    RETURN v_id;
+END;
+$$;
+
+
+-- 2. save_quotation_diff
+-- Same payload as save_quotation_full, but details are diffed against the
+-- stored rows (keyed by item_order / order_no) instead of delete-all/reinsert.
+-- Returns {"quotation_id": ..., "<table>": {"inserted", "updated", "deleted"}, ...}
+CREATE OR REPLACE FUNCTION public.save_quotation_diff(p_data JSONB)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_id UUID;
+    v_result JSONB;
+BEGIN
+    v_id := public._upsert_quotation_header(p_data->'general_info');
+
+    v_result := jsonb_build_object(
+        'quotation_id', v_id,
+        'trx_export_expenses', public._sync_quotation_details('public.trx_export_expenses', NULL, v_id, p_data->'export_expenses'),
+        'trx_interests', public._sync_quotation_details('public.trx_interests', NULL, v_id, p_data->'interests'),
+        'trx_production_costs', public._sync_quotation_details('public.trx_production_costs', 'item_order', v_id, p_data->'production_costs'),
+        'trx_loadings', public._sync_quotation_details('public.trx_loadings', 'order_no', v_id, p_data->'loadings'),
+        'trx_remarks', public._sync_quotation_details('public.trx_remarks', 'order_no', v_id, p_data->'remarks')
+    );
+
+    PERFORM public._refresh_quotation_summary(v_id);
+    RETURN v_result;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.save_quotation_full(JSONB) TO anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.save_quotation_diff(JSONB) TO anon, authenticated;
+
+
+-- 3. reserve_doc_no
+-- Atomically hands out the next sequence number for a Document No. prefix
+-- (e.g. 'CS20260212-'). One counter row per prefix; the row lock taken by
+-- UPDATE / INSERT ... ON CONFLICT serializes concurrent callers, so two
+-- editors never get the same number. Reserved numbers that are never saved
+-- leave gaps.
+CREATE TABLE IF NOT EXISTS public.doc_no_counters (
+    prefix TEXT PRIMARY KEY,
+    last_value INTEGER NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Only reachable through reserve_doc_no (SECURITY DEFINER)
+ALTER TABLE public.doc_no_counters ENABLE ROW LEVEL SECURITY;
+
+CREATE OR REPLACE FUNCTION public.reserve_doc_no(p_prefix TEXT)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_next INTEGER;
+    v_seed INTEGER;
+BEGIN
+    UPDATE public.doc_no_counters
+       SET last_value = last_value + 1, updated_at = NOW()
+     WHERE prefix = p_prefix
+    RETURNING last_value INTO v_next;
+
+    IF FOUND THEN
+        RETURN v_next;
+    END IF;
+
+    -- First reservation for this prefix: continue after documents saved
+    -- before the counter existed (index range scan on doc_no)
+    SELECT COALESCE(MAX(substr(doc_no, length(p_prefix) + 1)::INTEGER), 0)
+      INTO v_seed
+      FROM public.trx_general_infos
+     WHERE doc_no >= p_prefix AND starts_with(doc_no, p_prefix)
+       AND substr(doc_no, length(p_prefix) + 1) ~ '^[0-9]{1,9}$';
+
+    INSERT INTO public.doc_no_counters (prefix, last_value)
+    VALUES (p_prefix, v_seed + 1)
+    ON CONFLICT (prefix) DO UPDATE
+       SET last_value = public.doc_no_counters.last_value + 1, updated_at = NOW()
+    RETURNING last_value INTO v_next;
+
+    RETURN v_next;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.reserve_doc_no(TEXT) TO anon, authenticated;
+
+
+-- Helper: copy every detail row of one trx_* table from one quotation to another.
+CREATE OR REPLACE FUNCTION public._clone_quotation_details(
+    p_table REGCLASS,
+    p_source_id UUID,
+    p_target_id UUID
+) RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_cols TEXT;
+    v_count INTEGER;
+BEGIN
+    SELECT string_agg(quote_ident(attname), ', ' ORDER BY attnum)
+      INTO v_cols
+      FROM pg_attribute
+     WHERE attrelid = p_table AND attnum > 0 AND NOT attisdropped
+       AND attname NOT IN ('id', 'quotation_id', 'created_at');
+
+    EXECUTE format(
+        'INSERT INTO %1$s (quotation_id, %2$s) SELECT $2, %2$s FROM %1$s WHERE quotation_id = $1',
+        p_table, v_cols
+    ) USING p_source_id, p_target_id;
+
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+    RETURN v_count;
+END;
+$$;
+
+
+-- 4. clone_quotation
+-- Copies a quotation (header + all 5 detail sets) to a new doc_no in one call.
+-- p_new_doc_no = NULL reserves the next CSYYYYMMDD-XXXX number for the copy's
+-- doc_date (today only when the copy has no doc_date). This intentionally
+-- differs from the editor, which reserves under the day the sheet is entered:
+-- a clone is usually re-dated in bulk, and its number should carry that date.
+-- p_overrides replaces header fields, e.g.
+--   {"doc_date": "2026-03-01", "exchange_rate": 35.2,
+--    "ship_date_from": "2026-03-10", "ship_date_to": "2026-06-30"}
+-- Detail rows are copied as stored (costs are re-priced when the copy is
+-- opened and saved in the editor). The copy starts as 'Draft'.
+-- Returns {"quotation_id": ..., "doc_no": ..., "source_doc_no": ...}.
+CREATE OR REPLACE FUNCTION public.clone_quotation(
+    p_source_doc_no TEXT,
+    p_new_doc_no TEXT DEFAULT NULL,
+    p_overrides JSONB DEFAULT '{}'::jsonb
+) RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_source public.trx_general_infos;
+    v_copy public.trx_general_infos;
+    v_prefix TEXT;
+BEGIN
+    SELECT * INTO v_source FROM public.trx_general_infos WHERE doc_no = p_source_doc_no;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'Quotation % not found', p_source_doc_no USING ERRCODE = 'no_data_found';
+    END IF;
+
+    -- Source header with the overrides applied; identity / audit fields are not overridable
+    v_copy := jsonb_populate_record(
+        v_source,
+        COALESCE(p_overrides, '{}'::jsonb) - 'id' - 'doc_no' - 'created_at' - 'updated_at'
+    );
+
+    IF p_new_doc_no IS NULL THEN
+        -- Numbered by the copy's doc_date, not the entry date (see above)
+        v_prefix := 'CS' || to_char(COALESCE(v_copy.doc_date, CURRENT_DATE), 'YYYYMMDD') || '-';
+        p_new_doc_no := v_prefix || lpad(public.reserve_doc_no(v_prefix)::TEXT, 4, '0');
+    END IF;
+    v_copy.id := uuid_generate_v4();
+    v_copy.doc_no := p_new_doc_no;
+    v_copy.status := COALESCE(p_overrides->>'status', 'Draft');
+    v_copy.created_at := NOW();
+    v_copy.updated_at := NOW();
+    INSERT INTO public.trx_general_infos SELECT (v_copy).*;
+
+    PERFORM public._clone_quotation_details('public.trx_export_expenses', v_source.id, v_copy.id);
+    PERFORM public._clone_quotation_details('public.trx_interests', v_source.id, v_copy.id);
+    PERFORM public._clone_quotation_details('public.trx_production_costs', v_source.id, v_copy.id);
+    PERFORM public._clone_quotation_details('public.trx_loadings', v_source.id, v_copy.id);
+    PERFORM public._clone_quotation_details('public.trx_remarks', v_source.id, v_copy.id);
+
+    PERFORM public._refresh_quotation_summary(v_copy.id);
+    RETURN jsonb_build_object('quotation_id', v_copy.id, 'doc_no', v_copy.doc_no, 'source_doc_no', p_source_doc_no);
+END;
+$$;
+
+
+-- 5. clone_quotations
+-- Bulk clone in one request: p_items is an array of
+--   {"source_doc_no": ..., "new_doc_no": ... (optional), "overrides": {...} (optional)}
+-- Each item runs in its own savepoint, so one bad item does not undo the rest.
+-- Returns one result per item: clone_quotation() output, or {"source_doc_no", "error"}.
+CREATE OR REPLACE FUNCTION public.clone_quotations(p_items JSONB)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_item JSONB;
+    v_results JSONB := '[]'::jsonb;
+BEGIN
+    FOR v_item IN SELECT * FROM jsonb_array_elements(COALESCE(p_items, '[]'::jsonb))
+    LOOP
+        BEGIN
+            v_results := v_results || jsonb_build_array(public.clone_quotation(
+                v_item->>'source_doc_no',
+                v_item->>'new_doc_no',
+                COALESCE(v_item->'overrides', '{}'::jsonb)
+            ));
+        EXCEPTION WHEN OTHERS THEN
+            v_results := v_results || jsonb_build_array(jsonb_build_object(
+                'source_doc_no', v_item->>'source_doc_no', 'error', SQLERRM
+            ));
+        END;
+    END LOOP;
+    RETURN v_results;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.clone_quotation(TEXT, TEXT, JSONB) TO anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.clone_quotations(JSONB) TO anon, authenticated;
+
+
+-- 6. save_quotations_bulk
+-- Saves many quotations (same payload shape as save_quotation_full) in one
+-- request: one INSERT ... ON CONFLICT for all headers, then one DELETE and
+-- one INSERT per detail table for the whole chunk.
+-- If anything in the chunk fails, the chunk is redone quotation by quotation
+-- (one savepoint each) so only the bad ones are reported.
+-- Returns [{"doc_no", "quotation_id"} or {"doc_no", "error"}, ...] in input order.
+CREATE OR REPLACE FUNCTION public.save_quotations_bulk(p_items JSONB)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_ids JSONB;
+    v_id_list UUID[];
+    v_detail RECORD;
+    v_rows JSONB;
+    v_item JSONB;
+    v_results JSONB;
+BEGIN
+    p_items := COALESCE(p_items, '[]'::jsonb);
+
+    BEGIN
+        -- 1. All headers in one statement -> {doc_no: id}
+        SELECT jsonb_object_agg(h.doc_no, h.id), array_agg(h.id)
+          INTO v_ids, v_id_list
+          FROM public._upsert_quotation_headers(
+                   (SELECT jsonb_agg(e->'general_info') FROM jsonb_array_elements(p_items) AS e)
+               ) AS h;
+
+        -- 2. Replace details: one DELETE + one INSERT per table for the whole chunk
+        FOR v_detail IN
+            SELECT * FROM (VALUES
+                ('public.trx_export_expenses'::regclass, 'export_expenses'),
+                ('public.trx_interests'::regclass, 'interests'),
+                ('public.trx_production_costs'::regclass, 'production_costs'),
+                ('public.trx_loadings'::regclass, 'loadings'),
+                ('public.trx_remarks'::regclass, 'remarks')
+            ) AS d(tbl, payload_key)
+        LOOP
+            EXECUTE format('DELETE FROM %s WHERE quotation_id = ANY($1)', v_detail.tbl) USING v_id_list;
+
+            SELECT COALESCE(jsonb_agg(
+                       r || jsonb_build_object('quotation_id', v_ids->>(e->'general_info'->>'doc_no'))
+                   ), '[]'::jsonb)
+              INTO v_rows
+              FROM jsonb_array_elements(p_items) AS e,
+                   jsonb_array_elements(CASE jsonb_typeof(e->v_detail.payload_key)
+                                            WHEN 'object' THEN jsonb_build_array(e->v_detail.payload_key)
+                                            WHEN 'array' THEN e->v_detail.payload_key
+                                            ELSE '[]'::jsonb END) AS r;
+
+            PERFORM public._insert_detail_rows(v_detail.tbl, v_rows);
+        END LOOP;
+
+        PERFORM public._refresh_quotation_summaries(v_id_list);
+
+        SELECT COALESCE(jsonb_agg(jsonb_build_object(
+                   'doc_no', e->'general_info'->>'doc_no',
+                   'quotation_id', v_ids->>(e->'general_info'->>'doc_no')
+               ) ORDER BY n), '[]'::jsonb)
+          INTO v_results
+          FROM jsonb_array_elements(p_items) WITH ORDINALITY AS x(e, n);
+        RETURN v_results;
+    EXCEPTION WHEN OTHERS THEN
+        -- Chunk rolled back to the savepoint; isolate the failing quotations below
+        NULL;
+    END;
+
+    v_results := '[]'::jsonb;
+    FOR v_item IN SELECT e FROM jsonb_array_elements(p_items) AS e
+    LOOP
+        BEGIN
+            v_results := v_results || jsonb_build_array(jsonb_build_object(
+                'doc_no', v_item->'general_info'->>'doc_no',
+                'quotation_id', public.save_quotation_full(v_item)
+            ));
+        EXCEPTION WHEN OTHERS THEN
+            v_results := v_results || jsonb_build_array(jsonb_build_object(
+                'doc_no', v_item->'general_info'->>'doc_no', 'error', SQLERRM
+            ));
+        END;
+    END LOOP;
+    RETURN v_results;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.save_quotations_bulk(JSONB) TO anon, authenticated;
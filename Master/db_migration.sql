@@ -34,6 +34,10 @@ CREATE TABLE IF NOT EXISTS public.trx_general_infos (
 );
 
 CREATE INDEX IF NOT EXISTS idx_gen_doc_no ON public.trx_general_infos(doc_no);
+-- Dashboard listing: keyset pagination on (created_at, id), newest first
+CREATE INDEX IF NOT EXISTS idx_gen_created_id ON public.trx_general_infos(created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_gen_team_created_id ON public.trx_general_infos(team, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_gen_doc_date ON public.trx_general_infos(doc_date);
 
 
 -- 2. Table: trx_export_expenses
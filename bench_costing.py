@@ -0,0 +1,273 @@
+"""
+Benchmark + parity check: costing.compute_cost_sheet vs. the original iterrows() loop
+
+Usage:
+    python bench_costing.py                      # 15, 1,000 and 100,000 lines (plus an empty sheet)
+    python bench_costing.py --sizes 15 5000      # custom sizes
+    python bench_costing.py --legacy             # quotation_app.py variant (totals, 30-day storage)
+    python bench_costing.py --incremental        # CostSheetModel.update after one-cell edits vs. full recompute
+    python bench_costing.py --destinations       # line x destination matrix vs. one cost sheet per destination
+
+Exits non-zero when any line differs from the loop by more than one rounding step.
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from costing import (EDITOR_COLUMNS, LEGACY_COLUMNS, MATRIX_MEASURES, CostSheetModel, compute_cost_sheet,
+                     destination_matrix)
+from master_data import MasterData
+
+RM_PRODUCTS = [f"HM {i}" for i in range(1, 41)]
+PARAMS = {
+    "doc_date": date(2026, 2, 12), "ex_rate": 34.5, "export_expense_total": 48_500.0,
+    "factory_expense_rate": 0.42, "ar_rate": 2.4, "ar_days": 30, "rm_rate": 2.5, "rm_days": 45, "wh_days": 21,
+}
+
+
+def build_master(seed: int = 7) -> MasterData:
+    rng = np.random.default_rng(seed)
+    rm_costs = [
+        {"id": n, "product": product, "price": round(float(rng.uniform(15, 60)), 2),
+         "update_date": str(date(2025, 1, 1) + pd.Timedelta(days=int(d)))}
+        for n, (product, d) in enumerate(
+            (p, d) for p in RM_PRODUCTS for d in sorted(rng.choice(500, 12, replace=False)))
+    ]
+    overhead = [{"group_number": g, "overhead_rate": 1.2 + 0.35 * g, "yield_loss_percent": [0, 0.98, 0.97, 0.95, 0.93, 0.9, 0.88][g]}
+                for g in range(7)]
+    return MasterData({"master_rm_cost": rm_costs, "master_overhead": overhead,
+                       "master_factory_expense": [{"expense_rate": PARAMS["factory_expense_rate"]}]})
+
+
+def build_lines(n: int, seed: int = 11) -> pd.DataFrame:
+    """Products table shaped like the editor's cost_data_v3 (every 10th row left empty)."""
+    rng = np.random.default_rng(seed)
+    empty = np.arange(n) % 10 == 9
+    df = pd.DataFrame({
+        "Item": np.arange(1, n + 1),
+        "Product Name": [f"Product {i}" for i in range(1, n + 1)],
+        "Product RM": rng.choice(RM_PRODUCTS + ["UNKNOWN RM"], n),
+        "Group": rng.integers(0, 7, n),
+        "PACKAGING": rng.uniform(0, 80, n).round(2),
+        "Brand": "Brand",
+        "Pack Size": "10 kg",
+        "Quantity": rng.uniform(1, 30, n).round(2),
+        "Commision": rng.uniform(0, 10, n).round(2),
+        "A&P": rng.uniform(0, 5, n).round(2),
+        "Agreement": 0.0,
+        "Other Cost": rng.uniform(0, 3, n).round(2),
+        "Selling Price": rng.uniform(900, 2500, n).round(2),
+    })
+    df.loc[empty, ["Product Name", "Product RM"]] = ""
+    df.loc[empty, "Quantity"] = 0.0
+    return df
+
+
+def get_rm_base_price(rm_costs_data, product, shipment_date_str):
+    """The original RM lookup (row scan over master_rm_cost) from pages/1_Cost_Sheet_Editor.py."""
+    if not rm_costs_data: return 0.0
+    try:
+        target_date = pd.to_datetime(shipment_date_str, format='%b.%y', errors='coerce')
+        if pd.isna(target_date): return 0.0
+
+        matches = [r for r in rm_costs_data if r['product'] == product]
+        if not matches: return 0.0
+
+        # Sort by date descending
+        matches.sort(key=lambda x: x['update_date'], reverse=True)
+        # Find the latest price that is on or before the target shipment date
+        for r in matches:
+            if pd.to_datetime(r['update_date']) <= target_date:
+                return float(r['price'])
+        # Fallback to the oldest if none match
+        return float(matches[-1]['price'])
+    except:
+        return 0.0
+
+
+def reference_loop(lines, master, doc_date, ex_rate, export_expense_total, factory_expense_rate,
+                   ar_rate, ar_days, rm_rate, rm_days, wh_days, legacy=False):
+    """The original per-row loop from pages/1_Cost_Sheet_Editor.py / quotation_app.py."""
+    total_qty_all = lines["Quantity"].sum()
+    rm_costs_data = list(master.rm_costs)
+    results = []
+    for index, row in lines.iterrows():
+        qty = row.get("Quantity", 0.0)
+        prod_rm = row.get("Product RM", "")
+        if qty <= 0 and not row.get("Product Name") and not prod_rm:
+            continue
+        base_price = get_rm_base_price(rm_costs_data, prod_rm, doc_date.strftime('%b.%y'))
+        rm_price = (base_price * 1000 / ex_rate) if ex_rate > 0 else (base_price * 1000)
+        g_num = row.get("Group", 0)
+        oh_rate, y_loss_pct = master.overhead_rate(g_num), master.yield_loss(g_num)
+        yield_loss_cost = (rm_price / y_loss_pct) if y_loss_pct > 0 else rm_price
+        bp_val = (yield_loss_cost - rm_price) / 3
+        rm_net_yield = yield_loss_cost - bp_val
+        overhead_val = (oh_rate * 1000 / ex_rate) if ex_rate > 0 else (oh_rate * 1000)
+        factory_exp_val = (factory_expense_rate * 1000 / ex_rate) if ex_rate > 0 else (factory_expense_rate * 1000)
+        unit_export_exp = 0.0
+        if total_qty_all > 0 and ex_rate > 0:
+            unit_export_exp = (export_expense_total / total_qty_all) / ex_rate
+        c_pkg = row.get("PACKAGING", 0.0)
+        c_comm = row.get("Commision", 0.0)
+        c_ap = row.get("A&P", 0.0)
+        c_agree = row.get("Agreement", 0.0)
+        c_other = row.get("Other Cost", 0.0)
+        selling = row.get("Selling Price", 0.0)
+        total_cost = (rm_net_yield + c_pkg + overhead_val + factory_exp_val +
+                      unit_export_exp + c_comm + c_ap + c_agree + c_other)
+        margin_cost = selling - total_cost
+        unit_ar_int = (selling * (ar_rate / 100) / 365) * ar_days if ar_days > 0 else 0.0
+        unit_rm_int = (selling * (rm_rate / 100) / 365) * rm_days if rm_days > 0 else 0.0
+        total_wh_storage = (wh_days * qty * 1.0) / ex_rate if (qty > 0 and ex_rate > 0) else 0.0
+        margin_after_unit = margin_cost - unit_ar_int - unit_rm_int - total_wh_storage
+        results.append({
+            "Item": row["Item"], "Product Name": row["Product Name"], "Product RM": prod_rm,
+            "RM Price": round(rm_price, 2), "Group (0-6)": g_num, "Yield loss %": y_loss_pct,
+            "Yield loss": round(yield_loss_cost, 2), "BP": round(bp_val, 2),
+            "RM Net Yield": round(rm_net_yield, 2), "PACKAGING": c_pkg, "Brand": row["Brand"],
+            "Pack Size": row["Pack Size"], "Overhead": round(overhead_val, 2), "Quantity": qty,
+            "Factory Expense": round(factory_exp_val, 2), "Export Expense": round(unit_export_exp, 2),
+            "Commision": c_comm, "A&P": c_ap, "Agreement": c_agree, "Other Cost": c_other,
+            "Total Cost": round(total_cost, 2), "Selling Price": selling,
+            "MarginCost (Unit)": round(margin_cost, 2),
+            "AR Interest (Unit)": round(unit_ar_int, 2), "RM Interest (Unit)": round(unit_rm_int, 2),
+            "AR Interest (Total)": round(unit_ar_int * qty, 2), "RM Interest (Total)": round(unit_rm_int * qty, 2),
+            "WH Storage (Total)": round(total_wh_storage, 2),
+            "Margin After (Unit)": round(margin_after_unit, 2),
+            "Margin After (Total)": round(margin_after_unit * qty, 2),
+        })
+    columns = LEGACY_COLUMNS if legacy else EDITOR_COLUMNS
+    return pd.DataFrame(results, columns=list(columns))
+
+
+def compare(expected: pd.DataFrame, actual: pd.DataFrame) -> dict:
+    """Row/column parity; numeric cells may differ by one cent (round-half-even ties)."""
+    assert list(expected.columns) == list(actual.columns), "column mismatch"
+    assert len(expected) == len(actual), f"row count {len(expected)} != {len(actual)}"
+    worst, off_by_cent = 0.0, 0
+    for col in expected.columns:
+        exp, act = expected[col], actual[col]
+        if pd.api.types.is_numeric_dtype(exp) and pd.api.types.is_numeric_dtype(act):
+            diff = np.abs(exp.to_numpy(dtype=float) - act.to_numpy(dtype=float))
+            worst = max(worst, float(np.nanmax(diff, initial=0.0)))
+            off_by_cent += int((diff > 1e-9).sum())
+        else:
+            assert (exp.astype(str).to_numpy() == act.astype(str).to_numpy()).all(), f"{col} differs"
+    return {"rows": len(expected), "max_abs_diff": round(worst, 6), "cells_off_by_cent": off_by_cent,
+            "ok": worst <= 0.01 + 1e-9}
+
+
+def timed(fn, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return out, statistics.median(timings)
+
+
+# One-cell edits replayed by --incremental: (label, column, extra params)
+EDITS = (
+    ("A&P of one line", "A&P", {}),
+    ("Selling Price of one line (insurance on)", "Selling Price", {"insurance_rate": 1.25 * 0.000098}),
+)
+
+
+def run_incremental(n: int, master: MasterData, params: dict, columns, repeat: int = 20) -> bool:
+    """Time CostSheetModel.update after single-cell edits; every result must equal a full recompute."""
+    rng = np.random.default_rng(3)
+    ok = True
+    for label, column, extra in EDITS:
+        lines = build_lines(n)
+        model = CostSheetModel(columns)
+        model.update(lines, master, **params, **extra)
+        inc_ms, full_ms, worst = [], [], 0.0
+        for _ in range(repeat):
+            lines = lines.copy()
+            row = int(rng.integers(0, n))
+            lines.loc[row, column] = round(float(lines.loc[row, column]) + 1.5, 2)
+            start = time.perf_counter()
+            actual = model.update(lines, master, **params, **extra)
+            inc_ms.append((time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            expected = compute_cost_sheet(lines, master, columns=columns, **params, **extra)
+            full_ms.append((time.perf_counter() - start) * 1000)
+            worst = max(worst, compare(expected, actual)["max_abs_diff"])
+        ok &= worst == 0.0
+        print(json.dumps({"lines": n, "edit": label, "full_ms": round(statistics.median(full_ms), 2),
+                          "incremental_ms": round(statistics.median(inc_ms), 2),
+                          "line_evals": model.last_update["line_evals"], "max_abs_diff": worst, "ok": worst == 0.0}))
+    return ok
+
+
+# Destinations replayed by --destinations: (freight THB, insurance multiplier)
+DESTINATIONS = ((18_000.0, 1.25 * 0.000098), (42_000.0, 1.10 * 0.00049), (65_000.0, 1.25 * 0.000446),
+                (90_000.0, 1.10 * 0.00223))
+
+
+def run_destinations(n: int, master: MasterData, params: dict, columns, repeat: int = 5) -> bool:
+    """Time destination_matrix against one compute_cost_sheet per destination; every cell must match."""
+    lines = build_lines(n)
+    base_freight, base_rate = DESTINATIONS[0]
+    freight, rates = zip(*DESTINATIONS)
+    model = CostSheetModel(columns)
+    model.update(lines, master, **params, insurance_rate=base_rate)
+    labels = [f"Dest {d}" for d in range(1, len(DESTINATIONS) + 1)]
+
+    def per_destination():
+        return [compute_cost_sheet(lines, master, columns=columns, insurance_rate=rate,
+                                   **dict(params, export_expense_total=params["export_expense_total"] - base_freight + f))
+                for f, rate in DESTINATIONS]
+
+    sheets, loop_ms = timed(per_destination, repeat)
+    matrix, matrix_ms = timed(lambda: destination_matrix(model, labels, freight, rates, base_freight=base_freight),
+                              repeat)
+    worst = max(float(np.abs(sheet[column].to_numpy() - matrix[column][label].to_numpy()).max(initial=0.0))
+                for sheet, label in zip(sheets, labels) for column in MATRIX_MEASURES)
+    ok = worst <= 0.01 + 1e-9  # one rounding step: the matrix is shifted before rounding
+    print(json.dumps({"lines": n, "destinations": len(labels), "per_destination_ms": round(loop_ms, 2),
+                      "matrix_ms": round(matrix_ms, 2), "speedup": round(loop_ms / matrix_ms, 1) if matrix_ms else None,
+                      "max_abs_diff": round(worst, 6), "ok": ok}))
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[15, 1_000, 100_000])
+    parser.add_argument("--legacy", action="store_true", help="quotation_app.py columns and 30-day WH storage")
+    parser.add_argument("--incremental", action="store_true", help="incremental updates instead of the loop comparison")
+    parser.add_argument("--destinations", action="store_true", help="destination matrix instead of the loop comparison")
+    args = parser.parse_args()
+
+    master = build_master()
+    params = dict(PARAMS, wh_days=30) if args.legacy else PARAMS
+    columns = LEGACY_COLUMNS if args.legacy else EDITOR_COLUMNS
+    if args.incremental:
+        return 0 if all([run_incremental(n, master, params, columns) for n in args.sizes]) else 1
+    if args.destinations:
+        return 0 if all([run_destinations(n, master, params, columns) for n in args.sizes]) else 1
+
+    failed = False
+    # An empty products table (new sheet, batch tooling) must give an empty sheet, not raise
+    for n in [0] + [n for n in args.sizes if n]:
+        lines = build_lines(n)
+        repeat = 5 if n <= 10_000 else 1
+        expected, loop_ms = timed(lambda: reference_loop(lines, master, legacy=args.legacy, **params), repeat)
+        actual, vec_ms = timed(lambda: compute_cost_sheet(lines, master, columns=columns, **params), repeat)
+        parity = compare(expected, actual)
+        failed |= not parity["ok"]
+        print(json.dumps({"lines": n, "loop_ms": round(loop_ms, 2), "vectorized_ms": round(vec_ms, 2),
+                          "speedup": round(loop_ms / vec_ms, 1) if vec_ms else None, **parity}))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
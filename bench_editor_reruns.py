@@ -0,0 +1,109 @@
+"""
+Benchmark: Cost Sheet Editor rerun cost, full page vs. per-section fragments
+
+Before the sections became st.fragment units, every widget change reran the
+whole page. Now a change reruns only its own section, plus the cost summary
+when the widget feeds the costing. The page records each section's run time
+in session_state.section_timings. This script runs the page headless
+(streamlit.testing AppTest) with a synthetic master data set and reports:
+
+    before_ms - the full page run (what every widget change used to cost)
+    after_ms  - the edited section's fragment (+ the summary fragment)
+
+Usage:
+    python bench_editor_reruns.py                      # 3,800 ports, 15 product lines
+    python bench_editor_reruns.py --ports 500 --runs 10
+    python bench_editor_reruns.py --lines 2000         # large quotation (paged line editors)
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+
+import numpy as np
+import pandas as pd
+from streamlit.testing.v1 import AppTest
+
+import supabase_client
+from bench_costing import RM_PRODUCTS, build_lines
+from master_data import MasterData
+
+PAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pages", "1_Cost_Sheet_Editor.py")
+
+# Section fragment -> does editing it also rerun the summary (for its costing inputs)?
+SECTIONS = {
+    "general": True,
+    "export": True,
+    "interest": True,
+    "production": True,
+    "remark": False,
+    "loading": False,
+}
+
+
+def build_master(n_ports: int, n_customers: int, seed: int = 5) -> MasterData:
+    rng = np.random.default_rng(seed)
+    return MasterData({
+        "master_customers": [
+            {"id": i, "customer_code": f"C{i:05d}", "customer_name": f"Customer {i}",
+             "payment_term_customer_name": "T/T 30 DAYS"} for i in range(n_customers)
+        ],
+        "master_currencies": [{"code": c} for c in ("USD", "THB", "EUR", "JPY")],
+        "master_ports": [
+            {"id": i, "main_port_name": f"Port {i:04d}", "country_code": f"C{i % 180:03d}"} for i in range(n_ports)
+        ],
+        "master_overhead": [{"group_number": g, "overhead_rate": 1.2 + 0.35 * g,
+                             "yield_loss_percent": [0, 0.98, 0.97, 0.95, 0.93, 0.9, 0.88][g]} for g in range(7)],
+        "master_factory_expense": [{"expense_rate": 0.42}],
+        "master_rm_cost": [
+            {"id": n, "product": p, "price": round(float(rng.uniform(15, 60)), 2), "update_date": f"2026-0{m}-01"}
+            for n, (p, m) in enumerate((p, m) for p in RM_PRODUCTS for m in range(1, 4))
+        ],
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ports", type=int, default=3_800)
+    parser.add_argument("--customers", type=int, default=1_000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--lines", type=int, default=15, help="Production cost lines (and loading / remark lines)")
+    args = parser.parse_args()
+
+    master = build_master(args.ports, args.customers)
+    # Offline: no Supabase calls from the page
+    supabase_client.get_master_data = lambda: master
+    supabase_client.reserve_doc_no_sequence = lambda prefix: 1
+
+    at = AppTest.from_file(PAGE, default_timeout=120)
+    at.session_state["authentication_status"] = True
+    if args.lines != 15:
+        at.session_state["cost_data_v3"] = build_lines(args.lines)
+        at.session_state["loading_data"] = pd.DataFrame({
+            "No.": range(1, args.lines + 1), "รายการสินค้า": [f"Product {i}" for i in range(1, args.lines + 1)],
+            "จำนวน (ลัง/กล่อง)": 100, "น้ำหนัก/หน่วย (KG)": 10.0, "น้ำหนักรวม (KG)": 1000.0, "ตู้ที่": "1", "หมายเหตุ": "",
+        })
+        at.session_state["remark_data"] = pd.DataFrame({"No.": range(1, args.lines + 1), "Remark": "Remark"})
+    samples = []
+    for _ in range(args.runs + 1):
+        at.run()
+        if at.exception:
+            print(at.exception[0].value)
+            return 1
+        samples.append(dict(at.session_state["section_timings"]))
+    samples = samples[1:]  # first run warms imports and caches
+
+    before = statistics.median(s["app"] for s in samples)
+    summary = statistics.median(s["summary"] for s in samples)
+    for section, with_summary in SECTIONS.items():
+        after = statistics.median(s[section] for s in samples) + (summary if with_summary else 0.0)
+        print(json.dumps({"edited_section": section, "reruns": [section] + (["summary"] if with_summary else []),
+                          "lines": args.lines, "before_ms": round(before, 1), "after_ms": round(after, 1),
+                          "speedup": round(before / after, 1) if after else None}))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
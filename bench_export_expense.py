@@ -0,0 +1,66 @@
+"""
+Benchmark: export expenses for many container / invoice scenarios
+
+Section 2 of the Cost Sheet Editor used to compute each expense line as a
+literal rate times the container or invoice count, one line at a time.
+export_expense.ExportExpenseSchedule prices every line as a rate vector times
+the driver vector, and a batch of scenarios as one matrix product. This
+script prices N random scenarios both ways and reports:
+
+    before_ms - per-scenario, per-line Python arithmetic (the old literals)
+    after_ms  - ExportExpenseSchedule.amounts() over all scenarios at once
+    parity    - identical amounts for every scenario and line
+
+Usage:
+    python bench_export_expense.py
+    python bench_export_expense.py --scenarios 1000000
+"""
+
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from export_expense import DEFAULT_EXPORT_EXPENSES, ExportExpenseSchedule
+
+AS_OF = "2026-01-15"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", type=int, default=100_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(5)
+    containers = rng.integers(1, 60, args.scenarios)
+    invoices = rng.integers(1, 10, args.scenarios)
+    tons = rng.uniform(10, 28, args.scenarios).round(2)
+    schedule = ExportExpenseSchedule([])
+
+    # Before: the editor's per-line literals, scenario by scenario
+    start = time.perf_counter()
+    expected = []
+    for container_qty, invoice_qty in zip(containers.tolist(), invoices.tolist()):
+        expected.append([line["rate"] * (container_qty if line["driver"] == "container" else invoice_qty)
+                         for line in DEFAULT_EXPORT_EXPENSES])
+    before_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    amounts = schedule.amounts(AS_OF, containers, invoices, tons)
+    after_ms = (time.perf_counter() - start) * 1000
+
+    totals = schedule.totals(AS_OF, containers, invoices, tons)
+    parity = bool(np.array_equal(amounts, np.array(expected)) and np.allclose(totals, amounts.sum(axis=1)))
+    print(json.dumps({
+        "scenarios": args.scenarios, "lines": len(schedule), "before_ms": round(before_ms, 1),
+        "after_ms": round(after_ms, 2), "speedup": round(before_ms / after_ms) if after_ms else None,
+        "driver_rates": dict(zip(("container", "invoice", "ton"), schedule.driver_rates(AS_OF).tolist())),
+        "parity": parity,
+    }, ensure_ascii=False))
+    return 0 if parity else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""
+Benchmark: Spot rate lookup, per-click Yahoo request vs. shared FX service
+
+The pages used to call Yahoo Finance synchronously on every "Get Spot Rate"
+click, one ticker per request. FxRateService downloads all pairs in one
+batched call in the background and serves the cached rate instantly, keeping
+the last known value when the provider fails. This script uses the local
+StubFxProvider with a simulated network delay and reports:
+
+    before_ms - median click latency with one blocking provider call per click
+    after_ms  - median click latency reading the shared service
+    provider_calls - upstream calls needed for all clicks (before vs. after)
+
+and checks that the service keeps serving the last rates while offline.
+
+--history benchmarks the FX history store (master_data.FxHistory) instead:
+repricing N (currency, doc_date) rows by scanning the rate table per row
+(before) vs. one vectorized as-of call (after), with a parity check.
+
+Usage:
+    python bench_fx_rates.py                     # 250 ms upstream, 50 clicks
+    python bench_fx_rates.py --delay 0.5 --clicks 20
+    python bench_fx_rates.py --history --rows 100000 --years 10
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from fx_rates import FxRateService, StubFxProvider, DEFAULT_STUB_RATES
+from master_data import FxHistory
+
+
+def build_history(years: int, seed: int = 3) -> list:
+    """Business-day fixings for the stub currencies (random walk around the stub rates)."""
+    rng = np.random.default_rng(seed)
+    days = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=years * 260)
+    rows = []
+    for currency, base in DEFAULT_STUB_RATES.items():
+        rates = base * np.exp(np.cumsum(rng.normal(0, 0.004, len(days))))
+        rows += [{"currency": currency, "rate_date": str(d.date()), "rate": round(float(r), 6)}
+                 for d, r in zip(days, rates)]
+    return rows
+
+
+def run_history(args) -> int:
+    rows = build_history(args.years)
+    history = FxHistory(rows)
+    rng = np.random.default_rng(7)
+    currencies = rng.choice(list(DEFAULT_STUB_RATES) + ["THB"], args.rows)
+    dates = pd.Timestamp.today().normalize() - pd.to_timedelta(rng.integers(0, args.years * 365, args.rows), unit="D")
+
+    # Before: filter the rate table for every row (sample, extrapolated)
+    table = pd.DataFrame(rows)
+    table["rate_date"] = pd.to_datetime(table["rate_date"])
+    sample = min(args.rows, 500)
+    start = time.perf_counter()
+    expected = []
+    for currency, day in zip(currencies[:sample], dates[:sample]):
+        match = table[(table["currency"] == currency) & (table["rate_date"] <= day)]
+        expected.append(1.0 if currency == "THB" else (match["rate"].iloc[-1] if len(match) else np.nan))
+    before_ms = (time.perf_counter() - start) * 1000 * args.rows / sample
+
+    start = time.perf_counter()
+    rates = history.rates_as_of(currencies, dates)
+    after_ms = (time.perf_counter() - start) * 1000
+
+    parity = bool(np.allclose(rates[:sample], expected, equal_nan=True))
+    print(json.dumps({
+        "fixings": len(history), "rows": args.rows, "before_ms": round(before_ms, 1), "after_ms": round(after_ms, 1),
+        "speedup": round(before_ms / after_ms) if after_ms else None, "parity": parity,
+    }))
+    return 0 if parity else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--delay", type=float, default=0.25, help="Simulated provider latency (seconds)")
+    parser.add_argument("--clicks", type=int, default=50)
+    parser.add_argument("--history", action="store_true", help="Benchmark as-of lookups on the FX history")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--years", type=int, default=10)
+    args = parser.parse_args()
+    if args.history:
+        return run_history(args)
+    currencies = list(DEFAULT_STUB_RATES)
+
+    # Before: every click is a blocking single-pair request
+    provider = StubFxProvider(delay=args.delay)
+    before = []
+    for i in range(args.clicks):
+        start = time.perf_counter()
+        provider.fetch([currencies[i % len(currencies)]])
+        before.append((time.perf_counter() - start) * 1000)
+    before_calls = provider.calls
+
+    # After: one batched background download, clicks read the shared store
+    provider = StubFxProvider(delay=args.delay)
+    service = FxRateService(provider, currencies)
+    service.refresh_in_background()
+    service.wait()
+    after = []
+    for i in range(args.clicks):
+        start = time.perf_counter()
+        quote = service.quote(currencies[i % len(currencies)])
+        after.append((time.perf_counter() - start) * 1000)
+        assert quote["rate"] == DEFAULT_STUB_RATES[quote["currency"]]
+    after_calls = provider.calls
+
+    # Offline: a failed refresh keeps the last known rates
+    provider.fail = True
+    stats = service.refresh()
+    offline_ok = stats["error"] is not None and all(
+        service.rate(c) == DEFAULT_STUB_RATES[c] for c in currencies
+    )
+
+    before_ms, after_ms = statistics.median(before), statistics.median(after)
+    print(json.dumps({
+        "currencies": len(currencies), "clicks": args.clicks,
+        "before_ms": round(before_ms, 2), "after_ms": round(after_ms, 4),
+        "speedup": round(before_ms / after_ms) if after_ms else None,
+        "provider_calls": {"before": before_calls, "after": after_calls},
+        "offline_fallback": offline_ok,
+    }))
+    return 0 if offline_ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""
+Benchmark: port spatial lookups, per-port Python loops vs. PortGeoIndex
+
+Distances and "ports near here" used to mean looping over every row of
+master_ports and computing one haversine at a time. port_geo.PortGeoIndex
+keeps the coordinates as NumPy arrays (unit vectors plus a latitude-sorted
+order). For Master/Master Port.csv this script reports, per query type:
+
+    before_ms - Python loop over all ports (math.* haversine per row)
+    after_ms  - the index (batched k-nearest, latitude-band radius, distance matrix)
+    parity    - identical results (kNN positions / radius counts / km within 1e-6)
+
+Usage:
+    python bench_port_geo.py
+    python bench_port_geo.py --queries 200 --k 10 --radius 500
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from port_geo import EARTH_RADIUS_KM, PortGeoIndex, DEFAULT_ORIGIN_PORT
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PORT_FILE = os.path.join(HERE, "Master", "Master Port.csv")
+
+
+def load_ports() -> list:
+    df = pd.read_csv(PORT_FILE, usecols=["Main Port Name", "Country Code", "Latitude", "Longitude"])
+    df = df.map(lambda v: v.strip() if isinstance(v, str) else v).replace("", None)
+    df.columns = ["main_port_name", "country_code", "latitude", "longitude"]
+    return df.to_dict("records")
+
+
+def loop_km(lat1, lon1, lat2, lon2) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(max(a, 0.0), 1.0)))
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=100, help="Random query points")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--radius", type=float, default=300.0, help="Radius query in km")
+    args = parser.parse_args()
+
+    index, build_ms = timed(lambda: PortGeoIndex(load_ports()))
+    coords = list(zip(index.lat.tolist(), index.lon.tolist()))
+    rng = np.random.default_rng(11)
+    picks = rng.integers(0, len(index), args.queries)
+    lats = index.lat[picks] + rng.normal(0, 0.5, args.queries)
+    lons = index.lon[picks] + rng.normal(0, 0.5, args.queries)
+
+    def loop_nearest():
+        out = []
+        for lat, lon in zip(lats, lons):
+            km = [loop_km(lat, lon, plat, plon) for plat, plon in coords]
+            out.append(sorted(range(len(km)), key=km.__getitem__)[:args.k])
+        return out
+
+    def loop_within():
+        return [sum(loop_km(lat, lon, plat, plon) <= args.radius for plat, plon in coords)
+                for lat, lon in zip(lats, lons)]
+
+    before_knn, before_knn_ms = timed(loop_nearest)
+    (after_knn, _), after_knn_ms = timed(lambda: index.nearest_many(lats, lons, args.k))
+    # Ties (ports sharing coordinates) may come back in either order: compare the sets
+    knn_parity = all(set(a) == set(b) for a, b in zip(after_knn.tolist(), before_knn))
+
+    before_within, before_within_ms = timed(loop_within)
+    after_within, after_within_ms = timed(lambda: [len(index.within(lat, lon, args.radius))
+                                                   for lat, lon in zip(lats, lons)])
+    within_parity = after_within == before_within
+
+    destinations = [index.labels[i] for i in rng.integers(0, len(index), args.queries)]
+    origin = index.locate(DEFAULT_ORIGIN_PORT)
+    before_row, before_matrix_ms = timed(lambda: [loop_km(*origin, *index.locate(d)) for d in destinations])
+    after_row, after_matrix_ms = timed(lambda: index.distance_matrix([DEFAULT_ORIGIN_PORT], destinations)[0])
+    matrix_parity = bool(np.allclose(after_row, before_row, atol=1e-6))
+
+    parity = knn_parity and within_parity and matrix_parity
+    print(json.dumps({
+        "ports": len(index), "queries": args.queries, "build_ms": round(build_ms, 1),
+        "nearest": {"before_ms": round(before_knn_ms, 1), "after_ms": round(after_knn_ms, 2), "parity": knn_parity},
+        "within": {"before_ms": round(before_within_ms, 1), "after_ms": round(after_within_ms, 2),
+                   "parity": within_parity},
+        "distances": {"before_ms": round(before_matrix_ms, 2), "after_ms": round(after_matrix_ms, 2),
+                      "parity": matrix_parity},
+        "example": {"from": DEFAULT_ORIGIN_PORT, "nearest": index.nearest(*origin, k=3)},
+    }))
+    return 0 if parity else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
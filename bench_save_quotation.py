@@ -0,0 +1,156 @@
+"""
+Benchmark: save_quotation multi-request path vs. single RPC (save_quotation_full),
+and one-by-one saves vs. save_quotations (chunked save_quotations_bulk)
+
+Usage:
+    python bench_save_quotation.py                 # simulated network (default 40 ms RTT)
+    python bench_save_quotation.py --rtt-ms 80     # simulated network, custom RTT
+    python bench_save_quotation.py --bulk 1000     # quotations/sec: 1,000 one-by-one vs. bulk
+    python bench_save_quotation.py --live          # real Supabase from .env (writes BENCH-* rows, then deletes them)
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+import uuid
+
+import httpx
+from postgrest import SyncPostgrestClient
+
+import supabase_client
+
+
+def build_sample_quotation(doc_no: str, n_lines: int = 15) -> dict:
+    """Build a quotation payload shaped like the Cost Sheet Editor output."""
+    return {
+        "general_info": {
+            "doc_no": doc_no, "doc_date": "2026-02-12", "trader_name": "Bench", "team": "A1",
+            "customer_importer": "C001", "customer_end_user": "", "incoterm": "FOB",
+            "ship_date_from": "2026-02-12", "ship_date_to": "2026-05-30", "currency": "USD",
+            "spot_rate": 34.0, "discount_rate": 0.0, "premium_rate": 0.5, "exchange_rate": 34.5,
+            "dest_1": "Singapore", "dest_2": "", "dest_3": "", "dest_4": ""
+        },
+        "export_expenses": {
+            "container_size": '20"', "container_qty": 1, "invoice_qty": 1, "ton_per_container": 25.0,
+            "freight_cost": 0.0, "shipping_cost": 1400.0, "truck_cost": 8300.0, "thc_cost": 2800.0
+        },
+        "interests": {
+            "payment_term_auto": "N/A", "payment_term_ship": "CASH", "ar_rate": 2.4, "ar_days": 30,
+            "rm_rate": 2.5, "rm_days": 30, "wh_days": 30
+        },
+        "production_costs": [
+            {"item_order": i + 1, "product_name": f"Product {i + 1}", "product_rm": "HM 1",
+             "quantity": 10.0, "total_cost": 500.0, "selling_price": 550.0, "status": "Draft"}
+            for i in range(n_lines)
+        ],
+        "loadings": [
+            {"order_no": i + 1, "product_name": f"Product {i + 1}", "qty_cartons": 100}
+            for i in range(n_lines)
+        ],
+        "remarks": [{"order_no": 1, "remark_text": "Benchmark"}],
+    }
+
+
+def make_simulated_client(rtt_ms: float, counter: dict) -> SyncPostgrestClient:
+    """PostgREST client backed by a fake transport that sleeps one RTT per request."""
+    def handler(request: httpx.Request) -> httpx.Response:
+        counter["requests"] += 1
+        time.sleep(rtt_ms / 1000.0)
+        if request.url.path.endswith("/rpc/save_quotation_full"):
+            return httpx.Response(200, json=str(uuid.uuid4()))
+        if request.url.path.endswith("/rpc/save_quotations_bulk"):
+            items = json.loads(request.content)["p_items"]
+            return httpx.Response(200, json=[
+                {"doc_no": item["general_info"]["doc_no"], "quotation_id": str(uuid.uuid4())} for item in items
+            ])
+        if request.method == "POST" and request.url.path.endswith("/trx_general_infos"):
+            return httpx.Response(201, json=[{"id": str(uuid.uuid4())}])
+        return httpx.Response(200, json=[])
+
+    rest_url = "http://bench.local/rest/v1"
+    http_client = httpx.Client(base_url=rest_url, transport=httpx.MockTransport(handler))
+    return SyncPostgrestClient(rest_url, http_client=http_client)
+
+
+def run(label: str, save_fn, make_payload, iterations: int, counter: dict) -> dict:
+    timings = []
+    counter["requests"] = 0
+    for i in range(iterations):
+        payload = make_payload(i)
+        start = time.perf_counter()
+        save_fn(payload)
+        timings.append((time.perf_counter() - start) * 1000)
+    result = {
+        "path": label,
+        "iterations": iterations,
+        "requests_per_save": counter["requests"] / iterations if counter["requests"] else None,
+        "mean_ms": round(statistics.mean(timings), 1),
+        "p50_ms": round(statistics.median(timings), 1),
+        "max_ms": round(max(timings), 1),
+    }
+    print(json.dumps(result))
+    return result
+
+
+def run_bulk(count: int, lines: int, chunk_size: int, run_id: str, counter: dict):
+    """Throughput (quotations/sec) of one RPC per quotation vs. save_quotations()."""
+    payloads = [build_sample_quotation(f"BENCH-{run_id}-S{i:05d}", lines) for i in range(count)]
+    counter["requests"] = 0
+    start = time.perf_counter()
+    for payload in payloads:
+        supabase_client.save_quotation_rpc(payload)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({"path": "one by one (save_quotation_full)", "quotations": count,
+                      "requests": counter["requests"], "elapsed_s": round(elapsed, 3),
+                      "quotations_per_sec": round(count / elapsed, 1)}))
+
+    payloads = [build_sample_quotation(f"BENCH-{run_id}-B{i:05d}", lines) for i in range(count)]
+    counter["requests"] = 0
+    summary = supabase_client.save_quotations(payloads, chunk_size=chunk_size)
+    print(json.dumps({"path": f"bulk (save_quotations_bulk, chunk {chunk_size})", "quotations": count,
+                      "requests": counter["requests"], "saved": summary["saved"], "failed": summary["failed"],
+                      "elapsed_s": summary["elapsed_s"], "quotations_per_sec": summary["quotations_per_sec"]}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--live", action="store_true", help="Benchmark against the real Supabase project")
+    parser.add_argument("--rtt-ms", type=float, default=40.0, help="Simulated round-trip time per request")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--lines", type=int, default=15, help="Production cost lines per quotation")
+    parser.add_argument("--bulk", type=int, metavar="N", help="Compare saving N quotations one by one vs. in bulk")
+    parser.add_argument("--chunk-size", type=int, default=supabase_client.BULK_SAVE_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    counter = {"requests": 0}
+    if args.live:
+        client = supabase_client.get_postgrest_client()
+    else:
+        client = make_simulated_client(args.rtt_ms, counter)
+        supabase_client.get_postgrest_client = lambda: client
+
+    run_id = uuid.uuid4().hex[:6]
+    if args.bulk:
+        run_bulk(args.bulk, args.lines, args.chunk_size, run_id, counter)
+        if args.live:
+            client.from_("trx_general_infos").delete().like("doc_no", f"BENCH-{run_id}-%").execute()
+        return 0
+
+    legacy = run("legacy (multi-request)", supabase_client.save_quotation_legacy,
+                 lambda i: build_sample_quotation(f"BENCH-{run_id}-L{i:03d}", args.lines), args.iterations, counter)
+    rpc = run("rpc (save_quotation_full)", supabase_client.save_quotation_rpc,
+              lambda i: build_sample_quotation(f"BENCH-{run_id}-R{i:03d}", args.lines), args.iterations, counter)
+
+    if legacy["mean_ms"] > 0:
+        print(f"Latency drop: {legacy['mean_ms']:.1f} ms -> {rpc['mean_ms']:.1f} ms "
+              f"({(1 - rpc['mean_ms'] / legacy['mean_ms']) * 100:.0f}% faster)")
+
+    if args.live:
+        # Clean up benchmark rows (details cascade)
+        client.from_("trx_general_infos").delete().like("doc_no", f"BENCH-{run_id}-%").execute()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
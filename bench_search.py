@@ -0,0 +1,94 @@
+"""
+Benchmark: master-data pickers, full option lists vs. search indexes
+
+The four Destination selectboxes used to send every "[Country] Port" label
+(~3,800 from Master/Master Port.csv) to the browser on each rerun, and the
+three customer pickers every "[CODE] NAME" label (~2,100 from
+Master Customer.xlsx). They now query search_index.PortSearchIndex /
+CustomerSearchIndex and send only the top-k matches. For each master file
+this script builds the index and reports:
+
+    build_ms        - one-off index build (once per master-data snapshot)
+    before_us       - a linear case-insensitive substring scan over all labels
+    after_us        - median index query (prefix + trigram ranking)
+    options_sent    - selectbox options per rerun for the pickers (before vs. after)
+
+Usage:
+    python bench_search.py
+    python bench_search.py --k 10 --runs 200
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import pandas as pd
+
+from search_index import CustomerSearchIndex, PortSearchIndex
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PORT_FILE = os.path.join(HERE, "Master", "Master Port.csv")
+CUSTOMER_FILE = os.path.join(HERE, "Master Customer.xlsx")
+PORT_QUERIES = ("bangkok", "laem ch", "THBKK", "roterdam", "yokohama", "santos", "jebel", "thailand", "hamb", "ho chi")
+CUSTOMER_QUERIES = ("cpf eruope", "1500004", "yangon", "merchandizing", "c.p. seeds vietnam", "VN", "poland", "foods")
+
+
+def load_ports() -> list:
+    df = pd.read_csv(PORT_FILE, usecols=["Main Port Name", "Alternate Port Name", "UN/LOCODE", "Country Code"])
+    df = df.map(lambda v: v.strip() if isinstance(v, str) else v).replace("", None)
+    df.columns = ["main_port_name", "alternate_port_name", "un_locode", "country_code"]
+    return df.to_dict("records")
+
+
+def load_customers() -> list:
+    df = pd.read_excel(CUSTOMER_FILE, usecols=["CUSTOMER_CODE", "CUSTOMER_NAME", "COUNTRY"])
+    df.columns = ["customer_code", "customer_name", "country"]
+    return df.to_dict("records")
+
+
+def median_us(fn, queries, runs: int) -> float:
+    samples = []
+    for _ in range(runs):
+        for q in queries:
+            start = time.perf_counter()
+            fn(q)
+            samples.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=20, help="Matches sent to each picker")
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+
+    pickers = (
+        ("ports", PortSearchIndex, load_ports, PORT_QUERIES, 4),
+        ("customers", CustomerSearchIndex, load_customers, CUSTOMER_QUERIES, 3),
+    )
+    for name, index_cls, load, queries, widgets in pickers:
+        rows = load()
+        start = time.perf_counter()
+        index = index_cls(rows)
+        build_ms = (time.perf_counter() - start) * 1000
+        labels = index.labels
+
+        def scan(query):
+            q = query.lower()
+            return [label for label in labels if q in label.lower()][:args.k]
+
+        print(json.dumps({
+            "picker": name, "documents": len(index), "build_ms": round(build_ms, 1),
+            "before_us": round(median_us(scan, queries, args.runs), 1),
+            "after_us": round(median_us(lambda q: index.search(q, args.k), queries, args.runs), 1),
+            "options_sent": {"before": widgets * (len(labels) + 1), "after": widgets * (args.k + 1)},
+            "examples": {q: index.search(q, 3) for q in queries[:4]},
+        }, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,358 @@
+"""
+Costing Engine Module for Quotation App
+Computes the Master Calculator cost sheet (RM price -> margin after) for all
+line items at once with column-wise NumPy / pandas operations, so the editor,
+the legacy app and batch tooling share one implementation. The formulas form a
+dependency graph, so an open quotation is recomputed incrementally.
+"""
+
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from master_data import MasterData
+
+# Summary columns shown by pages/1_Cost_Sheet_Editor.py (interest / margin per unit)
+EDITOR_COLUMNS = (
+    "Item", "Product Name", "Product RM", "RM Price", "Group (0-6)", "Yield loss %",
+    "Yield loss", "BP", "RM Net Yield", "PACKAGING", "Brand", "Pack Size", "Overhead",
+    "Quantity", "Factory Expense", "Export Expense", "Commision", "A&P", "Agreement",
+    "Other Cost", "Total Cost", "Selling Price", "MarginCost (Unit)",
+    "AR Interest (Unit)", "RM Interest (Unit)", "WH Storage (Total)", "Margin After (Unit)",
+)
+
+# Summary columns shown by quotation_app.py (interest / margin as line totals)
+LEGACY_COLUMNS = EDITOR_COLUMNS[:-4] + (
+    "AR Interest (Total)", "RM Interest (Total)", "WH Storage (Total)", "Margin After (Total)",
+)
+
+def _column(lines: pd.DataFrame, name: str, default=0.0) -> np.ndarray:
+    """Input column as a NumPy array, or `default` everywhere when it is missing."""
+    if name in lines:
+        return lines[name].to_numpy()
+    return np.full(len(lines), default)
+
+
+def _is_blank(values: np.ndarray) -> np.ndarray:
+    """True where a text cell is empty (None / NaN / '')."""
+    return pd.isna(values) | (values == "")
+
+
+def _lookup(rates, keys: np.ndarray) -> np.ndarray:
+    """Map group numbers to master rates (0.0 for unknown groups)."""
+    if not rates:
+        return np.zeros(len(keys))
+    positions = pd.Index(list(rates)).get_indexer(keys)
+    values = np.append(np.fromiter(rates.values(), dtype=float, count=len(rates)), 0.0)
+    return values[positions]  # -1 (not found) picks the trailing 0.0
+
+
+def rm_price_date(doc_date):
+    """RM prices are matched on the first day of the document month ('%b.%y')."""
+    if isinstance(doc_date, str):
+        return datetime.strptime(doc_date, "%b.%y")
+    return date(doc_date.year, doc_date.month, 1)
+
+
+def reprice_quotations(quotations: pd.DataFrame, master: MasterData) -> pd.DataFrame:
+    """
+    Batch reporting: value saved quotations at the FX rate of their doc_date.
+    Expects currency, doc_date and optionally discount_rate / premium_rate / total_cost
+    columns; adds spot_rate_doc_date, ex_rate_doc_date and total_cost_thb (NaN = no history).
+    """
+    out = quotations.copy()
+    spot = master.fx_history.rates_as_of(out["currency"].to_numpy(dtype=object), out["doc_date"])
+
+    def number(name):
+        return pd.to_numeric(pd.Series(_column(out, name)), errors="coerce").fillna(0.0).to_numpy()
+
+    out["spot_rate_doc_date"] = spot
+    out["ex_rate_doc_date"] = spot - number("discount_rate") + number("premium_rate")
+    if "total_cost" in out.columns:
+        out["total_cost_thb"] = number("total_cost") * out["ex_rate_doc_date"].to_numpy()
+    return out
+
+
+# --- Cost model as a dependency graph ---
+# Line inputs: node name -> (editor column, default when the column is missing)
+LINE_INPUTS = {
+    "item": ("Item", None), "product": ("Product Name", ""), "rm": ("Product RM", ""),
+    "group": ("Group", 0), "packaging": ("PACKAGING", 0.0), "brand": ("Brand", ""),
+    "pack_size": ("Pack Size", ""), "qty": ("Quantity", 0.0), "commission": ("Commision", 0.0),
+    "ap": ("A&P", 0.0), "agreement": ("Agreement", 0.0), "other_cost": ("Other Cost", 0.0),
+    "selling": ("Selling Price", 0.0),
+}
+
+# Quotation-level inputs (the master snapshot is one too, so a refresh invalidates lookups)
+PARAMS = ("master", "doc_date", "ex_rate", "export_expense_total", "insurance_rate",
+          "factory_expense_rate", "ar_rate", "ar_days", "rm_rate", "rm_days", "wh_days")
+
+
+def _float(values):
+    return values.astype(float)
+
+
+def _margin_after(margin_cost, ar_int, rm_int, wh_storage):
+    # Excel subtracts the TOTAL storage from the UNIT margin - kept as-is
+    return margin_cost - ar_int - rm_int - wh_storage
+
+
+# Derived nodes in dependency order: (name, kind, deps, fn).
+# kind "row": one value per line, recomputed only for invalidated lines;
+# "scalar": one value per quotation; "sum": scalar aggregated over every line.
+NODES = (
+    ("keep", "row", ("qty", "product", "rm"),  # empty rows (no qty, name or RM) are skipped
+     lambda qty, product, rm: ~((qty <= 0) & _is_blank(product) & _is_blank(rm))),
+    ("to_unit", "scalar", ("ex_rate",),  # THB/kg -> currency/ton
+     lambda ex_rate: (1000 / ex_rate) if ex_rate > 0 else 1000),
+    ("total_qty_all", "sum", ("qty",), lambda qty: np.nansum(_float(qty))),
+    # 1. RM price (as-of lookup on the master RM series) & conversion
+    ("rm_date", "scalar", ("doc_date",), rm_price_date),
+    ("rm_base", "row", ("master", "rm", "rm_date"),
+     lambda master, rm, rm_date: master.rm_prices.prices_as_of(rm, rm_date)),
+    ("rm_price", "row", ("rm_base", "to_unit"), lambda rm_base, to_unit: rm_base * to_unit),
+    # 2-4. Yield loss, BP, RM net yield
+    ("oh_rate", "row", ("master", "group"), lambda master, group: _lookup(master.overhead_rates, group)),
+    ("y_loss_pct", "row", ("master", "group"), lambda master, group: _lookup(master.yield_loss_rates, group)),
+    ("yield_loss", "row", ("rm_price", "y_loss_pct"),
+     lambda rm_price, pct: np.where(pct > 0, rm_price / np.where(pct > 0, pct, 1.0), rm_price)),
+    ("bp", "row", ("yield_loss", "rm_price"), lambda yield_loss, rm_price: (yield_loss - rm_price) / 3),
+    ("rm_net_yield", "row", ("yield_loss", "bp"), lambda yield_loss, bp: yield_loss - bp),
+    # 5. Overhead / factory expense (master rates converted per unit)
+    ("overhead", "row", ("oh_rate", "to_unit"), lambda oh_rate, to_unit: oh_rate * to_unit),
+    ("factory_expense", "scalar", ("factory_expense_rate", "to_unit"), lambda rate, to_unit: rate * to_unit),
+    # 6. Export expense per unit: combined THB (incl. insurance on the selling value) / total qty / exchange rate
+    ("total_selling", "sum", ("selling", "qty"), lambda selling, qty: np.nansum(_float(selling) * _float(qty))),
+    ("insurance", "scalar", ("total_selling", "ex_rate", "insurance_rate"),
+     lambda total_selling, ex_rate, rate: total_selling * ex_rate * rate),
+    ("export_total", "scalar", ("export_expense_total", "insurance"), lambda total, insurance: total + insurance),
+    ("unit_export", "scalar", ("export_total", "total_qty_all", "ex_rate"),
+     lambda total, qty_all, ex_rate: ((total / qty_all) / ex_rate) if qty_all > 0 and ex_rate > 0 else 0.0),
+    # 7-8. Total cost & margin
+    ("total_cost", "row", ("rm_net_yield", "packaging", "overhead", "factory_expense", "unit_export",
+                           "commission", "ap", "agreement", "other_cost"),
+     lambda net, pkg, oh, factory, export, comm, ap, agree, other: (
+         net + _float(pkg) + oh + factory + export + _float(comm) + _float(ap) + _float(agree) + _float(other))),
+    ("margin_cost", "row", ("selling", "total_cost"), lambda selling, total_cost: _float(selling) - total_cost),
+    # 9-11. Interests (per unit), WH storage (lot total) and margin after
+    ("ar_int", "row", ("selling", "ar_rate", "ar_days"),
+     lambda selling, rate, days: (_float(selling) * (rate / 100) / 365) * days if days > 0 else np.zeros(len(selling))),
+    ("rm_int", "row", ("selling", "rm_rate", "rm_days"),
+     lambda selling, rate, days: (_float(selling) * (rate / 100) / 365) * days if days > 0 else np.zeros(len(selling))),
+    ("wh_storage", "row", ("qty", "wh_days", "ex_rate"),
+     lambda qty, days, ex_rate: (np.where(_float(qty) > 0, (days * _float(qty) * 1.0) / ex_rate, 0.0)
+                                 if ex_rate > 0 else np.zeros(len(qty)))),
+    ("margin_after", "row", ("margin_cost", "ar_int", "rm_int", "wh_storage"), _margin_after),
+    ("ar_int_total", "row", ("ar_int", "qty"), lambda ar_int, qty: ar_int * _float(qty)),
+    ("rm_int_total", "row", ("rm_int", "qty"), lambda rm_int, qty: rm_int * _float(qty)),
+    ("margin_after_total", "row", ("margin_after", "qty"), lambda margin_after, qty: margin_after * _float(qty)),
+)
+
+# Summary column -> node (computed columns are rounded to 2 decimals, inputs pass through)
+COMPUTED_COLUMNS = {
+    "RM Price": "rm_price", "Yield loss": "yield_loss", "BP": "bp", "RM Net Yield": "rm_net_yield",
+    "Overhead": "overhead", "Factory Expense": "factory_expense", "Export Expense": "unit_export",
+    "Total Cost": "total_cost", "MarginCost (Unit)": "margin_cost",
+    "AR Interest (Unit)": "ar_int", "RM Interest (Unit)": "rm_int",
+    "AR Interest (Total)": "ar_int_total", "RM Interest (Total)": "rm_int_total",
+    "WH Storage (Total)": "wh_storage", "Margin After (Unit)": "margin_after",
+    "Margin After (Total)": "margin_after_total",
+}
+PASSTHROUGH_COLUMNS = {
+    "Group (0-6)": "group", "Yield loss %": "y_loss_pct",
+    **{column: name for name, (column, _) in LINE_INPUTS.items()},
+}
+
+_SCALARS = frozenset(PARAMS) | {name for name, kind, _, _ in NODES if kind != "row"}
+_ALL = slice(None)  # dirty marker: every line
+
+
+def _same(old, new) -> bool:
+    try:
+        return bool(old is new or old == new)
+    except (TypeError, ValueError):
+        return False
+
+
+def _changed_rows(old: np.ndarray, new: np.ndarray) -> np.ndarray:
+    """Positions where two equal-length arrays differ (NaN == NaN)."""
+    rows = np.flatnonzero(old != new)
+    return rows[~(pd.isna(old[rows]) & pd.isna(new[rows]))]
+
+
+class CostSheetModel:
+    """
+    Cost sheet of one quotation kept as a dependency graph (see NODES).
+    update() diffs its inputs against the previous call and recomputes only
+    the invalidated nodes, and for per-line nodes only the invalidated lines:
+    editing one line's A&P recomputes that line's total cost / margins, while
+    a new exchange rate recomputes every line. Keep one instance per quotation
+    (e.g. in session_state) to reuse the memoized intermediate values.
+    """
+
+    def __init__(self, columns=EDITOR_COLUMNS):
+        self.columns = tuple(columns)
+        self.values = {}        # node name -> scalar, or array with one value per line
+        self.last_update = {}   # {"nodes": recomputed nodes, "line_evals": per-line values computed}
+
+    def value(self, name):
+        """Current value of a node, e.g. "insurance" or "total_qty_all"."""
+        return self.values[name]
+
+    def update(self, lines: pd.DataFrame, master: MasterData, doc_date, ex_rate: float,
+               export_expense_total: float = 0.0, insurance_rate: float = 0.0,
+               factory_expense_rate: float = 0.0, ar_rate: float = 0.0, ar_days: float = 0.0,
+               rm_rate: float = 0.0, rm_days: float = 0.0, wh_days: float = 30) -> pd.DataFrame:
+        """Same inputs / result as compute_cost_sheet, recomputing only what changed."""
+        params = {
+            "master": master, "doc_date": doc_date, "ex_rate": ex_rate,
+            "export_expense_total": export_expense_total, "insurance_rate": insurance_rate,
+            "factory_expense_rate": factory_expense_rate, "ar_rate": ar_rate, "ar_days": ar_days,
+            "rm_rate": rm_rate, "rm_days": rm_days, "wh_days": wh_days,
+        }
+        # Copies, so later in-place edits of `lines` cannot hide a change from the next diff
+        inputs = {name: np.array(_column(lines, column, default)) for name, (column, default) in LINE_INPUTS.items()}
+        # A different line count (or the first call) rebuilds everything
+        rebuild = not self.values or len(lines) != len(self.values["qty"])
+
+        dirty = {}  # node -> _ALL or positions of the invalidated lines
+        for name, value in params.items():
+            if rebuild or not _same(self.values[name], value):
+                self.values[name] = value
+                dirty[name] = _ALL
+        for name, value in inputs.items():
+            rows = _ALL if rebuild else _changed_rows(self.values[name], value)
+            if rebuild or rows.size:
+                self.values[name] = value
+                dirty[name] = rows
+
+        nodes, line_evals = 0, 0
+        for name, kind, deps, fn in NODES:
+            invalid = [dirty[dep] for dep in deps if dep in dirty]
+            if not invalid:
+                continue
+            nodes += 1
+            if kind != "row":
+                value = fn(*(self.values[dep] for dep in deps))
+                if rebuild or not _same(self.values[name], value):
+                    self.values[name] = value
+                    dirty[name] = _ALL
+                continue
+
+            rows = _ALL if any(r is _ALL for r in invalid) else np.unique(np.concatenate(invalid))
+            args = [self.values[dep] if dep in _SCALARS else self.values[dep][rows] for dep in deps]
+            new = np.asarray(fn(*args))
+            line_evals += len(new)
+            if rows is _ALL:
+                self.values[name] = new
+            else:
+                # Only lines whose value actually changed invalidate the dependents
+                old = self.values[name]
+                changed = _changed_rows(old[rows], new)
+                old[rows] = new
+                rows = rows[changed]
+            if rows is _ALL or rows.size:
+                dirty[name] = rows
+
+        self.last_update = {"nodes": nodes, "line_evals": line_evals}
+        return self._frame(lines)
+
+    def _frame(self, lines: pd.DataFrame) -> pd.DataFrame:
+        keep = self.values["keep"]
+        n = int(keep.sum())
+        out = {}
+        for column in self.columns:
+            if column in COMPUTED_COLUMNS:
+                value = self.values[COMPUTED_COLUMNS[column]]
+                out[column] = np.round(value[keep] if np.ndim(value) else np.full(n, value), 2)
+            elif column in lines:
+                # Input columns keep their dtype (no re-inference of text columns)
+                out[column] = lines[column].array[keep]
+            else:
+                out[column] = self.values[PASSTHROUGH_COLUMNS[column]][keep]
+        return pd.DataFrame(out)
+
+
+# Per-destination views of the same cost sheet (line x destination)
+MATRIX_MEASURES = {"Total Cost": "total_cost", "MarginCost (Unit)": "margin_cost", "Margin After (Unit)": "margin_after"}
+
+
+def destination_matrix(model: CostSheetModel, destinations, freight, insurance_rates,
+                       base_freight: float = 0.0) -> pd.DataFrame:
+    """
+    Cost / margin of every kept line at every destination, from an updated model in one pass.
+
+    destinations: column labels (one per destination, unique)
+    freight: freight THB per destination, replacing `base_freight` (part of export_expense_total)
+    insurance_rates: insurance multiplier per destination (see CostSheetModel insurance_rate)
+    Only the export expense per unit differs between destinations, so it is computed as one
+    vector and broadcast against the lines' cost excluding export expense.
+    Returns a pivot: index (Item, Product Name), columns (measure, destination), 2 decimals.
+    """
+    v = model.values
+    keep = v["keep"]
+    freight = np.asarray(freight, dtype=float)
+    insurance_rates = np.asarray(insurance_rates, dtype=float)
+    ex_rate, qty_all = v["ex_rate"], v["total_qty_all"]
+
+    export_total = (v["export_expense_total"] - base_freight + freight
+                    + v["total_selling"] * ex_rate * insurance_rates)
+    unit_export = (export_total / qty_all) / ex_rate if qty_all > 0 and ex_rate > 0 else np.zeros(len(freight))
+    shift = unit_export[None, :] - v["unit_export"]  # (1, destinations)
+
+    total_cost = (v["total_cost"][keep])[:, None] + shift
+    values = {
+        "total_cost": total_cost,
+        "margin_cost": _float(v["selling"][keep])[:, None] - total_cost,
+        "margin_after": (v["margin_after"][keep])[:, None] - shift,
+    }
+    columns = pd.MultiIndex.from_product([list(MATRIX_MEASURES), list(destinations)])
+    index = pd.MultiIndex.from_arrays([v["item"][keep], v["product"][keep]], names=["Item", "Product Name"])
+    data = np.hstack([values[node] for node in MATRIX_MEASURES.values()])
+    return pd.DataFrame(np.round(data, 2), index=index, columns=columns)
+
+
+def pack_destination_matrix(matrix: pd.DataFrame, freight, insurance_rates) -> dict:
+    """
+    Compact, column-oriented form of a destination_matrix() for saving with the quotation:
+    {"destinations": [...], "freight": [...], "insurance_rate": [...], "items": [...],
+     "total_cost": [[per destination] per line], "margin_cost": [[...]], "margin_after": [[...]]}
+    """
+    destinations = list(matrix.columns.get_level_values(1).unique())
+    packed = {
+        "destinations": destinations,
+        "freight": [round(float(f), 2) for f in freight],
+        "insurance_rate": [float(r) for r in insurance_rates],
+        "items": [_json_item(item) for item in matrix.index.get_level_values("Item")],
+    }
+    for column, node in MATRIX_MEASURES.items():
+        packed[node] = matrix[column].to_numpy(dtype=float).round(2).tolist()
+    return packed
+
+
+def _json_item(item):
+    return None if pd.isna(item) else item.item() if isinstance(item, np.generic) else item
+
+
+def compute_cost_sheet(lines: pd.DataFrame, master: MasterData, doc_date, ex_rate: float,
+                       export_expense_total: float = 0.0, factory_expense_rate: float = 0.0,
+                       ar_rate: float = 0.0, ar_days: float = 0.0,
+                       rm_rate: float = 0.0, rm_days: float = 0.0, wh_days: float = 30,
+                       columns=EDITOR_COLUMNS, insurance_rate: float = 0.0) -> pd.DataFrame:
+    """
+    Cost sheet for every non-empty line of the products table (one-off CostSheetModel run).
+
+    lines: editor frame (Item, Product Name, Product RM, Group, PACKAGING, Brand,
+           Pack Size, Quantity, Commision, A&P, Agreement, Other Cost, Selling Price)
+    doc_date: document date (RM prices as of the 1st of its month) or a 'Feb.26' string
+    export_expense_total: all export expenses combined (THB), spread per unit over total qty
+    insurance_rate: insurance multiplier on the selling value in THB, added to the export expenses
+    factory_expense_rate: THB/kg rate from master_factory_expense
+    Returns one row per kept line (index reset), restricted to `columns`.
+    """
+    return CostSheetModel(columns).update(
+        lines, master, doc_date, ex_rate, export_expense_total=export_expense_total,
+        insurance_rate=insurance_rate, factory_expense_rate=factory_expense_rate,
+        ar_rate=ar_rate, ar_days=ar_days, rm_rate=rm_rate, rm_days=rm_days, wh_days=wh_days,
+    )
@@ -0,0 +1,143 @@
+"""
+Export Expense Module for Quotation App
+Table-driven export expenses (master_export_expense): every expense line has
+a driver (per container, per invoice or per ton) and a dated rate. All lines
+are priced at once as a rate vector times the driver vector, and any number
+of container / invoice scenarios as one matrix product.
+"""
+
+import numpy as np
+import pandas as pd
+
+DRIVERS = ("container", "invoice", "ton")
+DRIVER_UNITS = {"container": "ตู้", "invoice": "Inv", "ton": "Ton"}
+
+# Standard rates (Master/MasterExportExpense.xlsx), used while master_export_expense is empty.
+# line_code is the trx_export_expenses column the amount is saved in.
+DEFAULT_EXPORT_EXPENSES = (
+    {"line_code": "truck_cost", "expense_group": "Shipping & Transport",
+     "description": "ค่าขนย้าย-ส่งออก: หัวลาก/ผ่านท่า", "driver": "container", "rate": 8300.0},
+    {"line_code": "survey_check_cost", "expense_group": "Survey & Inspection",
+     "description": "ค่าตรวจสอบ + รมยา", "driver": "container", "rate": 1050.0},
+    {"line_code": "survey_vehicle_cost", "expense_group": "Survey & Inspection",
+     "description": "ค่าพาหนะไปรมยา", "driver": "invoice", "rate": 1350.0},
+    {"line_code": "thc_cost", "expense_group": "Port Charges (ค่าระวางส่งออก)",
+     "description": "THC ค่าดำเนินการในท่าเรือต้นทาง", "driver": "container", "rate": 2800.0},
+    {"line_code": "seal_cost", "expense_group": "Port Charges (ค่าระวางส่งออก)",
+     "description": "Seal ค่าอุปกรณ์ล๊อคประตูตู้", "driver": "container", "rate": 300.0},
+    {"line_code": "bl_fee", "expense_group": "Port Charges (ค่าระวางส่งออก)",
+     "description": "B/L Fee ค่าเอกสาร B/L", "driver": "invoice", "rate": 2000.0},
+    {"line_code": "handling_fee", "expense_group": "Port Charges (ค่าระวางส่งออก)",
+     "description": "Handling Charges ค่าดำเนินการ", "driver": "invoice", "rate": 1000.0},
+    {"line_code": "doc_prep_fee", "expense_group": "ค่าเอกสารส่งออก (Export Documents)",
+     "description": "ค่าจัดทำเอกสาร", "driver": "invoice", "rate": 5500.0},
+    {"line_code": "doc_agri_fee", "expense_group": "ค่าเอกสารส่งออก (Export Documents)",
+     "description": "ค่าพาหนะจนท.เกษตร", "driver": "invoice", "rate": 1000.0},
+    {"line_code": "doc_phyto_fee", "expense_group": "ค่าเอกสารส่งออก (Export Documents)",
+     "description": "ค่าป่วยการใบรับรองปลอดศัตรูพืช", "driver": "invoice", "rate": 200.0},
+    {"line_code": "doc_health_fee", "expense_group": "ค่าเอกสารส่งออก (Export Documents)",
+     "description": "HEALTH CERTIFICATE", "driver": "invoice", "rate": 300.0},
+    {"line_code": "doc_origin_fee", "expense_group": "ค่าเอกสารส่งออก (Export Documents)",
+     "description": "ค่าใบรับรองแหล่งกำเนิดสินค้า", "driver": "invoice", "rate": 208.0},
+    {"line_code": "doc_ms24_fee", "expense_group": "ค่าเอกสารส่งออก (Export Documents)",
+     "description": "ค่าแบบพิมพ์/ค่าธรรมเนียม มส.24", "driver": "invoice", "rate": 120.0},
+    {"line_code": "doc_chamber_fee", "expense_group": "ค่าเอกสารส่งออก (Export Documents)",
+     "description": "ค่าใบรับรองเอกสารสภาหอการค้า", "driver": "invoice", "rate": 230.0},
+    {"line_code": "doc_dft_fee", "expense_group": "ค่าเอกสารส่งออก (Export Documents)",
+     "description": "ค่าใบรับรองกรมการค้าต่างประเทศ", "driver": "invoice", "rate": 30.0},
+)
+
+# trx_export_expenses has one column per standard line; other lines are saved in expense_lines
+EXPORT_EXPENSE_COLUMNS = tuple(row["line_code"] for row in DEFAULT_EXPORT_EXPENSES)
+
+_DAY_BITS = 32  # composite key = line position << 32 | day (days biased to be non-negative)
+_DAY_BIAS = 1 << 31
+
+
+def driver_vector(container_qty, invoice_qty, ton_per_container) -> np.ndarray:
+    """
+    Driver quantities in DRIVERS order: containers, invoices, tons (containers x ton/container).
+    Scalars give shape (3,); equal-length arrays give one row per scenario, shape (n, 3).
+    """
+    containers, invoices, ton_per_container = np.broadcast_arrays(
+        *(np.asarray(v, dtype=float) for v in (container_qty, invoice_qty, ton_per_container)))
+    return np.stack((containers, invoices, containers * ton_per_container), axis=-1)
+
+
+class ExportExpenseSchedule:
+    """
+    Export expense lines with dated rates, from master_export_expense rows
+    (line_code, expense_group, description, driver, rate, effective_date, sort_order)
+    or DEFAULT_EXPORT_EXPENSES when there are none.
+    Rates are looked up as of a date: the latest effective_date on or before it,
+    falling back to the line's oldest rate (same rule as the RM price index).
+    Each line maps to one driver through a one-hot (line x driver) matrix, so
+    amounts = rates * (drivers @ matrix.T) for one or many scenarios.
+    """
+
+    def __init__(self, rows):
+        rows = list(rows) or [dict(row, effective_date=None) for row in DEFAULT_EXPORT_EXPENSES]
+        df = pd.DataFrame(rows, columns=["line_code", "expense_group", "description", "driver", "rate",
+                                         "effective_date", "sort_order"])
+        df["rate"] = pd.to_numeric(df["rate"], errors="coerce")
+        df = df.dropna(subset=["line_code", "rate"])
+        df = df[df["driver"].isin(DRIVERS)]
+        day = pd.to_datetime(df["effective_date"], errors="coerce")
+        # Undated rows apply from the beginning (biased day 0)
+        df["day"] = np.where(day.notna(), day.values.astype("datetime64[D]").astype(np.int64) + _DAY_BIAS, 0)
+        df["position"] = np.arange(len(df))
+
+        # Line order: sort_order, then first appearance; descriptions / drivers from the latest rate
+        latest = df.sort_values(["day", "position"], kind="stable").drop_duplicates("line_code", keep="last")
+        latest = latest.assign(order=pd.to_numeric(latest["sort_order"], errors="coerce"))
+        first_seen = df.drop_duplicates("line_code").set_index("line_code")["position"]
+        latest = latest.assign(first=latest["line_code"].map(first_seen))
+        latest = latest.sort_values(["order", "first"], kind="stable", na_position="last")
+
+        self.lines = tuple(latest["line_code"])
+        self.descriptions = tuple(latest["description"].fillna(latest["line_code"]))
+        self.groups = tuple(latest["expense_group"].fillna(""))
+        self.drivers = tuple(latest["driver"])
+        self._matrix = (np.array([DRIVERS.index(d) for d in self.drivers])[:, None]
+                        == np.arange(len(DRIVERS))[None, :]).astype(float)
+
+        # Flat (line, day) sorted rate history for vectorized as-of lookups
+        code = {line: position for position, line in enumerate(self.lines)}
+        df = df.drop_duplicates(subset=["line_code", "day"], keep="last")
+        df = df.assign(code=df["line_code"].map(code).astype(np.int64))
+        df = df.sort_values(["code", "day"], kind="stable")
+        self._keys = (df["code"].to_numpy(dtype=np.int64) << _DAY_BITS) | df["day"].to_numpy(dtype=np.int64)
+        self._rates = df["rate"].to_numpy(dtype=float)
+        self._start = np.searchsorted(self._keys, np.arange(len(self.lines), dtype=np.int64) << _DAY_BITS)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def rates_as_of(self, as_of) -> np.ndarray:
+        """Rate of every line (in `lines` order) as of a date; None / invalid -> latest rates."""
+        ts = pd.Timestamp(as_of) if as_of is not None else pd.NaT
+        day = (1 << _DAY_BITS) - 1 if pd.isna(ts) else int(ts.value // 86_400_000_000_000) + _DAY_BIAS
+        codes = np.arange(len(self.lines), dtype=np.int64)
+        idx = np.searchsorted(self._keys, (codes << _DAY_BITS) | day, side="right") - 1
+        return self._rates[np.maximum(idx, self._start)]
+
+    def driver_rates(self, as_of) -> np.ndarray:
+        """Combined rate per driver (THB per container, per invoice, per ton) as of a date."""
+        return self._matrix.T @ self.rates_as_of(as_of)
+
+    def amounts(self, as_of, container_qty, invoice_qty, ton_per_container) -> np.ndarray:
+        """
+        THB per line for one scenario (shape (lines,)) or for arrays of scenarios
+        (shape (scenarios, lines)): rate vector x each line's driver quantity.
+        """
+        drivers = driver_vector(container_qty, invoice_qty, ton_per_container)
+        return (drivers @ self._matrix.T) * self.rates_as_of(as_of)
+
+    def totals(self, as_of, container_qty, invoice_qty, ton_per_container) -> np.ndarray:
+        """Total THB of all lines per scenario: driver vector . driver_rates."""
+        return driver_vector(container_qty, invoice_qty, ton_per_container) @ self.driver_rates(as_of)
+
+    def label(self, position: int, as_of) -> str:
+        """Editor label of one line, e.g. 'THC ค่าดำเนินการในท่าเรือต้นทาง (2,800 บาท/ตู้)'."""
+        rate = self.rates_as_of(as_of)[position]
+        return f"{self.descriptions[position]} ({rate:,.0f} บาท/{DRIVER_UNITS[self.drivers[position]]})"
@@ -0,0 +1,227 @@
+"""
+FX Rate Service Module for Quotation App
+Keeps the latest THB rate of every quotation currency in one shared store.
+All pairs are fetched in one batched download on a background schedule, so
+pages read a cached rate instantly and keep the last known value when the
+provider is unreachable.
+"""
+
+import threading
+import time
+
+import pandas as pd
+
+BASE_CURRENCY = "THB"
+DEFAULT_FX_TTL = 900  # seconds a fetched rate counts as fresh
+
+# Rates used by StubFxProvider (THB per unit of currency)
+DEFAULT_STUB_RATES = {"USD": 34.0, "EUR": 37.0, "JPY": 0.23, "GBP": 43.0, "CNY": 4.7, "SGD": 25.5}
+
+
+class YahooFxProvider:
+    """Yahoo Finance (yfinance): every pair in a single yf.download call."""
+
+    name = "yahoo"
+    # Yahoo quotes USD/THB as "THB=X"; other pairs as "<CCY>THB=X"
+    SYMBOL_OVERRIDES = {"USD": "THB=X"}
+
+    def symbol(self, currency: str) -> str:
+        return self.SYMBOL_OVERRIDES.get(currency, f"{currency}{BASE_CURRENCY}=X")
+
+    def fetch(self, currencies) -> dict:
+        """Latest close per currency -> {currency: rate}; pairs without data are left out."""
+        import yfinance as yf
+
+        symbols = {self.symbol(c): c for c in currencies}
+        if not symbols:
+            return {}
+        data = yf.download(list(symbols), period="5d", interval="1d", progress=False, auto_adjust=False)
+        if data is None or data.empty:
+            return {}
+        close = data["Close"]
+        if isinstance(close, pd.Series):  # single symbol without a ticker level
+            close = close.to_frame(next(iter(symbols)))
+        last = close.ffill().iloc[-1]
+        return {symbols[s]: float(last[s]) for s in symbols if s in last and pd.notna(last[s])}
+
+    def history(self, currencies, days: int) -> list:
+        """Daily closes of the last `days` days -> [{"currency", "rate_date", "rate", "source"}]."""
+        import yfinance as yf
+
+        symbols = {self.symbol(c): c for c in currencies if c != BASE_CURRENCY}
+        if not symbols:
+            return []
+        data = yf.download(list(symbols), period=f"{int(days)}d", interval="1d", progress=False, auto_adjust=False)
+        if data is None or data.empty:
+            return []
+        close = data["Close"]
+        if isinstance(close, pd.Series):
+            close = close.to_frame(next(iter(symbols)))
+        long = close.rename(columns=symbols).stack().rename("rate").reset_index()
+        long.columns = ["rate_date", "currency", "rate"]
+        long = long.dropna(subset=["rate"])
+        long["rate_date"] = pd.to_datetime(long["rate_date"]).dt.date.astype(str)
+        long["source"] = self.name
+        return long[["currency", "rate_date", "rate", "source"]].to_dict("records")
+
+
+class StubFxProvider:
+    """
+    Local provider with fixed rates, for tests and offline development
+    (FX_PROVIDER=stub). `fail=True` simulates an outage, `delay` a slow upstream.
+    """
+
+    name = "stub"
+
+    def __init__(self, rates=None, fail: bool = False, delay: float = 0.0):
+        self.rates = dict(DEFAULT_STUB_RATES if rates is None else rates)
+        self.fail = fail
+        self.delay = delay
+        self.calls = 0
+
+    def fetch(self, currencies) -> dict:
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError("stub FX provider is offline")
+        return {c: self.rates[c] for c in currencies if c in self.rates}
+
+    def history(self, currencies, days: int) -> list:
+        self.calls += 1
+        if self.fail:
+            raise ConnectionError("stub FX provider is offline")
+        today = pd.Timestamp.today().normalize()
+        return [
+            {"currency": c, "rate_date": str((today - pd.Timedelta(days=n)).date()), "rate": self.rates[c],
+             "source": self.name}
+            for c in currencies if c in self.rates for n in range(int(days))
+        ]
+
+
+class FxRateService:
+    """
+    Shared store of FX rates with fetch timestamps.
+    quote() / rate() never wait on the provider: a missing or stale rate
+    starts a background refresh and the last known value is returned meanwhile.
+    on_refresh(service) runs after each successful refresh (e.g. to persist rows()).
+    """
+
+    def __init__(self, provider, currencies=(), ttl: float = DEFAULT_FX_TTL, on_refresh=None):
+        self.provider = provider
+        self.ttl = ttl
+        self.on_refresh = on_refresh
+        self.last_stats = {}
+        self._currencies = {c for c in currencies if c and c != BASE_CURRENCY}
+        self._rates = {}            # currency -> {"rate", "fetched_at", "source"}
+        self._lock = threading.RLock()
+        self._bg_thread = None
+        self._stop = threading.Event()
+        self._scheduler = None
+
+    # --- Public API ---
+    def track(self, currencies):
+        """Add currencies to the batched download; new ones are fetched in the background."""
+        with self._lock:
+            new = {c for c in currencies if c and c != BASE_CURRENCY} - self._currencies
+            self._currencies |= new
+        if new:
+            self.refresh_in_background()
+
+    def quote(self, currency: str):
+        """{"currency", "rate", "fetched_at", "age_s", "stale", "source"} or None when never fetched."""
+        if currency == BASE_CURRENCY:
+            return {"currency": currency, "rate": 1.0, "fetched_at": time.time(), "age_s": 0.0,
+                    "stale": False, "source": "base"}
+        with self._lock:
+            entry = self._rates.get(currency)
+            if currency not in self._currencies:
+                self._currencies.add(currency)
+        if entry is None or self._is_stale(entry):
+            self.refresh_in_background()
+        if entry is None:
+            return None
+        age = time.time() - entry["fetched_at"]
+        return {"currency": currency, "rate": entry["rate"], "fetched_at": entry["fetched_at"],
+                "age_s": round(age, 1), "stale": age >= self.ttl, "source": entry["source"]}
+
+    def rate(self, currency: str, default=None):
+        quote = self.quote(currency)
+        return quote["rate"] if quote else default
+
+    def refresh(self) -> dict:
+        """Fetch every tracked currency in one provider call (blocking). Returns statistics."""
+        with self._lock:
+            currencies = sorted(self._currencies)
+        start = time.perf_counter()
+        stats = {"provider": self.provider.name, "requested": len(currencies), "fetched": 0, "error": None}
+        try:
+            rates = self.provider.fetch(currencies) if currencies else {}
+        except Exception as e:
+            # Offline / upstream error: keep serving the last known rates
+            stats["error"] = str(e)
+            print(f"[WARNING] FX refresh failed ({self.provider.name}), using last known rates: {e}")
+        else:
+            now = time.time()
+            with self._lock:
+                for currency, value in rates.items():
+                    self._rates[currency] = {"rate": float(value), "fetched_at": now, "source": self.provider.name}
+            stats["fetched"] = len(rates)
+        stats["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        self.last_stats = stats
+        if stats["error"] is None and self.on_refresh is not None:
+            self.on_refresh(self)
+        return stats
+
+    def refresh_in_background(self) -> bool:
+        """Start a non-blocking refresh. Returns False if one is already running."""
+        with self._lock:
+            if self._bg_thread is not None and self._bg_thread.is_alive():
+                return False
+            self._bg_thread = threading.Thread(target=self.refresh, name="fx-refresh", daemon=True)
+            self._bg_thread.start()
+            return True
+
+    def start(self, interval: float):
+        """Refresh every `interval` seconds on a daemon thread (first refresh right away)."""
+        with self._lock:
+            if self._scheduler is not None and self._scheduler.is_alive():
+                return
+            self._stop.clear()
+
+            def loop():
+                while not self._stop.is_set():
+                    self.refresh_in_background()
+                    self._stop.wait(interval)
+
+            self._scheduler = threading.Thread(target=loop, name="fx-schedule", daemon=True)
+            self._scheduler.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def wait(self, timeout: float = None):
+        """Block until a running background refresh finishes (tests / scripts)."""
+        thread = self._bg_thread
+        if thread is not None:
+            thread.join(timeout)
+
+    # --- Persistence (rows for MasterSnapshotStore) ---
+    def rows(self) -> list:
+        with self._lock:
+            return [{"currency": c, **entry} for c, entry in sorted(self._rates.items())]
+
+    def load_rows(self, rows: list):
+        """Seed the last known rates (e.g. from the local snapshot after a restart)."""
+        with self._lock:
+            for row in rows:
+                self._rates[row["currency"]] = {
+                    "rate": float(row["rate"]), "fetched_at": float(row["fetched_at"]),
+                    "source": row.get("source") or "snapshot",
+                }
+                if row["currency"] != BASE_CURRENCY:
+                    self._currencies.add(row["currency"])
+
+    # --- Internals ---
+    def _is_stale(self, entry) -> bool:
+        return (time.time() - entry["fetched_at"]) >= self.ttl
@@ -0,0 +1,321 @@
+"""
+Master Data Index Module for Quotation App
+Builds one immutable, indexed view over all master tables. It is rebuilt only
+when the underlying mirrors change and is shared by every Streamlit session,
+so pages look values up by key instead of scanning lists on every rerun.
+"""
+
+from bisect import bisect_right
+from types import MappingProxyType
+
+import numpy as np
+import pandas as pd
+
+from export_expense import ExportExpenseSchedule
+from port_geo import PortGeoIndex
+from search_index import CustomerSearchIndex, PortSearchIndex
+
+DEFAULT_SHIPPING_RATE = 1400.0  # Standard fallback when no tiers are configured
+
+
+def _to_float(value, default: float = 0.0) -> float:
+    try:
+        return float(value) if value is not None else default
+    except (TypeError, ValueError):
+        return default
+
+
+def _to_day(value):
+    """Date-like (date, datetime, Timestamp, 'YYYY-MM-DD') -> days since epoch, or None."""
+    ts = pd.Timestamp(value) if value is not None else pd.NaT
+    if pd.isna(ts):
+        return None
+    return int(ts.value // 86_400_000_000_000)
+
+
+class RMPriceIndex:
+    """
+    Per-product RM price series sorted by update_date, for as-of lookups:
+    the price of the latest update on or before the target date, falling back
+    to the oldest price when every update is after it (same rule as the
+    original get_rm_base_price loop).
+    """
+
+    _DAY_BITS = 32  # composite key = product_code << 32 | day
+
+    def __init__(self, rm_costs):
+        df = pd.DataFrame(list(rm_costs), columns=["product", "price", "update_date"])
+        df["day"] = pd.to_datetime(df["update_date"], errors="coerce")
+        df = df.dropna(subset=["product", "day"])
+        df["day"] = (df["day"].values.astype("datetime64[D]")).astype(np.int64)
+        df["price"] = pd.to_numeric(df["price"], errors="coerce").fillna(0.0)
+        # Fallback price: the last row on each product's oldest date (old loop took matches[-1])
+        oldest = df[df["day"] == df.groupby("product")["day"].transform("min")]
+        oldest = oldest.drop_duplicates(subset=["product"], keep="last").set_index("product")["price"]
+        # One price per (product, day): keep the first row, as the old loop did
+        df = df.drop_duplicates(subset=["product", "day"], keep="first")
+        df = df.sort_values(["product", "day"], kind="stable")
+
+        self.products = tuple(df["product"].unique())
+        self._code = {product: code for code, product in enumerate(self.products)}
+        self._product_index = pd.Index(self.products, dtype=object)
+        self._oldest = oldest.reindex(list(self.products)).to_numpy(dtype=float)
+        codes = df["product"].map(self._code).to_numpy(dtype=np.int64)
+        self._keys = (codes << self._DAY_BITS) | df["day"].to_numpy(dtype=np.int64)
+        self._prices = df["price"].to_numpy(dtype=float)
+        # Start offset of each product's series inside the flat arrays
+        self._start = np.searchsorted(self._keys, np.arange(len(self.products), dtype=np.int64) << self._DAY_BITS)
+        self._end = np.append(self._start[1:], len(self._keys)).astype(np.int64)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def price_as_of(self, product, as_of) -> float:
+        """As-of price for one product (O(log n)). Unknown product / invalid date -> 0.0."""
+        code = self._code.get(product)
+        day = _to_day(as_of)
+        if code is None or day is None:
+            return 0.0
+        start, end = int(self._start[code]), int(self._end[code])
+        idx = bisect_right(self._keys, (code << self._DAY_BITS) | day, start, end) - 1
+        return float(self._prices[idx] if idx >= start else self._oldest[code])
+
+    def prices_as_of(self, products, dates) -> np.ndarray:
+        """
+        Vectorized as-of join: price each (product, date) pair in one call.
+        `products` is an array-like; `dates` is an equal-length array-like or a
+        single date applied to every product. Returns a float array.
+        """
+        products = np.asarray(products, dtype=object)
+        out = np.zeros(len(products), dtype=float)
+        if not len(self._keys) or not len(products):
+            return out
+
+        if pd.api.types.is_list_like(dates):
+            days = pd.to_datetime(pd.Series(dates).reset_index(drop=True), errors="coerce")
+            valid_day = days.notna().to_numpy()
+            day_all = np.where(valid_day, days.values.astype("datetime64[D]").astype(np.int64), 0)
+        else:
+            day = _to_day(dates)
+            valid_day = np.full(len(products), day is not None)
+            day_all = np.full(len(products), day or 0, dtype=np.int64)
+
+        codes = self._product_index.get_indexer(products)
+        valid = (codes >= 0) & valid_day
+        if not valid.any():
+            return out
+        code = codes[valid].astype(np.int64)
+        day = day_all[valid]
+
+        idx = np.searchsorted(self._keys, (code << self._DAY_BITS) | day, side="right") - 1
+        before_first = idx < self._start[code]  # target precedes every update -> oldest price
+        out[valid] = np.where(before_first, self._oldest[code], self._prices[np.maximum(idx, 0)])
+        return out
+
+
+class FxHistory:
+    """
+    Date-indexed FX history (THB per unit of currency) from master_fx_rates:
+    one sorted day array and one rate array per currency. As-of lookups give
+    the rate of the latest date on or before the target, NaN before the first
+    known date; the base currency THB is always 1.0.
+    """
+
+    BASE_CURRENCY = "THB"
+
+    def __init__(self, fx_rates):
+        df = pd.DataFrame(list(fx_rates), columns=["currency", "rate_date", "rate"])
+        df["day"] = pd.to_datetime(df["rate_date"], errors="coerce")
+        df["rate"] = pd.to_numeric(df["rate"], errors="coerce")
+        df = df.dropna(subset=["currency", "day", "rate"])
+        df["day"] = (df["day"].values.astype("datetime64[D]")).astype(np.int64)
+        df = df.drop_duplicates(subset=["currency", "day"], keep="first").sort_values(["currency", "day"], kind="stable")
+
+        self._series = {
+            currency: (group["day"].to_numpy(dtype=np.int64), group["rate"].to_numpy(dtype=float))
+            for currency, group in df.groupby("currency", sort=True)
+        }
+        self.currencies = tuple(self._series)
+
+    def __len__(self):
+        return sum(len(days) for days, _ in self._series.values())
+
+    def rate_as_of(self, currency, as_of) -> float:
+        """As-of rate for one currency (O(log n)). Unknown currency / date before history -> NaN."""
+        if currency == self.BASE_CURRENCY:
+            return 1.0
+        series = self._series.get(currency)
+        day = _to_day(as_of)
+        if series is None or day is None:
+            return float("nan")
+        days, rates = series
+        idx = bisect_right(days, day) - 1
+        return float(rates[idx]) if idx >= 0 else float("nan")
+
+    def average_rate(self, currency, start, end) -> float:
+        """Mean rate over [start, end] (e.g. a shipment window); the as-of rate of `start` if no fixings fall inside."""
+        if currency == self.BASE_CURRENCY:
+            return 1.0
+        series = self._series.get(currency)
+        first, last = _to_day(start), _to_day(end)
+        if series is None or first is None or last is None:
+            return float("nan")
+        days, rates = series
+        lo, hi = np.searchsorted(days, first, side="left"), np.searchsorted(days, last, side="right")
+        return float(rates[lo:hi].mean()) if hi > lo else self.rate_as_of(currency, start)
+
+    def rates_as_of(self, currencies, dates) -> np.ndarray:
+        """
+        Vectorized as-of join: rate each (currency, date) pair in one call.
+        `currencies` is an array-like; `dates` is an equal-length array-like or a
+        single date applied to every row. Returns a float array (NaN = no rate).
+        """
+        currencies = pd.Series(np.asarray(currencies, dtype=object))
+        out = np.full(len(currencies), np.nan)
+        if not len(currencies):
+            return out
+
+        if pd.api.types.is_list_like(dates):
+            days = pd.to_datetime(pd.Series(dates).reset_index(drop=True), errors="coerce")
+            valid_day = days.notna().to_numpy()
+            day_all = np.where(valid_day, days.values.astype("datetime64[D]").astype(np.int64), 0)
+        else:
+            day = _to_day(dates)
+            valid_day = np.full(len(currencies), day is not None)
+            day_all = np.full(len(currencies), day or 0, dtype=np.int64)
+
+        out[(currencies == self.BASE_CURRENCY).to_numpy()] = 1.0
+        # One searchsorted per currency present (a handful), over all of its rows at once
+        for currency, positions in currencies.groupby(currencies, sort=False).indices.items():
+            series = self._series.get(currency)
+            if series is None:
+                continue
+            positions = positions[valid_day[positions]]
+            days, rates = series
+            idx = np.searchsorted(days, day_all[positions], side="right") - 1
+            out[positions] = np.where(idx >= 0, rates[np.maximum(idx, 0)], np.nan)
+        return out
+
+    def to_thb(self, amounts, currencies, dates) -> np.ndarray:
+        """Convert amounts in `currencies` to THB at the as-of rate of `dates` (NaN = no rate)."""
+        return np.asarray(amounts, dtype=float) * self.rates_as_of(currencies, dates)
+
+
+class MasterData:
+    """
+    Immutable snapshot of the master tables with hash / interval indexes.
+    `tables` maps Supabase table name -> list of rows (see supabase_client.MASTER_TABLES).
+    """
+
+    def __init__(self, tables: dict, version=None):
+        self.version = version
+
+        # --- Customers: code -> row, display "[CODE] NAME" sorted by name ---
+        customers = tables.get("master_customers") or []
+        self.customers_by_code = MappingProxyType(
+            {row["customer_code"]: row for row in customers if row.get("customer_code")}
+        )
+        cust_df = pd.DataFrame(customers, columns=["customer_code", "customer_name", "payment_term_customer_name"])
+        cust_df = cust_df.dropna(subset=["customer_code"]).sort_values("customer_name", kind="stable")
+        cust_display = "[" + cust_df["customer_code"].astype(str) + "] " + cust_df["customer_name"].astype(str)
+        self.customer_display_list = tuple(cust_display)
+        self.customer_code_by_display = MappingProxyType(dict(zip(cust_display, cust_df["customer_code"])))
+        self.customer_term_by_display = MappingProxyType(
+            dict(zip(cust_display, cust_df["payment_term_customer_name"].fillna("N/A")))
+        )
+        # Reverse map for reopening saved quotations
+        self.customer_display_by_code = MappingProxyType(dict(zip(cust_df["customer_code"], cust_display)))
+        self.customer_search = CustomerSearchIndex(customers)
+
+        # --- Currencies ---
+        currencies = tables.get("master_currencies") or []
+        self.currency_codes = tuple(sorted({row["code"] for row in currencies if row.get("code")}))
+
+        # --- Ports: display "[Country] Port" sorted by port name ---
+        ports = tables.get("master_ports") or []
+        port_df = pd.DataFrame(ports, columns=["id", "main_port_name", "country_code"])
+        port_df = port_df.dropna(subset=["main_port_name"]).sort_values("main_port_name", kind="stable")
+        port_display = "[" + port_df["country_code"].fillna("").astype(str) + "] " + port_df["main_port_name"].astype(str)
+        self.port_display_list = tuple(port_display)
+        self.port_name_by_display = MappingProxyType(dict(zip(port_display, port_df["main_port_name"])))
+        self.ports_by_id = MappingProxyType({row["id"]: row for row in ports if row.get("id") is not None})
+        # Reverse map for reopening saved quotations (first display per port name)
+        self.port_display_by_name = MappingProxyType(
+            dict(zip(port_df["main_port_name"][::-1], port_display[::-1]))
+        )
+        self.port_search = PortSearchIndex(ports)
+        self.port_geo = PortGeoIndex(ports)
+
+        # --- Overhead / Yield loss by group ---
+        overhead = tables.get("master_overhead") or []
+        self.overhead_rates = MappingProxyType(
+            {row["group_number"]: _to_float(row.get("overhead_rate")) for row in overhead}
+        )
+        self.yield_loss_rates = MappingProxyType(
+            {row["group_number"]: _to_float(row.get("yield_loss_percent")) for row in overhead}
+        )
+
+        # --- Factory expense (single rate) ---
+        factory = tables.get("master_factory_expense") or []
+        self.factory_expense_rate = _to_float(factory[0].get("expense_rate")) if factory else None
+
+        # --- Shipping tiers: sorted interval index on min_qty ---
+        tiers = sorted(tables.get("shipping_rates") or [], key=lambda t: t["min_qty"])
+        self.shipping_tiers = tuple(tiers)
+        self._tier_min = [t["min_qty"] for t in tiers]
+        self._tier_max = [t["max_qty"] for t in tiers]
+        self._tier_price = [_to_float(t["price_per_container"]) for t in tiers]
+
+        # --- RM costs ---
+        self.rm_costs = tuple(tables.get("master_rm_cost") or [])
+        self.rm_products = tuple(sorted({row["product"] for row in self.rm_costs if row.get("product")}))
+        self.rm_prices = RMPriceIndex(self.rm_costs)
+
+        # --- FX history ---
+        self.fx_history = FxHistory(tables.get("master_fx_rates") or [])
+
+        # --- Export expense lines (dated rates x container / invoice / ton drivers) ---
+        self.export_expenses = ExportExpenseSchedule(tables.get("master_export_expense") or [])
+
+    # --- Lookup API ---
+    def overhead_rate(self, group) -> float:
+        return self.overhead_rates.get(group, 0.0)
+
+    def yield_loss(self, group) -> float:
+        return self.yield_loss_rates.get(group, 0.0)
+
+    def rm_price(self, product, as_of) -> float:
+        """RM price for product as of a date (see RMPriceIndex)."""
+        return self.rm_prices.price_as_of(product, as_of)
+
+    def fx_rate(self, currency, as_of) -> float:
+        """THB rate of a currency as of a date (see FxHistory), NaN when unknown."""
+        return self.fx_history.rate_as_of(currency, as_of)
+
+    def customer(self, customer_code):
+        return self.customers_by_code.get(customer_code)
+
+    def search_customers(self, query: str, k: int = 20) -> list:
+        """Top-k "[CODE] NAME" labels for a fuzzy code / name / country query."""
+        return self.customer_search.search(query, k)
+
+    def port_name(self, display: str) -> str:
+        return self.port_name_by_display.get(display, "")
+
+    def port_distances(self, origin: str, destinations) -> np.ndarray:
+        """Great-circle km from one port to each destination (names / labels; NaN when unknown)."""
+        return self.port_geo.distance_matrix([origin], destinations)[0]
+
+    def search_ports(self, query: str, k: int = 20) -> list:
+        """Top-k "[Country] Port" labels for a name / alternate name / country / UN/LOCODE query."""
+        return self.port_search.search(query, k)
+
+    def shipping_rate(self, qty) -> float:
+        """Price per container for the tier containing qty (tiers must not overlap)."""
+        if not self._tier_price:
+            return DEFAULT_SHIPPING_RATE
+        idx = bisect_right(self._tier_min, qty) - 1
+        if idx >= 0 and qty <= self._tier_max[idx]:
+            return self._tier_price[idx]
+        # No tier found: use the last tier
+        return self._tier_price[-1]
@@ -0,0 +1,105 @@
+"""
+Master Data Snapshot Module for Quotation App
+Persists the master-table mirrors to a local SQLite file so a restarted
+server can serve master data in milliseconds (and keep working offline)
+while Supabase is refreshed in the background.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Bump when the on-disk layout changes; older snapshots are ignored
+SNAPSHOT_FORMAT_VERSION = 1
+DEFAULT_SNAPSHOT_PATH = os.path.join(".cache", "master_snapshot.sqlite")
+
+
+class MasterSnapshotStore:
+    """
+    Versioned SQLite store holding one row per master table:
+    the table's rows (as JSON), its sync watermark and when it was saved.
+    """
+
+    def __init__(self, path: str = DEFAULT_SNAPSHOT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS master_tables ("
+            " name TEXT PRIMARY KEY, watermark TEXT, row_count INTEGER,"
+            " saved_at REAL, rows_json TEXT)"
+        )
+        row = conn.execute("SELECT value FROM meta WHERE key = 'format_version'").fetchone()
+        if row is None or int(row[0]) != SNAPSHOT_FORMAT_VERSION:
+            # New file or an incompatible layout: start clean
+            conn.execute("DELETE FROM master_tables")
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('format_version', ?)",
+                (str(SNAPSHOT_FORMAT_VERSION),)
+            )
+            conn.commit()
+        return conn
+
+    def load_all(self) -> dict:
+        """Return {table: {"rows", "watermark", "saved_at"}} for every stored table."""
+        if not os.path.exists(self.path):
+            return {}
+        with self._lock:
+            try:
+                conn = self._connect()
+                try:
+                    records = conn.execute(
+                        "SELECT name, watermark, saved_at, rows_json FROM master_tables"
+                    ).fetchall()
+                finally:
+                    conn.close()
+            except sqlite3.Error as e:
+                print(f"[WARNING] Could not read master snapshot {self.path}: {e}")
+                return {}
+        return {
+            name: {"rows": json.loads(rows_json), "watermark": watermark, "saved_at": saved_at}
+            for name, watermark, saved_at, rows_json in records
+        }
+
+    def save(self, table: str, rows: list, watermark=None):
+        """Replace the stored copy of one table (single transaction)."""
+        payload = json.dumps(rows, ensure_ascii=False, default=str)
+        with self._lock:
+            try:
+                conn = self._connect()
+                try:
+                    with conn:
+                        conn.execute(
+                            "INSERT OR REPLACE INTO master_tables"
+                            " (name, watermark, row_count, saved_at, rows_json) VALUES (?, ?, ?, ?, ?)",
+                            (table, watermark, len(rows), time.time(), payload)
+                        )
+                finally:
+                    conn.close()
+            except sqlite3.Error as e:
+                print(f"[WARNING] Could not write master snapshot for {table}: {e}")
+
+    def info(self) -> list:
+        """Per-table snapshot summary (name, row_count, watermark, saved_at)."""
+        if not os.path.exists(self.path):
+            return []
+        with self._lock:
+            conn = self._connect()
+            try:
+                records = conn.execute(
+                    "SELECT name, row_count, watermark, saved_at FROM master_tables ORDER BY name"
+                ).fetchall()
+            finally:
+                conn.close()
+        return [
+            {"table": name, "rows": row_count, "watermark": watermark, "saved_at": saved_at}
+            for name, row_count, watermark, saved_at in records
+        ]
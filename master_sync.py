@@ -0,0 +1,200 @@
+"""
+Master Data Sync Module for Quotation App
+Keeps a local mirror of each master table and refreshes it incrementally:
+only rows with updated_at (or created_at) at/after the last high-water mark
+(minus an overlap window) are downloaded, and deletes are detected with a
+cheap row-count probe.
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+PAGE_SIZE = 1000  # Supabase caps each response at 1000 rows by default
+# updated_at is the writing transaction's start time (NOW()), so a row committed
+# after a later-stamped one can land below the watermark: every delta re-reads
+# this window (rows already mirrored unchanged are skipped by id).
+WATERMARK_OVERLAP = timedelta(minutes=5)
+
+
+def _parse_ts(value):
+    """Parse a PostgREST timestamp (ISO 8601) into a datetime, or None."""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+class MasterTableMirror:
+    """
+    Local copy of one master table, keyed by `id`.
+    refresh() pulls only changed rows; rows() returns the current ordered snapshot.
+    """
+
+    def __init__(self, table: str, order_by: str = "id", desc: bool = False,
+                 watermark_column: str = "updated_at"):
+        self.table = table
+        self.order_by = order_by
+        self.desc = desc
+        self.watermark_column = watermark_column
+        self.watermark = None       # max(watermark_column) seen so far (raw string)
+        self.version = 0            # bumped whenever the snapshot changes
+        self.last_sync = 0.0        # time.time() of the last successful refresh
+        self.last_stats = {}
+        self._rows = {}             # id -> row
+        self._snapshot = []         # ordered list, replaced atomically
+        self._lock = threading.RLock()
+        self._bg_thread = None
+
+    # --- Public API ---
+    def rows(self) -> list:
+        """Current ordered rows (shared, treat as read-only)."""
+        return self._snapshot
+
+    def is_stale(self, max_age: float) -> bool:
+        return (time.time() - self.last_sync) >= max_age
+
+    def refresh(self, client, force_full: bool = False) -> dict:
+        """Bring the mirror up to date. Returns sync statistics."""
+        with self._lock:
+            start = time.perf_counter()
+            if force_full or self.watermark is None:
+                stats = self._full_load(client)
+            else:
+                stats = self._delta_load(client)
+            self.last_sync = time.time()
+            stats["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            stats["rows"] = len(self._rows)
+            self.last_stats = stats
+            return stats
+
+    def refresh_if_stale(self, client, max_age: float):
+        """Refresh unless another thread already did so within max_age seconds."""
+        with self._lock:
+            if not self.is_stale(max_age):
+                return self.last_stats
+            return self.refresh(client)
+
+    def refresh_in_background(self, client, on_done=None) -> bool:
+        """
+        Start a non-blocking refresh; readers keep getting the current snapshot.
+        on_done(mirror, stats) runs after a successful refresh.
+        Returns False if a background refresh is already running.
+        """
+        with self._lock:
+            if self._bg_thread is not None and self._bg_thread.is_alive():
+                return False
+
+            def worker():
+                try:
+                    stats = self.refresh(client)
+                    if on_done is not None:
+                        on_done(self, stats)
+                except Exception as e:
+                    # Back off until the next interval instead of retrying on every read
+                    self.last_sync = time.time()
+                    print(f"[WARNING] Background sync failed for {self.table}: {e}")
+
+            self._bg_thread = threading.Thread(target=worker, name=f"sync-{self.table}", daemon=True)
+            self._bg_thread.start()
+            return True
+
+    def load_rows(self, rows: list, watermark=None):
+        """Seed the mirror from an existing copy (e.g. a local snapshot)."""
+        with self._lock:
+            self._rows = {row["id"]: row for row in rows}
+            self.watermark = watermark or self._max_watermark(rows)
+            self._publish()
+
+    # --- Internals ---
+    def _select_pages(self, client, columns: str = "*", since=None) -> list:
+        """Select all matching rows, page by page (stable order on watermark, id)."""
+        out = []
+        offset = 0
+        while True:
+            query = client.from_(self.table).select(columns)
+            if since is not None:
+                query = query.gte(self.watermark_column, since)
+            if columns == "*":
+                query = query.order(self.watermark_column).order("id")
+            else:
+                query = query.order("id")
+            page = query.range(offset, offset + PAGE_SIZE - 1).execute().data or []
+            out.extend(page)
+            if len(page) < PAGE_SIZE:
+                return out
+            offset += PAGE_SIZE
+
+    def _execute_with_fallback(self, fn):
+        """Fall back to created_at when the table has no updated_at column yet."""
+        try:
+            return fn()
+        except Exception as e:
+            # 42703: undefined column (supabase_schema.sql sync section not applied)
+            if "42703" in str(e) and self.watermark_column != "created_at":
+                print(f"[WARNING] {self.table}.{self.watermark_column} missing, using created_at")
+                self.watermark_column = "created_at"
+                return fn()
+            raise
+
+    def _full_load(self, client) -> dict:
+        rows = self._execute_with_fallback(lambda: self._select_pages(client))
+        self._rows = {row["id"]: row for row in rows}
+        self.watermark = self._max_watermark(rows)
+        self._publish()
+        return {"table": self.table, "mode": "full", "fetched": len(rows),
+                "changed": len(rows), "deleted": 0}
+
+    def _delta_load(self, client) -> dict:
+        # 1. Rows changed at/after the high-water mark minus the overlap window
+        #    (>= so equal timestamps are not missed)
+        changed = self._execute_with_fallback(
+            lambda: self._select_pages(client, since=self._since())
+        )
+        updated = 0
+        for row in changed:
+            if self._rows.get(row["id"]) != row:
+                self._rows[row["id"]] = row
+                updated += 1
+        if changed:
+            self.watermark = self._max_watermark(changed, self.watermark)
+
+        # 2. Delete probe: compare row counts, reconcile ids only on mismatch
+        deleted = 0
+        server_count = client.from_(self.table).select("id", count="exact", head=True).execute().count
+        if server_count is not None and server_count != len(self._rows):
+            server_ids = {row["id"] for row in self._select_pages(client, columns="id")}
+            stale_ids = [row_id for row_id in self._rows if row_id not in server_ids]
+            for row_id in stale_ids:
+                del self._rows[row_id]
+            deleted = len(stale_ids)
+            if len(self._rows) < len(server_ids):
+                # Rows we never saw (e.g. back-dated inserts) -> reload everything once
+                return self._full_load(client)
+
+        if updated or deleted:
+            self._publish()
+        return {"table": self.table, "mode": "delta", "fetched": len(changed),
+                "changed": updated, "deleted": deleted}
+
+    def _since(self):
+        """Lower bound of the next delta: the watermark minus WATERMARK_OVERLAP."""
+        ts = _parse_ts(self.watermark)
+        return (ts - WATERMARK_OVERLAP).isoformat() if ts is not None else self.watermark
+
+    def _max_watermark(self, rows: list, current=None):
+        best, best_ts = current, _parse_ts(current)
+        for row in rows:
+            ts = _parse_ts(row.get(self.watermark_column))
+            if ts is not None and (best_ts is None or ts > best_ts):
+                best, best_ts = row.get(self.watermark_column), ts
+        return best
+
+    def _publish(self):
+        def sort_key(row):
+            value = row.get(self.order_by)
+            return (value is None, value if value is not None else 0)
+        self._snapshot = sorted(self._rows.values(), key=sort_key, reverse=self.desc)
+        self.version += 1
@@ -5,12 +5,17 @@ This version truncates tables before migration to ensure a clean state.
 """
 
 import os
+import re
 import sys
 import math
+from datetime import date
+
 import pandas as pd
 from dotenv import load_dotenv
 from postgrest import SyncPostgrestClient
 
+from export_expense import DEFAULT_EXPORT_EXPENSES
+
 # Fix encoding for Windows console
 sys.stdout.reconfigure(encoding='utf-8')
 
@@ -298,6 +303,48 @@ def migrate_calculator():
         print(f"[ERROR] Calculator Specs: {e}")
 
 
+EXPENSE_RATE = re.compile(r"([\d,]+(?:\.\d+)?)\s*(?:บ\.|บาท)\s*/\s*(ตู้|Inv)")
+EXPENSE_DRIVERS = {"ตู้": "container", "Inv": "invoice"}
+
+
+def _expense_name(text):
+    """'2.2.2ค่าขนย้าย-ส่งออก: หัวลาก/ผ่านท่า (8,300 บ./ตู้)' -> 'ค่าขนย้าย-ส่งออก:หัวลาก/ผ่านท่า' (match key)."""
+    text = re.sub(r"^[\d.]+", "", str(text))
+    return re.sub(r"\s+", "", re.sub(r"\(.*\)\s*$", "", text))
+
+
+def migrate_export_expense():
+    """Migrate export expense lines from Master/MasterExportExpense.xlsx to Supabase."""
+    truncate_table("master_export_expense")
+    print("[EXPORT EXPENSE] Migrating export expense lines...")
+    try:
+        df = pd.read_excel("Master/MasterExportExpense.xlsx", header=None)
+        # Column B: line description, column C: rate text such as '8,300 บ./ตู้' or '(1,350 บาท/Inv)'
+        sheet_rates = {}
+        for _, row in df.iterrows():
+            match = EXPENSE_RATE.search(str(row.iloc[2]))
+            if match and not pd.isna(row.iloc[1]):
+                sheet_rates[_expense_name(row.iloc[1])] = (float(match.group(1).replace(",", "")),
+                                                           EXPENSE_DRIVERS[match.group(2)])
+        # Standard lines keep their line_code; lines not in the sheet keep the standard rate
+        effective_date = date.today().strftime('%Y-%m-%d')
+        records = []
+        for order, line in enumerate(DEFAULT_EXPORT_EXPENSES, start=1):
+            rate, driver = sheet_rates.pop(_expense_name(line['description']), (line['rate'], line['driver']))
+            records.append(dict(line, rate=rate, driver=driver, effective_date=effective_date, sort_order=order))
+        for extra, (name, (rate, driver)) in enumerate(sheet_rates.items(), start=1):
+            print(f"  [WARNING] No standard line for '{name}', added as expense_{extra}")
+            records.append({'line_code': f"expense_{extra}", 'expense_group': "Other", 'description': name,
+                            'driver': driver, 'rate': rate, 'effective_date': effective_date,
+                            'sort_order': len(records) + 1})
+
+        if records:
+            get_client().from_("master_export_expense").insert(records).execute()
+        print(f"[DONE] Export Expense: {len(records)} uploaded")
+    except Exception as e:
+        print(f"[ERROR] Export Expense: {e}")
+
+
 def main():
     print("=" * 50); print("Starting Master Data Migration to Supabase"); print("=" * 50)
     if not SUPABASE_URL or not SUPABASE_KEY: return
@@ -308,6 +355,7 @@ def main():
     migrate_factory_expense()
     # migrate_yield_loss() (DELETED - merged into overhead)
     migrate_shipping_rates()
+    migrate_export_expense()
     migrate_rm_costs()
     migrate_calculator()
     print("=" * 50); print("Migration Complete!"); print("=" * 50)
@@ -1,14 +1,18 @@
 import streamlit as st
 import pandas as pd
-import os
+import numpy as np
 from datetime import datetime, date
+import io
+import math
 import time
-import yfinance as yf
-from supabase_client import (
-    fetch_customers, fetch_currencies, fetch_ports, fetch_overhead, 
-    fetch_factory_expense, fetch_shipping_rates, fetch_rm_costs, fetch_calculator_specs,
-    get_overhead_by_group, get_yield_loss_by_group, get_next_doc_no_sequence
-)
+import functools
+from supabase_client import get_master_data, reserve_doc_no_sequence, load_quotation, get_fx_service
+from master_data import MasterData
+from costing import CostSheetModel, EDITOR_COLUMNS, destination_matrix, pack_destination_matrix
+from port_geo import DEFAULT_ORIGIN_PORT, KM_PER_NM
+from export_expense import EXPORT_EXPENSE_COLUMNS
+
+PAGE_START = time.perf_counter()
 
 
 # --- AUTH CHECK ---
@@ -146,855 +150,994 @@ st.markdown("""
     </style>
     """, unsafe_allow_html=True)
 
-# --- MASTER DATA MOCKUP (Replace with real logic as needed) ---
-@st.cache_data
-def load_customer_data():
-    """Load customer data from Supabase"""
-    try:
-        data = fetch_customers()
-        if data:
-            df = pd.DataFrame(data)
-            # Map Supabase columns back to the app's internal names
-            # Supabase: customer_code, customer_name, payment_term_customer_name
-            # App: CUSTOMER_CODE, CUSTOMER_NAME, Term
-            df = df.rename(columns={
-                'customer_code': 'CUSTOMER_CODE',
-                'customer_name': 'CUSTOMER_NAME',
-                'payment_term_customer_name': 'Term'
-            })
-            
-            # Sort by CUSTOMER_NAME
-            df = df.sort_values('CUSTOMER_NAME')
-            # Create display format [CODE] NAME
-            df['Display'] = df.apply(lambda x: f"[{x['CUSTOMER_CODE']}] {x['CUSTOMER_NAME']}", axis=1)
-            
-            if 'Term' not in df.columns:
-                df['Term'] = "N/A"
-            
-            return df[['CUSTOMER_CODE', 'CUSTOMER_NAME', 'Display', 'Term']]
-        
-        # Fallback to local file if Supabase is empty
-        file_path = "Master/Master Customer.xlsx"
-        if os.path.exists(file_path):
-            df = pd.read_excel(file_path)
-            df = df.rename(columns={'PAYMENTTERMCUSTOMERNAME': 'Term'})
-            df = df.sort_values('CUSTOMER_NAME')
-            df['Display'] = df.apply(lambda x: f"[{x['CUSTOMER_CODE']}] {x['CUSTOMER_NAME']}", axis=1)
-            return df[['CUSTOMER_CODE', 'CUSTOMER_NAME', 'Display', 'Term']]
-            
-        return pd.DataFrame(columns=['CUSTOMER_CODE', 'CUSTOMER_NAME', 'Display', 'Term'])
-    except Exception as e:
-        st.error(f"Error loading customer data from Supabase: {e}")
-        return pd.DataFrame(columns=['CUSTOMER_CODE', 'CUSTOMER_NAME', 'Display', 'Term'])
-
-@st.cache_data
-def load_currency_data():
-    """Load currency data from Supabase"""
-    try:
-        data = fetch_currencies()
-        if data:
-            # Supabase column name is 'code'
-            return sorted([item['code'] for item in data if item.get('code')])
-        
-        # Fallback to local file
-        file_path = "Master/MasterCurrency.xlsx"
-        if os.path.exists(file_path):
-            df = pd.read_excel(file_path)
-            code_col = 'รหัส (Code)'
-            if code_col in df.columns:
-                return sorted(df[code_col].dropna().unique().tolist())
-        return ["USD", "THB", "EUR", "JPY"]
-    except Exception as e:
-        st.error(f"Error loading currency data from Supabase: {e}")
-        return ["USD", "THB", "EUR", "JPY"]
-
-@st.cache_data
-def load_port_data():
-    """Load port data from Supabase"""
-    try:
-        data = fetch_ports()
-        if data:
-            df = pd.DataFrame(data)
-            # Map Supabase columns: main_port_name, country_code
-            # App: Main Port Name, Country Code
-            df = df.rename(columns={
-                'main_port_name': 'Main Port Name',
-                'country_code': 'Country Code'
-            })
-            
-            # Sort by Main Port Name
-            df = df.sort_values('Main Port Name')
-            # Create display format [Country Code] Main Port Name
-            df['Display'] = df.apply(lambda x: f"[{x['Country Code']}] {x['Main Port Name']}", axis=1)
-            return df[['Country Code', 'Main Port Name', 'Display']]
-        
-        # Fallback to local file
-        file_path = "Master/Master Port.csv"
-        if os.path.exists(file_path):
-            df = pd.read_csv(file_path, encoding='utf-8-sig', low_memory=False)
-            df = df.dropna(subset=['Main Port Name'])
-            df = df.sort_values('Main Port Name')
-            df['Display'] = df.apply(lambda x: f"[{x['Country Code']}] {x['Main Port Name']}", axis=1)
-            return df[['Country Code', 'Main Port Name', 'Display']]
-        return pd.DataFrame(columns=['Country Code', 'Main Port Name', 'Display'])
-    except Exception as e:
-        st.error(f"Error loading port data from Supabase: {e}")
-        return pd.DataFrame(columns=['Country Code', 'Main Port Name', 'Display'])
+# --- MASTER DATA (shared, indexed lookups; see master_data.py) ---
+try:
+    MASTER = get_master_data()
+except Exception as e:
+    st.error(f"Error loading master data from Supabase: {e}")
+    MASTER = MasterData({})
 
-# Load customer data
-CUSTOMER_DF = load_customer_data()
-CUSTOMER_LIST = CUSTOMER_DF['Display'].tolist()
-CUSTOMER_MAP = dict(zip(CUSTOMER_DF['Display'], CUSTOMER_DF['CUSTOMER_CODE']))
-CUSTOMER_TERMS_MAP = dict(zip(CUSTOMER_DF['Display'], CUSTOMER_DF['Term']))
+# Customer data (thousands of customers: the pickers search MASTER.customer_search)
+CUSTOMER_MAP = MASTER.customer_code_by_display
+CUSTOMER_TERMS_MAP = MASTER.customer_term_by_display
+CUSTOMER_HINT = "Code, name (Thai / English) or country"
 
-CURRENCY_LIST = load_currency_data()
+CURRENCY_LIST = list(MASTER.currency_codes) or ["USD", "THB", "EUR", "JPY"]
 
-# Load port data
-PORT_DF = load_port_data()
-PORT_DISPLAY_LIST = PORT_DF['Display'].tolist()
-PORT_MAP = dict(zip(PORT_DF['Display'], PORT_DF['Main Port Name']))
+# Port data (~3,800 ports: the destination pickers search MASTER.port_search)
+PORT_MAP = MASTER.port_name_by_display
+PORT_HINT = "Port, country or UN/LOCODE"
+ORIGIN_PORT = DEFAULT_ORIGIN_PORT
 
-CUSTOMERS = CUSTOMER_LIST # For backward compatibility in other parts if needed
+SEARCH_LIMIT = 20  # matches offered by each type-ahead picker
 
 PAYMENT_LIST = ["T/T AFTER FAX", "T/T 30 DAYS", "L/C AT SIGHT", "CASH"]
 DESTINATIONS = ["Bangkok", "Laem Chabang", "Singapore", "Hong Kong", "Tokyo", "Shanghai"]
 RM_ITEMS = [f"HM {i}" for i in range(1, 21)]
 SHIPMENT_MONTHS = ["Nov.25", "Dec.25", "Jan.26", "Feb.26"]
 
-# Load data from Supabase
-try:
-    OH_DATA = {item['group_number']: float(item['overhead_rate']) for item in fetch_overhead()}
-    if not OH_DATA:
-        OH_DATA = {0: 0.10, 1: 0.34, 2: 0.51, 3: 0.57, 4: 0.64, 5: 0.97, 6: 1.59}
-except Exception as e:
-    st.error(f"Error loading Overhead from Supabase: {e}")
-    OH_DATA = {0: 0.10, 1: 0.34, 2: 0.51, 3: 0.57, 4: 0.64, 5: 0.97, 6: 1.59}
-
-try:
-    factory_data = fetch_factory_expense()
-    FACTORY_EXPENSE_DEFAULT = float(factory_data[0]['expense_rate']) if factory_data else 0.42
-except Exception as e:
-    st.error(f"Error loading Factory Expense from Supabase: {e}")
-    FACTORY_EXPENSE_DEFAULT = 0.42
-
-# Load Tiered Shipping Rates
-try:
-    SHIPPING_RATES = fetch_shipping_rates()
-except Exception as e:
-    st.error(f"Error loading Shipping Rates from Supabase: {e}")
-    SHIPPING_RATES = []
+# Overhead & Factory Expense (defaults from Master.xlsx if the master tables are empty)
+OH_DATA = dict(MASTER.overhead_rates) or {0: 0.10, 1: 0.34, 2: 0.51, 3: 0.57, 4: 0.64, 5: 0.97, 6: 1.59}
+FACTORY_EXPENSE_DEFAULT = MASTER.factory_expense_rate if MASTER.factory_expense_rate is not None else 0.42
 
-# Load RM costs
-try:
-    RM_COSTS_DATA = fetch_rm_costs()
-    RM_COSTS_DF = pd.DataFrame(RM_COSTS_DATA) if RM_COSTS_DATA else pd.DataFrame()
-    # Unique product list for dropdown
-    RM_LIST = sorted(list(set([item['product'] for item in RM_COSTS_DATA]))) if RM_COSTS_DATA else []
-except Exception as e:
-    st.error(f"Error loading RM Costs from Supabase: {e}")
-    RM_LIST = []
-    RM_COSTS_DATA = []
-
-def get_rm_base_price(product, shipment_date_str):
-    """Match RM price by product and closest update date."""
-    if not RM_COSTS_DATA: return 0.0
-    try:
-        target_date = pd.to_datetime(shipment_date_str, format='%b.%y', errors='coerce')
-        if pd.isna(target_date): return 0.0
-        
-        matches = [r for r in RM_COSTS_DATA if r['product'] == product]
-        if not matches: return 0.0
-        
-        # Sort by date descending
-        matches.sort(key=lambda x: x['update_date'], reverse=True)
-        # Find the latest price that is on or before the target shipment date
-        for r in matches:
-            if pd.to_datetime(r['update_date']) <= target_date:
-                return float(r['price'])
-        # Fallback to the oldest if none match
-        return float(matches[-1]['price'])
-    except:
-        return 0.0
+# RM costs
+# Unique product list for dropdown
+RM_LIST = list(MASTER.rm_products)
 
 def get_shipping_rate(qty):
-    """Find the applicable rate for the given quantity from tiers."""
-    for tier in SHIPPING_RATES:
-        if tier['min_qty'] <= qty <= tier['max_qty']:
-            return float(tier['price_per_container'])
-    # If no tier found, use a default fallback or the last tier
-    if SHIPPING_RATES:
-        return float(SHIPPING_RATES[-1]['price_per_container'])
-    return 1400.0 # Standard fallback
+    """Find the applicable rate for the given quantity from tiers (interval index)."""
+    return MASTER.shipping_rate(qty)
 
 def generate_default_doc_no():
-    """Generates CSYYYYMMDD-XXXX based on current count in DB."""
+    """
+    Reserves CSYYYYMMDD-XXXX from the server-side counter.
+    The reservation is kept in session_state, so reruns reuse it without a DB call.
+    """
     today_str = datetime.now().strftime('%Y%m%d')
     prefix = f"CS{today_str}-"
+    reserved = st.session_state.get("reserved_doc_no")
+    if reserved and reserved.startswith(prefix):
+        return reserved
     try:
-        next_seq = get_next_doc_no_sequence(prefix)
-        return f"{prefix}{next_seq:04d}"
+        next_seq = reserve_doc_no_sequence(prefix)
     except Exception as e:
         print(f"Error generating doc_no: {e}")
         return f"{prefix}0001"
+    st.session_state.reserved_doc_no = f"{prefix}{next_seq:04d}"
+    return st.session_state.reserved_doc_no
+
+# --- Re-open a saved quotation ---
+# Session keys reset when a quotation is opened or a new sheet is started:
+# the 4 editor tables, their data_editor widget state / page, keyed inputs, the cost model
+# and the reserved / last saved document number
+EDITOR_STATE_KEYS = (
+    "cost_model", "cost_data_v3", "loading_data", "remark_data", "other_expenses_data", "dest_freight_data",
+    "cost_editor_v3_page", "loading_editor_page", "remark_editor_page", "other_expenses_editor", "dest_freight_editor",
+    "dest1_sel", "dest2_sel", "dest3_sel", "dest4_sel", "dest1_q", "dest2_q", "dest3_q", "dest4_q",
+    "cust1_sel", "cust1_q", "cust2_sel", "cust2_q", "ar_cust_sel", "ar_cust_q",
+    "ar_r", "ar_d", "rm_r", "rm_d", "spot_val", "reserved_doc_no", "saved_doc_no",
+)
+
+def _by_number(rows, key, size):
+    """Saved rows placed on line numbers 1..max(size, highest saved number)."""
+    by_no = {int(r[key]): r for r in rows if r.get(key) is not None}
+    return [(i, by_no.get(i, {})) for i in range(1, max([size] + list(by_no)) + 1)]
+
+def cost_frame_from_lines(production_costs):
+    return pd.DataFrame([{
+        "Item": i,
+        "Product Name": r.get("product_name") or "",
+        "Product RM": r.get("product_rm") or "",
+        "Group": int(r.get("overhead_group") or 0),
+        "PACKAGING": float(r.get("packaging") or 0.0),
+        "Brand": r.get("brand") or "",
+        "Pack Size": r.get("pack_size") or "",
+        "Quantity": float(r.get("quantity") or 0.0),
+        "Commision": float(r.get("commission") or 0.0),
+        "A&P": float(r.get("ap_expense") or 0.0),
+        "Agreement": float(r.get("agreement") or 0.0),
+        "Other Cost": float(r.get("other_cost") or 0.0),
+        "Selling Price": float(r.get("selling_price") or 0.0)
+    } for i, r in _by_number(production_costs, "item_order", 15)])
+
+def loading_frame_from_lines(loadings):
+    return pd.DataFrame([{
+        "No.": i,
+        "รายการสินค้า": r.get("product_name") or "",
+        "จำนวน (ลัง/กล่อง)": int(r.get("qty_cartons") or 0),
+        "น้ำหนัก/หน่วย (KG)": float(r.get("weight_per_unit") or 0.0),
+        "น้ำหนักรวม (KG)": float(r.get("total_weight") or 0.0),
+        "ตู้ที่": r.get("container_no") or "",
+        "หมายเหตุ": r.get("remark") or ""
+    } for i, r in _by_number(loadings, "order_no", 15)])
+
+def remark_frame_from_lines(remarks):
+    lines = _by_number(remarks, "order_no", 20)
+    return pd.DataFrame({
+        "No.": [i for i, _ in lines],
+        "Remark": [r.get("remark_text") or "" for _, r in lines]
+    })
+
+def other_expenses_frame_from_lines(other_expenses):
+    return pd.DataFrame([{
+        "ลำดับ": i,
+        "รายการค่าใช้จ่าย": r.get("description") or "",
+        "จำนวนเงิน (USD/Ton)": float(r.get("amount") or 0.0)
+    } for i, r in _by_number(other_expenses or [], "order_no", 10)])
+
+# --- Bulk paste / import of production lines ---
+# Pasted / imported columns, in order when the data has no header row
+IMPORT_COLUMNS = ("Product Name", "Product RM", "Group", "PACKAGING", "Brand", "Pack Size", "Quantity",
+                  "Commision", "A&P", "Agreement", "Other Cost", "Selling Price")
+IMPORT_TEXT_COLUMNS = ("Product Name", "Product RM", "Brand", "Pack Size")
+
+def cost_frame_from_import(raw, first_item=1):
+    """
+    Production lines from a pasted / uploaded table (all cells as text).
+    A first row naming editor columns is used as the header; otherwise the
+    columns are taken in IMPORT_COLUMNS order. Numbers may contain thousands separators.
+    """
+    raw = raw.dropna(how="all").reset_index(drop=True)
+    names = {c.lower(): c for c in IMPORT_COLUMNS}
+    first = [str(v).strip().lower() for v in raw.iloc[0]] if len(raw) else []
+    if any(v in names for v in first):
+        raw = raw.iloc[1:].reset_index(drop=True).set_axis([names.get(v, v) for v in first], axis=1)
+    else:
+        raw = raw.iloc[:, :len(IMPORT_COLUMNS)].set_axis(list(IMPORT_COLUMNS[:min(raw.shape[1], len(IMPORT_COLUMNS))]), axis=1)
+
+    out = pd.DataFrame({"Item": np.arange(first_item, first_item + len(raw))})
+    for col in IMPORT_COLUMNS:
+        values = raw[col] if col in raw else pd.Series([None] * len(raw))
+        if col in IMPORT_TEXT_COLUMNS:
+            out[col] = values.fillna("").astype(str).str.strip().to_numpy()
+        else:
+            number = pd.to_numeric(values.astype(str).str.replace(",", "").str.strip(), errors="coerce").fillna(0.0)
+            out[col] = (number.clip(0, 6).astype(int) if col == "Group" else number).to_numpy()
+    return out
+
+def read_import(pasted, uploaded):
+    """Raw table (text cells) from pasted Excel rows (tab-separated) or an uploaded CSV / Excel file."""
+    if uploaded is not None:
+        if uploaded.name.lower().endswith(".xlsx"):
+            return pd.read_excel(uploaded, header=None, dtype=str)
+        return pd.read_csv(uploaded, header=None, dtype=str, sep=None, engine="python")
+    return pd.read_csv(io.StringIO(pasted), header=None, dtype=str, sep="\t", skip_blank_lines=True)
+
+def open_quotation(payload):
+    """Rebuild the editor session state from a load_quotation() payload."""
+    for key in EDITOR_STATE_KEYS:
+        st.session_state.pop(key, None)
+    st.session_state.loaded_quotation = payload
+    st.session_state.cost_data_v3 = cost_frame_from_lines(payload["production_costs"])
+    st.session_state.loading_data = loading_frame_from_lines(payload["loadings"])
+    st.session_state.remark_data = remark_frame_from_lines(payload["remarks"])
+    st.session_state.other_expenses_data = other_expenses_frame_from_lines(
+        payload["export_expenses"].get("other_expenses"))
+    if payload["general_info"].get("spot_rate") is not None:
+        st.session_state.spot_val = float(payload["general_info"]["spot_rate"])
+
+def new_quotation():
+    for key in EDITOR_STATE_KEYS + ("loaded_quotation",):
+        st.session_state.pop(key, None)
+
+# Values of the opened quotation (empty for a new sheet) used as widget defaults
+LOADED = st.session_state.get("loaded_quotation") or {}
+HDR = LOADED.get("general_info") or {}
+EXP = LOADED.get("export_expenses") or {}
+INT = LOADED.get("interests") or {}
+
+def saved(section, field, default):
+    """Stored value of an opened quotation, or the new-sheet default."""
+    value = section.get(field)
+    return default if value in (None, "") else value
+
+def saved_date(section, field, default):
+    value = section.get(field)
+    return date.fromisoformat(value[:10]) if value else default
+
+def option_index(options, value, default=0):
+    return options.index(value) if value in options else default
+
+# Reverse lookups for the stored codes / names
+CUSTOMER_DISPLAY_BY_CODE = MASTER.customer_display_by_code
+PORT_DISPLAY_BY_NAME = MASTER.port_display_by_name
+
+# --- Sections as fragments ---
+# Each numbered section is an st.fragment: a widget change reruns only that
+# section instead of the whole page. Values other sections need are published
+# to st.session_state.sheet[<section>]; the summary and save fragments read
+# them back from there. Widgets that feed the costing also rerun the summary.
+
+def publish(section, **values):
+    st.session_state.setdefault("sheet", {})[section] = values
+
+def sheet(section):
+    return st.session_state.sheet[section]
+
+def rerun_with_summary(section, *readers):
+    """
+    on_change callback: rerun only the edited section, the sections that read
+    its published values (readers) and the cost summary.
+    """
+    return lambda: st.rerun([section, *readers, "summary"])
+
+def section_fragment(key):
+    """st.fragment(key=key) that records its last run time (ms) in session_state.section_timings."""
+    def decorate(func):
+        @functools.wraps(func)
+        def run():
+            start = time.perf_counter()
+            try:
+                func()
+            finally:
+                timings = st.session_state.setdefault("section_timings", {})
+                timings[key] = round((time.perf_counter() - start) * 1000, 1)
+        return st.fragment(run, key=key)
+    return decorate
+
+# --- Paged line editors (large quotations) ---
+# Production / Loading / Remark tables have any number of lines and are edited
+# one page at a time. Each edit is merged into the full table in the widget
+# callback, and the editor key is bumped so the next run starts from the merged
+# table with no pending edits (rows added / deleted are never applied twice).
+LINE_PAGE_SIZE = 100
+
+def editor_key(name):
+    return f"{name}_{st.session_state.get(name + '_rev', 0)}"
+
+def commit_editor_page(data_key, name, start, number_col, blank, rerun_scope=None):
+    """on_change of a paged editor: apply its edits / added / deleted rows to the full table."""
+    delta = st.session_state[editor_key(name)]
+    data = st.session_state[data_key]
+    page = data.iloc[start:start + LINE_PAGE_SIZE].copy()
+    for pos, changes in delta.get("edited_rows", {}).items():
+        for col, value in changes.items():
+            page.iloc[int(pos), page.columns.get_loc(col)] = value
+    page = page.drop(page.index[list(delta.get("deleted_rows", []))])
+    parts = [data.iloc[:start], page]
+    if delta.get("added_rows"):
+        parts.append(pd.DataFrame([{**blank, **row} for row in delta["added_rows"]], columns=data.columns))
+    parts.append(data.iloc[start + LINE_PAGE_SIZE:])
+    merged = pd.concat(parts, ignore_index=True)
+    merged[number_col] = np.arange(1, len(merged) + 1)
+    st.session_state[data_key] = merged
+    st.session_state[name + "_rev"] = st.session_state.get(name + "_rev", 0) + 1
+    if rerun_scope:
+        st.rerun(rerun_scope)
+
+def paged_line_editor(data_key, name, column_config, number_col, blank, rerun_scope=None):
+    """data_editor over one LINE_PAGE_SIZE page of st.session_state[data_key] (rows can be added / deleted)."""
+    data = st.session_state[data_key]
+    pages = max(1, math.ceil(len(data) / LINE_PAGE_SIZE))
+    page = 1
+    if pages > 1:
+        page = st.selectbox(f"Page ({len(data):,} lines)", range(1, pages + 1), key=f"{name}_page",
+                            format_func=lambda p: f"{p} / {pages}: lines {(p - 1) * LINE_PAGE_SIZE + 1}-{min(p * LINE_PAGE_SIZE, len(data))}")
+    start = (page - 1) * LINE_PAGE_SIZE
+    st.data_editor(
+        data.iloc[start:start + LINE_PAGE_SIZE],
+        column_config=column_config,
+        num_rows="dynamic",
+        use_container_width=True,
+        hide_index=True,
+        key=editor_key(name),
+        on_change=commit_editor_page,
+        args=(data_key, name, start, number_col, blank, rerun_scope)
+    )
+
+def search_picker(label, key, search, saved_display="", placeholder=None, on_change=None):
+    """
+    Type-ahead picker: a live search box plus a selectbox of the top matches only
+    (and the current choice). Widget keys: <key>_q, <key>_sel. Returns the chosen label.
+    """
+    query = st.text_input(label, key=f"{key}_q", type="search", live="200ms", placeholder=placeholder)
+    current = st.session_state.get(f"{key}_sel") or saved_display or ""
+    options = [""] + search(query, SEARCH_LIMIT) if query else [""]
+    if current and current not in options:
+        options.insert(1, current)
+    return st.selectbox(f"{label} (match)", options, key=f"{key}_sel", index=option_index(options, current),
+                        label_visibility="collapsed", on_change=on_change)
+
+# Shared FX rates: all currencies are downloaded in one batch in the background
+fx = get_fx_service()
+fx.track(CURRENCY_LIST)
 
 # --- UI START ---
 st.title("📝 Cost Sheet Management System")
 
+with st.expander("📂 Open Saved Quotation", expanded=False):
+    o1, o2, o3 = st.columns([3, 1, 1])
+    with o1:
+        open_doc_no = st.text_input("Document No. to open", key="open_doc_no")
+    with o2:
+        if st.button("Open", use_container_width=True) and open_doc_no.strip():
+            try:
+                payload = load_quotation(open_doc_no.strip())
+            except Exception as e:
+                payload = None
+                st.error(f"Error loading quotation: {e}")
+            else:
+                if payload is None:
+                    st.error("Document not found.")
+                else:
+                    open_quotation(payload)
+                    st.rerun()
+    with o3:
+        if st.button("🆕 New Cost Sheet", use_container_width=True):
+            new_quotation()
+            st.rerun()
+    if HDR:
+        st.caption(f"Editing saved quotation {HDR.get('doc_no')} (status: {HDR.get('status') or 'Draft'})")
+
 # --- 1. ข้อมูลทั่วไป ---
-st.markdown('<div class="section-header">1. ข้อมูลทั่วไป (General Information)</div>', unsafe_allow_html=True)
-
-# Row 1: Document & Trader & Team
-# Row 1: Document & Trader & Team
-c1_1, c1_2, c1_3, c1_4 = st.columns(4)
-with c1_1:
-    doc_no = st.text_input("Document No.", value=generate_default_doc_no())
-    trader_name = st.text_input("ชื่อ Trader")
-with c1_2:
-    doc_date = st.date_input("Document Date (Conclude)", value=date.today())
-    team = st.selectbox("Team", ["A1", "A2", "A3", "A4", "A5", "A6", "A7", "A8"])
-with c1_3:
-    cust1_display = st.selectbox("Customer1 (Importer)", CUSTOMER_LIST)
-    cust1 = CUSTOMER_MAP.get(cust1_display, "")
-    incoterm = st.selectbox("Incoterm", ["FOB", "CFR", "CIF", "EXW", "DDP"])
-with c1_4:
-    cust2_display = st.selectbox("Customer 2 (End Customer)", [""] + CUSTOMER_LIST)
-    cust2 = CUSTOMER_MAP.get(cust2_display, "")
-
-c5, c6 = st.columns(2)
-with c5:
-    ship_from = st.date_input("Shipment Date from", value=doc_date)
-with c6:
-    ship_to = st.date_input("Shipment Date to", value=date(2026, 5, 30))
-
-st.markdown("##### Exchange Rate Details")
-r1, r2, r3, r4, r5 = st.columns([1.5, 1.5, 1.5, 1.5, 1.5]) 
-with r1:
-    currency = st.selectbox("Currency", CURRENCY_LIST)
-
-# Helper to fetch rate
-def get_yahoo_rate(pair="THB=X"):
-    try:
-        ticker = yf.Ticker(pair)
-        hist = ticker.history(period="1d")
-        if not hist.empty:
-            return hist["Close"].iloc[-1]
-    except Exception as e:
-        st.error(f"Error fetching rate: {e}")
-    return None
-
-with r2:
-    if st.button("Get Spot Rate (Yahoo)"):
-        # Map currency to ticker (Approximation)
-        ticker_map = {"USD": "THB=X", "EUR": "EURTHB=X", "JPY": "JPYTHB=X"} 
-        target_ticker = ticker_map.get(currency, "THB=X")
-        fetched_rate = get_yahoo_rate(target_ticker)
-        if fetched_rate:
-            st.session_state['spot_val'] = fetched_rate
-            st.success(f"Fetched: {fetched_rate:.2f}")
-            
-    # Use session state for spot rate
-    if 'spot_val' not in st.session_state:
-        st.session_state['spot_val'] = 34.00
-    
-    spot_rate = st.number_input("Spot Rate", value=st.session_state['spot_val'], format="%.2f")
-
-with r3:
-    discount_rate = st.number_input("(-) Discount Rate", value=0.00, format="%.2f")
-with r4:
-    premium_rate = st.number_input("(+) Premium Rate", value=0.50, format="%.2f")
-with r5:
-    # Auto-calc
-    default_ex = spot_rate - discount_rate + premium_rate
-    ex_rate = st.number_input("Exchange Rate", value=default_ex, format="%.2f")
-
-# Destination Section (4 destinations)
-st.markdown("##### Destination")
-dest_col1, dest_col2, dest_col3, dest_col4 = st.columns(4)
-with dest_col1:
-    dest1_display = st.selectbox("Destination 1", [""] + PORT_DISPLAY_LIST, key="dest1_sel")
-    destination1 = PORT_MAP.get(dest1_display, "")
-with dest_col2:
-    dest2_display = st.selectbox("Destination 2", [""] + PORT_DISPLAY_LIST, key="dest2_sel")
-    destination2 = PORT_MAP.get(dest2_display, "")
-with dest_col3:
-    dest3_display = st.selectbox("Destination 3", [""] + PORT_DISPLAY_LIST, key="dest3_sel")
-    destination3 = PORT_MAP.get(dest3_display, "")
-with dest_col4:
-    dest4_display = st.selectbox("Destination 4", [""] + PORT_DISPLAY_LIST, key="dest4_sel")
-    destination4 = PORT_MAP.get(dest4_display, "")
+@section_fragment("general")
+def general_info_section():
+    st.markdown('<div class="section-header">1. ข้อมูลทั่วไป (General Information)</div>', unsafe_allow_html=True)
+    to_summary = rerun_with_summary("general")
+
+    # Row 1: Document & Trader & Team
+    c1_1, c1_2, c1_3, c1_4 = st.columns(4)
+    with c1_1:
+        # After a save the sheet keeps its number, so saving again updates the same quotation
+        doc_no = st.text_input("Document No.", value=st.session_state.get("saved_doc_no") or HDR.get("doc_no")
+                               or generate_default_doc_no())
+        trader_name = st.text_input("ชื่อ Trader", value=saved(HDR, "trader_name", ""))
+    with c1_2:
+        # Section 2 prices the export expenses as of the document date
+        doc_date = st.date_input("Document Date (Conclude)", value=saved_date(HDR, "doc_date", date.today()),
+                                 on_change=rerun_with_summary("general", "export"))
+        team_options = ["A1", "A2", "A3", "A4", "A5", "A6", "A7", "A8"]
+        team = st.selectbox("Team", team_options, index=option_index(team_options, HDR.get("team")))
+    with c1_3:
+        # Customer1 is also the default AR customer of section 3
+        cust1_display = search_picker("Customer1 (Importer)", "cust1", MASTER.search_customers,
+                                      CUSTOMER_DISPLAY_BY_CODE.get(HDR.get("customer_importer")), CUSTOMER_HINT,
+                                      on_change=rerun_with_summary("general", "interest"))
+        cust1 = CUSTOMER_MAP.get(cust1_display, "")
+        incoterm_options = ["FOB", "CFR", "CIF", "EXW", "DDP"]
+        incoterm = st.selectbox("Incoterm", incoterm_options, index=option_index(incoterm_options, HDR.get("incoterm")))
+    with c1_4:
+        cust2_display = search_picker("Customer 2 (End Customer)", "cust2", MASTER.search_customers,
+                                      CUSTOMER_DISPLAY_BY_CODE.get(HDR.get("customer_end_user")), CUSTOMER_HINT)
+        cust2 = CUSTOMER_MAP.get(cust2_display, "")
+
+    c5, c6 = st.columns(2)
+    with c5:
+        ship_from = st.date_input("Shipment Date from", value=saved_date(HDR, "ship_date_from", doc_date))
+    with c6:
+        ship_to = st.date_input("Shipment Date to", value=saved_date(HDR, "ship_date_to", date(2026, 5, 30)))
+
+    st.markdown("##### Exchange Rate Details")
+    r1, r2, r3, r4, r5 = st.columns([1.5, 1.5, 1.5, 1.5, 1.5])
+    with r1:
+        currency = st.selectbox("Currency", CURRENCY_LIST, index=option_index(CURRENCY_LIST, HDR.get("currency")),
+                                on_change=to_summary)
+
+    with r2:
+        if st.button("Get Spot Rate (Yahoo)", on_click=to_summary):
+            quote = fx.quote(currency)
+            if quote:
+                st.session_state['spot_val'] = quote["rate"]
+                as_of = datetime.fromtimestamp(quote["fetched_at"]).strftime("%d/%m %H:%M")
+                if quote["stale"]:
+                    st.warning(f"Last known rate: {quote['rate']:.2f} (as of {as_of}, refreshing...)")
+                else:
+                    st.success(f"Fetched: {quote['rate']:.2f} (as of {as_of})")
+            else:
+                st.warning(f"No rate for {currency} yet, try again in a moment.")
+        if st.button("Rate on Doc Date", on_click=to_summary):
+            # Historical fixing (master_fx_rates) for repricing at the document date
+            hist_rate = MASTER.fx_rate(currency, doc_date)
+            if np.isnan(hist_rate):
+                st.warning(f"No {currency} rate on or before {doc_date:%d/%m/%Y}.")
+            else:
+                st.session_state['spot_val'] = hist_rate
+                window_rate = MASTER.fx_history.average_rate(currency, ship_from, ship_to)
+                st.success(f"{doc_date:%d/%m/%Y}: {hist_rate:.2f} (shipment window avg {window_rate:.2f})")
+
+        # Use session state for spot rate
+        if 'spot_val' not in st.session_state:
+            st.session_state['spot_val'] = 34.00
+
+        spot_rate = st.number_input("Spot Rate", value=st.session_state['spot_val'], format="%.2f", on_change=to_summary)
+
+    with r3:
+        discount_rate = st.number_input("(-) Discount Rate", value=float(saved(HDR, "discount_rate", 0.00)), format="%.2f",
+                                        on_change=to_summary)
+    with r4:
+        premium_rate = st.number_input("(+) Premium Rate", value=float(saved(HDR, "premium_rate", 0.50)), format="%.2f",
+                                       on_change=to_summary)
+    with r5:
+        # Auto-calc
+        default_ex = spot_rate - discount_rate + premium_rate
+        ex_rate = st.number_input("Exchange Rate", value=float(saved(HDR, "exchange_rate", default_ex)), format="%.2f",
+                                  on_change=to_summary)
+
+    # Destination Section (4 destinations)
+    st.markdown("##### Destination")
+    dest_cols = st.columns(4)
+    dest_displays = []
+    for n, dest_col in enumerate(dest_cols, start=1):
+        with dest_col:
+            dest_displays.append(search_picker(f"Destination {n}", f"dest{n}", MASTER.search_ports,
+                                               PORT_DISPLAY_BY_NAME.get(HDR.get(f"dest_{n}")), PORT_HINT,
+                                               on_change=to_summary))
+    destinations = [PORT_MAP.get(display, "") for display in dest_displays]
+    # Great-circle distance from the origin port to all 4 destinations in one call
+    dest_km = MASTER.port_distances(ORIGIN_PORT, dest_displays)
+    for dest_col, km in zip(dest_cols, dest_km):
+        if not np.isnan(km):
+            dest_col.caption(f"≈ {km:,.0f} km ({km / KM_PER_NM:,.0f} nm) from {ORIGIN_PORT}")
+
+    publish("general", doc_no=doc_no, doc_date=doc_date, trader_name=trader_name, team=team,
+            cust1=cust1, cust2=cust2, incoterm=incoterm, ship_from=ship_from, ship_to=ship_to,
+            currency=currency, spot_rate=spot_rate, discount_rate=discount_rate,
+            premium_rate=premium_rate, ex_rate=ex_rate, destinations=destinations, dest_km=dest_km)
 
 # --- 2. Export Expense & Freight ---
-st.markdown('<div class="section-header">2. ค่าใช้จ่ายส่งออก (Export Expense & Freight)</div>', unsafe_allow_html=True)
-st.markdown('<div class="warning-text">⚠️ Export Expense** ค่าใช้จ่าย Export Expense เป็นค่าใช้จ่ายตามมาตรฐาน สามารถปรับได้ตามเกิดขึ้นจริง</div>', unsafe_allow_html=True)
-
-# Insurance Section
-st.write("**Insurance**")
-ins_type = st.radio("เงื่อนไขประกัน", [
-    "Non Africa: FOB/CFR (125% x Selling Price x 0.000098)", 
-    "Non Africa: CIF (110% x Selling Price x 0.00049)",
-    "Africa: FOB/CFR (125% x Selling Price x 0.000446)",
-    "Africa: CIF (110% x Selling Price x 0.00223)"
-], horizontal=True)
-
-# Placeholder for calculated insurance display
-ins_display = st.empty()
-st.write("---")
-
-# Container & Invoice Info
-col_size, col_cnt, col_inv, col_ton = st.columns([1.5, 1, 1, 1])
-with col_size:
-    container_size = st.selectbox("ขนาดตู้ Container", ['20"', '40"', '20" High Cube'])
-with col_cnt:
-    container_qty = st.number_input("จำนวนตู้ส่งออก (Container)", min_value=1, value=1)
-with col_inv:
-    invoice_qty = st.number_input("จำนวน Invoice", min_value=1, value=1)
-with col_ton:
-    ton_per_container = st.number_input("จำนวน Ton/ตู้", min_value=0.0, value=25.0, format="%.2f")
-
-# Group 1: Freight
-st.markdown('<div class="sub-section"><b>1. Freight (ค่าระวางเรือ)</b></div>', unsafe_allow_html=True)
-v_freight = st.number_input("Freight (ค่าระวางเรือระหว่างประเทศ)", value=0.0)
-
-# Group 2: Export Expense
-st.markdown('<div class="sub-section"><b>2. Export Expense (ค่าใช้จ่ายส่งออกตามกลุ่ม)</b></div>', unsafe_allow_html=True)
-e_col1, e_col2 = st.columns(2)
-
-with e_col1:
-    st.write("**Shipping & Transport**")
-    # Tiered Shipping Rate Calculation
-    applicable_rate = get_shipping_rate(container_qty)
-    v_shipping = st.number_input(f"ค่า Shipping ({applicable_rate:,.0f} บาท/ตู้)", value=float(container_qty * applicable_rate))
-    v_truck = st.number_input("ค่าขนย้าย-ส่งออก: หัวลาก/ผ่านท่า (8,300 บ./ตู้)", value=float(container_qty * 8300))
-    
-    st.write("**Survey & Inspection**")
-    v_survey_check = st.number_input("ค่าตรวจสอบ + รมยา (1,050 บาท/ตู้)", value=float(container_qty * 1050))
-    v_survey_vehicle = st.number_input("ค่าพาหนะไปรมยา (1,350 บาท/Inv)", value=float(invoice_qty * 1350))
-    
-
-
-with e_col2:
-    st.write("**Port Charges (ค่าระวางส่งออก)**")
-    v_thc = st.number_input("THC ค่าดำเนินการในท่าเรือต้นทาง (2,800 บาท/ตู้)", value=float(container_qty * 2800))
-    v_seal = st.number_input("Seal ค่าอุปกรณ์ล๊อคประตูตู้ (300 บาท/ตู้)", value=float(container_qty * 300))
-    v_bl_fee = st.number_input("B/L Fee ค่าเอกสาร B/L (2,000 บาท/Inv)", value=float(invoice_qty * 2000))
-    v_handling = st.number_input("Handling Charges ค่าดำเนินการ (1,000 บาท/Inv)", value=float(invoice_qty * 1000))
-
-# Documents Section
-st.markdown('<div class="sub-section"><b>3. ค่าเอกสารส่งออก (Export Documents)</b></div>', unsafe_allow_html=True)
-doc_col1, doc_col2 = st.columns(2)
-with doc_col1:
-    v_doc_prep = st.number_input("ค่าจัดทำเอกสาร (5,500 บ./Inv)", value=float(invoice_qty * 5500))
-    v_doc_agri = st.number_input("ค่าพาหนะจนท.เกษตร (1,000 บาท/Inv)", value=float(invoice_qty * 1000))
-    v_doc_phyto = st.number_input("ค่าป่วยการใบรับรองปลอดศัตรูพืช (200 บาท/Inv)", value=float(invoice_qty * 200))
-    v_doc_health = st.number_input("HEALTH CERTIFICATE (300 บาท/Inv)", value=float(invoice_qty * 300))
-    v_doc_origin = st.number_input("ค่าใบรับรองแหล่งกำเนิดสินค้า (208 บาท/Inv)", value=float(invoice_qty * 208))
-with doc_col2:
-    v_doc_ms24 = st.number_input("ค่าแบบพิมพ์/ค่าธรรมเนียม มส.24 (120 บาท/Inv)", value=float(invoice_qty * 120))
-    v_doc_chamber = st.number_input("ค่าใบรับรองเอกสารสภาหอการค้า (230 บาท/Inv)", value=float(invoice_qty * 230))
-    v_doc_dft = st.number_input("ค่าใบรับรองกรมการค้าต่างประเทศ (30 บาท/Inv)", value=float(invoice_qty * 30))
-
-# Other Expenses - 10 lines table
-st.markdown('<div class="sub-section"><b>4. ค่าใช้จ่ายอื่นๆ</b></div>', unsafe_allow_html=True)
-if 'other_expenses_data' not in st.session_state:
-    other_exp_init = []
-    for i in range(10):
-        other_exp_init.append({
-            "ลำดับ": i + 1,
-            "รายการค่าใช้จ่าย": "",
-            "จำนวนเงิน (USD/Ton)": 0.0
-        })
-    st.session_state.other_expenses_data = pd.DataFrame(other_exp_init)
-
-other_exp_cfg = {
-    "ลำดับ": st.column_config.NumberColumn(disabled=True, width="small"),
-    "รายการค่าใช้จ่าย": st.column_config.TextColumn(width="large"),
-    "จำนวนเงิน (USD/Ton)": st.column_config.NumberColumn(format="%.2f", width="medium")
+INSURANCE_MULTIPLIERS = {
+    "Non Africa: FOB/CFR (125% x Selling Price x 0.000098)": 1.25 * 0.000098,
+    "Non Africa: CIF (110% x Selling Price x 0.00049)": 1.10 * 0.00049,
+    "Africa: FOB/CFR (125% x Selling Price x 0.000446)": 1.25 * 0.000446,
+    "Africa: CIF (110% x Selling Price x 0.00223)": 1.10 * 0.00223
 }
 
-other_expenses_df = st.data_editor(
-    st.session_state.other_expenses_data,
-    column_config=other_exp_cfg,
-    num_rows="fixed",
-    use_container_width=True,
-    hide_index=True,
-    key="other_expenses_editor"
-)
+def expense_columns(groups, columns=2):
+    """Line positions split into `columns` runs of whole groups, balanced by line count."""
+    runs, start = [], 0
+    for end in range(1, len(groups) + 1):
+        if end == len(groups) or groups[end] != groups[start]:
+            runs.append(list(range(start, end)))
+            start = end
+    out, target = [[] for _ in range(columns)], len(groups) / columns
+    col = 0
+    for run in runs:
+        # Next column once most of this group would fall past the target
+        if out[col] and len(out[col]) + len(run) / 2 > target and col < columns - 1:
+            col += 1
+        out[col].extend(run)
+    return out
+
+def dest_freight_frame(dest_matrix):
+    """Destination 1-4 freight / insurance rows; a saved dest_matrix fills the chosen destinations in order."""
+    frame = pd.DataFrame({"ปลายทาง": [1, 2, 3, 4], "Freight (THB)": [None] * 4, "Insurance": [None] * 4})
+    if dest_matrix:
+        condition_by_rate = {rate: name for name, rate in INSURANCE_MULTIPLIERS.items()}
+        chosen = [n - 1 for n in range(1, 5) if HDR.get(f"dest_{n}")]
+        for row, freight, rate in zip(chosen, dest_matrix.get("freight", []), dest_matrix.get("insurance_rate", [])):
+            frame.loc[row, "Freight (THB)"] = freight
+            frame.loc[row, "Insurance"] = condition_by_rate.get(rate)
+    return frame.astype({"Freight (THB)": float})
+
+@section_fragment("export")
+def export_expense_section():
+    st.markdown('<div class="section-header">2. ค่าใช้จ่ายส่งออก (Export Expense & Freight)</div>', unsafe_allow_html=True)
+    st.markdown('<div class="warning-text">⚠️ Export Expense** ค่าใช้จ่าย Export Expense เป็นค่าใช้จ่ายตามมาตรฐาน สามารถปรับได้ตามเกิดขึ้นจริง</div>', unsafe_allow_html=True)
+    to_summary = rerun_with_summary("export")
+
+    # Insurance Section (amount is computed with the products table in the summary)
+    st.write("**Insurance**")
+    ins_type = st.radio("เงื่อนไขประกัน", list(INSURANCE_MULTIPLIERS), horizontal=True, on_change=to_summary)
+    st.write("---")
+
+    # Container & Invoice Info
+    col_size, col_cnt, col_inv, col_ton = st.columns([1.5, 1, 1, 1])
+    with col_size:
+        container_options = ['20"', '40"', '20" High Cube']
+        container_size = st.selectbox("ขนาดตู้ Container", container_options,
+                                      index=option_index(container_options, EXP.get("container_size")))
+    with col_cnt:
+        container_qty = st.number_input("จำนวนตู้ส่งออก (Container)", min_value=1, value=int(saved(EXP, "container_qty", 1)),
+                                        on_change=to_summary)
+    with col_inv:
+        invoice_qty = st.number_input("จำนวน Invoice", min_value=1, value=int(saved(EXP, "invoice_qty", 1)),
+                                      on_change=to_summary)
+    with col_ton:
+        ton_per_container = st.number_input("จำนวน Ton/ตู้", min_value=0.0, value=float(saved(EXP, "ton_per_container", 25.0)), format="%.2f",
+                                            on_change=to_summary)
+
+    # Group 1: Freight
+    st.markdown('<div class="sub-section"><b>1. Freight (ค่าระวางเรือ)</b></div>', unsafe_allow_html=True)
+    v_freight = st.number_input("Freight (ค่าระวางเรือระหว่างประเทศ)", value=float(saved(EXP, "freight_cost", 0.0)), on_change=to_summary)
+
+    # Freight / insurance per destination (blank = the Freight above / the insurance condition chosen above)
+    if 'dest_freight_data' not in st.session_state:
+        st.session_state.dest_freight_data = dest_freight_frame(EXP.get("dest_matrix"))
+    dest_freight_df = st.data_editor(
+        st.session_state.dest_freight_data,
+        column_config={
+            "ปลายทาง": st.column_config.NumberColumn(disabled=True, width="small"),
+            "Freight (THB)": st.column_config.NumberColumn(format="%.2f", width="medium"),
+            "Insurance": st.column_config.SelectboxColumn(options=list(INSURANCE_MULTIPLIERS), width="large"),
+        },
+        num_rows="fixed",
+        use_container_width=True,
+        hide_index=True,
+        key="dest_freight_editor",
+        on_change=to_summary
+    )
+    dest_freight = dest_freight_df["Freight (THB)"].astype(float).fillna(v_freight).to_numpy()
+    dest_insurance_rate = dest_freight_df["Insurance"].map(INSURANCE_MULTIPLIERS).astype(float).fillna(
+        INSURANCE_MULTIPLIERS.get(ins_type, 0.0)).to_numpy()
+
+    # Group 2: Export Expense (lines, drivers and dated rates from master_export_expense)
+    st.markdown('<div class="sub-section"><b>2. Export Expense (ค่าใช้จ่ายส่งออกตามกลุ่ม)</b></div>', unsafe_allow_html=True)
+    # Tiered Shipping Rate Calculation
+    applicable_rate = get_shipping_rate(container_qty)
+    v_shipping = st.number_input(f"ค่า Shipping ({applicable_rate:,.0f} บาท/ตู้)", value=float(saved(EXP, "shipping_cost", float(container_qty * applicable_rate))), on_change=to_summary)
+
+    # Standard amount of every line in one rate x driver product, as of the document date; each stays editable
+    schedule = MASTER.export_expenses
+    doc_date = sheet("general")["doc_date"]
+    standard = schedule.amounts(doc_date, container_qty, invoice_qty, ton_per_container)
+    saved_lines = {**EXP, **(EXP.get("expense_lines") or {})}
+    expense_amounts = {}
+    for expense_col, positions in zip(st.columns(2), expense_columns(schedule.groups)):
+        with expense_col:
+            group = None
+            for i in positions:
+                if schedule.groups[i] != group:
+                    group = schedule.groups[i]
+                    st.write(f"**{group}**")
+                line = schedule.lines[i]
+                expense_amounts[line] = st.number_input(schedule.label(i, doc_date), value=float(saved(saved_lines, line, float(standard[i]))), on_change=to_summary)
+
+    # Other Expenses - 10 lines table
+    st.markdown('<div class="sub-section"><b>3. ค่าใช้จ่ายอื่นๆ</b></div>', unsafe_allow_html=True)
+    if 'other_expenses_data' not in st.session_state:
+        other_exp_init = []
+        for i in range(10):
+            other_exp_init.append({
+                "ลำดับ": i + 1,
+                "รายการค่าใช้จ่าย": "",
+                "จำนวนเงิน (USD/Ton)": 0.0
+            })
+        st.session_state.other_expenses_data = pd.DataFrame(other_exp_init)
 
-# Calculate total other expenses
-other_expense_value = other_expenses_df["จำนวนเงิน (USD/Ton)"].sum()
+    other_exp_cfg = {
+        "ลำดับ": st.column_config.NumberColumn(disabled=True, width="small"),
+        "รายการค่าใช้จ่าย": st.column_config.TextColumn(width="large"),
+        "จำนวนเงิน (USD/Ton)": st.column_config.NumberColumn(format="%.2f", width="medium")
+    }
 
-# Calculate totals
-port_charges_total = v_thc + v_seal + v_bl_fee + v_handling
-survey_total = v_survey_check + v_survey_vehicle
-docs_total = v_doc_agri + v_doc_phyto + v_doc_health + v_doc_origin + v_doc_ms24 + v_doc_chamber + v_doc_dft
+    other_expenses_df = st.data_editor(
+        st.session_state.other_expenses_data,
+        column_config=other_exp_cfg,
+        num_rows="fixed",
+        use_container_width=True,
+        hide_index=True,
+        key="other_expenses_editor",
+        on_change=to_summary
+    )
+
+    # Calculate total other expenses
+    other_expense_value = other_expenses_df["จำนวนเงิน (USD/Ton)"].sum()
+
+    publish("export", container_size=container_size, container_qty=container_qty, invoice_qty=invoice_qty,
+            ton_per_container=ton_per_container, ins_type=ins_type, v_freight=v_freight, v_shipping=v_shipping,
+            expense_amounts=expense_amounts, other_expenses_df=other_expenses_df,
+            dest_freight=dest_freight, dest_insurance_rate=dest_insurance_rate,
+            # Everything except insurance, which depends on the products table
+            total_excl_insurance=(v_freight + v_shipping + sum(expense_amounts.values()) + other_expense_value))
 
 # --- 3. Interest & Storage ---
-st.markdown('<div class="section-header">3. ดอกเบี้ยและคลังสินค้า (Interest & WH Storage)</div>', unsafe_allow_html=True)
-i_col1, i_col2 = st.columns(2)
-
-with i_col1:
-    st.write("**AR Interest**")
-    # Auto fill payment term
-    # AR Interest calculation usually needs a customer lookup
-    ar_customer_display = st.selectbox("เลือก Customer (จากลิสต์)", CUSTOMER_LIST, key="ar_cust")
-    ar_customer_code = CUSTOMER_MAP.get(ar_customer_display, "")
-    p_term_auto = CUSTOMER_TERMS_MAP.get(ar_customer_display, "N/A")
-    st.info(f"Payment Term (Auto): {p_term_auto}")
-    
-    p_term_ship = st.selectbox("Payment Term For Shipment", PAYMENT_LIST)
-    ar_rate = st.number_input("AR Interest Rate (%) (STD.2.4%)", value=0.0, key="ar_r")
-    ar_days = st.number_input("AR Interest Day (วัน)", value=0, key="ar_d")
-
-with i_col2:
-    st.write("**RM Interest & WH Storage**")
-    rm_rate = st.number_input("RM Interest Rate (%) (STD.2.5%)", value=0.0, key="rm_r")
-    rm_days = st.number_input("RM Interest Day (วัน)", value=0, key="rm_d")
-    
-    st.write("---")
-    wh_days = st.number_input("WH Storage Day (วัน) (30 บาท/เดือน/Ton)", value=30)
-    # Calculation for WH Storage: 30 THB / Ton / Month (Assume 30 days = 1 month)
-    # Will calculate in final step based on total quantity
+@section_fragment("interest")
+def interest_section():
+    st.markdown('<div class="section-header">3. ดอกเบี้ยและคลังสินค้า (Interest & WH Storage)</div>', unsafe_allow_html=True)
+    to_summary = rerun_with_summary("interest")
+    i_col1, i_col2 = st.columns(2)
+
+    with i_col1:
+        st.write("**AR Interest**")
+        # Auto fill payment term
+        # AR Interest calculation usually needs a customer lookup
+        # Left blank, the AR customer is Customer1 (no second lookup needed)
+        ar_customer_display = search_picker("เลือก Customer (จากลิสต์)", "ar_cust", MASTER.search_customers,
+                                            placeholder="Same as Customer1")
+        ar_customer_display = ar_customer_display or CUSTOMER_DISPLAY_BY_CODE.get(sheet("general")["cust1"], "")
+        p_term_auto = CUSTOMER_TERMS_MAP.get(ar_customer_display, "N/A")
+        st.info(f"Payment Term (Auto): {p_term_auto}")
+
+        p_term_ship = st.selectbox("Payment Term For Shipment", PAYMENT_LIST,
+                                   index=option_index(PAYMENT_LIST, INT.get("payment_term_ship")))
+        ar_rate = st.number_input("AR Interest Rate (%) (STD.2.4%)", value=float(saved(INT, "ar_rate", 0.0)), key="ar_r",
+                                  on_change=to_summary)
+        ar_days = st.number_input("AR Interest Day (วัน)", value=int(saved(INT, "ar_days", 0)), key="ar_d",
+                                  on_change=to_summary)
+
+    with i_col2:
+        st.write("**RM Interest & WH Storage**")
+        rm_rate = st.number_input("RM Interest Rate (%) (STD.2.5%)", value=float(saved(INT, "rm_rate", 0.0)), key="rm_r",
+                                  on_change=to_summary)
+        rm_days = st.number_input("RM Interest Day (วัน)", value=int(saved(INT, "rm_days", 0)), key="rm_d",
+                                  on_change=to_summary)
+
+        st.write("---")
+        wh_days = st.number_input("WH Storage Day (วัน) (30 บาท/เดือน/Ton)", value=int(saved(INT, "wh_days", 30)),
+                                  on_change=to_summary)
+        # Calculation for WH Storage: 30 THB / Ton / Month (Assume 30 days = 1 month)
+        # Will calculate in final step based on total quantity
+
+    publish("interest", p_term_auto=p_term_auto, p_term_ship=p_term_ship, ar_rate=ar_rate, ar_days=ar_days,
+            rm_rate=rm_rate, rm_days=rm_days, wh_days=wh_days)
 
 # --- 4. Details & Production Cost ---
-st.markdown('<div class="section-header">4. รายละเอียดสินค้าและต้นทุนผลิต (Production Cost)</div>', unsafe_allow_html=True)
-st.info("กรุณากรอกข้อมูลสินค้า (สามารถเพิ่มรายการได้สูงสุด 15 รายการ)")
-
-# Yield Loss % - default value (ไม่แสดงใน UI)
-yield_loss_pct = 0.0
-
-# Initialize Data v3 - ตามคอลัมน์จาก Master.xlsx sheet "ข้อมูลที่แสดงในหัวข้อที่ 4"
-# คอลัมน์ที่ต้องกรอก: Item, Product Name, Product RM, ราคา RM, PACKAGING, Group (0-6), Overhead (auto), Quantity, Factory Expense (auto), Commision, A&P, Agreement, Selling Price
-# คอลัมน์คำนวณ (แสดงในสรุป): Yield loss, Yield loss %, Freight, Export Expense, Total Cost, MarginCost, AR Interest, RM Interest, WH Storage, MarginCost After
-
-# Show loaded values from Master.xlsx
-st.info(f"📊 ค่าจาก Master.xlsx: Factory Expense = {FACTORY_EXPENSE_DEFAULT:.2f} | Overhead Groups: {list(OH_DATA.keys())}")
-
-if 'cost_data_v3' not in st.session_state:
-    # 15 Rows init, matching Master Input columns
-    init_data = []
-    for i in range(15):
-        init_data.append({
-            "Item": i+1,
-            "Product Name": f"Product {i+1}" if i==0 else "",
-            "Product RM": "",
-            "Group": 0,
-            "PACKAGING": 0.0,
-            "Brand": "",
-            "Pack Size": "",
-            "Quantity": 0.0,
-            "Commision": 0.0,
-            "A&P": 0.0,
-            "Agreement": 0.0,
-            "Other Cost": 0.0,
-            "Selling Price": 0.0
-        })
-    st.session_state.cost_data_v3 = pd.DataFrame(init_data)
-
-# Config for Editor - Matching Master Input editable fields
-column_cfg = {
-    "Item": st.column_config.NumberColumn(disabled=True, width="small"),
-    "Product Name": st.column_config.TextColumn(width="medium"),
-    "Product RM": st.column_config.SelectboxColumn(options=RM_LIST, width="medium"),
-    "Group": st.column_config.SelectboxColumn(options=[0,1,2,3,4,5,6], width="small", help="Overhead Group (0-6)"),
-    "PACKAGING": st.column_config.NumberColumn(format="%.2f", width="small"),
-    "Brand": st.column_config.TextColumn(width="small"),
-    "Pack Size": st.column_config.TextColumn(width="small"),
-    "Quantity": st.column_config.NumberColumn(format="%.2f", width="small"),
-    "Commision": st.column_config.NumberColumn(format="%.2f", width="small"),
-    "A&P": st.column_config.NumberColumn(format="%.2f", width="small"),
-    "Agreement": st.column_config.NumberColumn(format="%.2f", width="small"),
-    "Other Cost": st.column_config.NumberColumn(format="%.2f", width="small"),
-    "Selling Price": st.column_config.NumberColumn(format="%.2f", width="small")
+BLANK_COST_LINE = {
+    "Product Name": "", "Product RM": "", "Group": 0, "PACKAGING": 0.0, "Brand": "", "Pack Size": "",
+    "Quantity": 0.0, "Commision": 0.0, "A&P": 0.0, "Agreement": 0.0, "Other Cost": 0.0, "Selling Price": 0.0
 }
 
-# Apply auto-lookup: Update Overhead based on Group selection
-for idx in range(len(st.session_state.cost_data_v3)):
-    group_val = st.session_state.cost_data_v3.loc[idx, "Group"]
-    st.session_state.cost_data_v3.loc[idx, "Overhead"] = OH_DATA.get(group_val, 0.0)
-    st.session_state.cost_data_v3.loc[idx, "Factory Expense"] = FACTORY_EXPENSE_DEFAULT
-
-# Ensure stable order for Section 4
-st.session_state.cost_data_v3 = st.session_state.cost_data_v3.sort_values("Item")
-
-edited_df = st.data_editor(
-    st.session_state.cost_data_v3,
-    column_config=column_cfg,
-    num_rows="fixed", 
-    use_container_width=True,
-    hide_index=True, 
-    key="cost_editor_v3"
-)
-
-# Keep session state in sync
-st.session_state.cost_data_v3 = edited_df
+def import_cost_lines():
+    """Import button: append / replace production lines from the paste box or uploaded file."""
+    try:
+        raw = read_import(st.session_state.get("paste_lines", ""), st.session_state.get("import_lines_file"))
+        current = st.session_state.cost_data_v3
+        replace = st.session_state.get("import_mode") == "Replace all"
+        imported = cost_frame_from_import(raw, first_item=1 if replace else len(current) + 1)
+    except Exception as e:
+        st.session_state.import_message = ("error", f"Could not read the lines: {e}")
+        return
+    if imported.empty:
+        st.session_state.import_message = ("error", "No lines found.")
+        return
+    st.session_state.cost_data_v3 = imported if replace else pd.concat(
+        [current[list(imported.columns)], imported], ignore_index=True)
+    st.session_state.cost_editor_v3_rev = st.session_state.get("cost_editor_v3_rev", 0) + 1
+    st.session_state.paste_lines = ""
+    st.session_state.import_message = ("success", f"Imported {len(imported):,} lines.")
+    st.rerun(["production", "summary"])
+
+@section_fragment("production")
+def production_cost_section():
+    st.markdown('<div class="section-header">4. รายละเอียดสินค้าและต้นทุนผลิต (Production Cost)</div>', unsafe_allow_html=True)
+    st.info(f"กรุณากรอกข้อมูลสินค้า (เพิ่ม/ลบรายการได้ แสดงหน้าละ {LINE_PAGE_SIZE} รายการ)")
+
+    # Initialize Data v3 - ตามคอลัมน์จาก Master.xlsx sheet "ข้อมูลที่แสดงในหัวข้อที่ 4"
+    # คอลัมน์ที่ต้องกรอก: Item, Product Name, Product RM, ราคา RM, PACKAGING, Group (0-6), Overhead (auto), Quantity, Factory Expense (auto), Commision, A&P, Agreement, Selling Price
+    # คอลัมน์คำนวณ (แสดงในสรุป): Yield loss, Yield loss %, Freight, Export Expense, Total Cost, MarginCost, AR Interest, RM Interest, WH Storage, MarginCost After
+
+    # Show loaded values from Master.xlsx
+    st.info(f"📊 ค่าจาก Master.xlsx: Factory Expense = {FACTORY_EXPENSE_DEFAULT:.2f} | Overhead Groups: {list(OH_DATA.keys())}")
+
+    with st.expander("📋 Paste / Import Lines (Excel, CSV)", expanded=False):
+        st.caption("Columns: " + ", ".join(IMPORT_COLUMNS) + " (header row optional)")
+        st.text_area("Paste rows copied from Excel", key="paste_lines", height=120)
+        st.file_uploader("...or upload a CSV / Excel file", type=["csv", "xlsx"], key="import_lines_file")
+        st.radio("Imported lines", ["Append", "Replace all"], horizontal=True, key="import_mode")
+        st.button("Import Lines", on_click=import_cost_lines)
+        if "import_message" in st.session_state:
+            kind, message = st.session_state.pop("import_message")
+            getattr(st, kind)(message)
+
+    if 'cost_data_v3' not in st.session_state:
+        # 15 Rows init, matching Master Input columns
+        init_data = []
+        for i in range(15):
+            init_data.append({
+                "Item": i+1,
+                "Product Name": f"Product {i+1}" if i==0 else "",
+                "Product RM": "",
+                "Group": 0,
+                "PACKAGING": 0.0,
+                "Brand": "",
+                "Pack Size": "",
+                "Quantity": 0.0,
+                "Commision": 0.0,
+                "A&P": 0.0,
+                "Agreement": 0.0,
+                "Other Cost": 0.0,
+                "Selling Price": 0.0
+            })
+        st.session_state.cost_data_v3 = pd.DataFrame(init_data)
+
+    # Config for Editor - Matching Master Input editable fields
+    column_cfg = {
+        "Item": st.column_config.NumberColumn(disabled=True, width="small"),
+        "Product Name": st.column_config.TextColumn(width="medium"),
+        "Product RM": st.column_config.SelectboxColumn(options=RM_LIST, width="medium"),
+        "Group": st.column_config.SelectboxColumn(options=[0,1,2,3,4,5,6], width="small", help="Overhead Group (0-6)"),
+        "PACKAGING": st.column_config.NumberColumn(format="%.2f", width="small"),
+        "Brand": st.column_config.TextColumn(width="small"),
+        "Pack Size": st.column_config.TextColumn(width="small"),
+        "Quantity": st.column_config.NumberColumn(format="%.2f", width="small"),
+        "Commision": st.column_config.NumberColumn(format="%.2f", width="small"),
+        "A&P": st.column_config.NumberColumn(format="%.2f", width="small"),
+        "Agreement": st.column_config.NumberColumn(format="%.2f", width="small"),
+        "Other Cost": st.column_config.NumberColumn(format="%.2f", width="small"),
+        "Selling Price": st.column_config.NumberColumn(format="%.2f", width="small"),
+        "Overhead": st.column_config.NumberColumn(format="%.2f", width="small", disabled=True),
+        "Factory Expense": st.column_config.NumberColumn(format="%.2f", width="small", disabled=True)
+    }
 
-# After editing, update Overhead based on new Group values
-for idx in edited_df.index:
-    group_val = edited_df.loc[idx, "Group"]
-    edited_df.loc[idx, "Overhead"] = OH_DATA.get(group_val, 0.0)
-    edited_df.loc[idx, "Factory Expense"] = FACTORY_EXPENSE_DEFAULT
+    # Auto-lookup: Overhead from the Group column, Factory Expense from master (whole column at once)
+    cost_data = st.session_state.cost_data_v3.sort_values("Item", ignore_index=True)
+    cost_data["Overhead"] = cost_data["Group"].map(OH_DATA).fillna(0.0)
+    cost_data["Factory Expense"] = FACTORY_EXPENSE_DEFAULT
+    st.session_state.cost_data_v3 = cost_data
 
+    paged_line_editor("cost_data_v3", "cost_editor_v3", column_cfg, "Item", BLANK_COST_LINE,
+                      rerun_scope=["production", "summary"])
 
+    publish("production", edited_df=st.session_state.cost_data_v3)
 
 # --- CALCULATIONS BASED ON MASTER CALCULATOR ---
-total_qty_all = edited_df["Quantity"].sum()
-results = []
-
-# Insurance Calculation Logic (Automated)
-# Moved here because it depends on edited_df (Products Table)
-ins_multipliers = {
-    "Non Africa: FOB/CFR (125% x Selling Price x 0.000098)": 1.25 * 0.000098,
-    "Non Africa: CIF (110% x Selling Price x 0.00049)": 1.10 * 0.00049,
-    "Africa: FOB/CFR (125% x Selling Price x 0.000446)": 1.25 * 0.000446,
-    "Africa: CIF (110% x Selling Price x 0.00223)": 1.10 * 0.00223
-}
-
-multiplier = ins_multipliers.get(ins_type, 0.0)
-total_selling_thb = (edited_df["Selling Price"] * edited_df["Quantity"]).sum() * ex_rate
-v_insurance = total_selling_thb * multiplier
+# Reruns after any costing input of sections 1-4 changes (see rerun_with_summary)
+@section_fragment("summary")
+def cost_summary_section():
+    general, export, interest = sheet("general"), sheet("export"), sheet("interest")
+    edited_df = sheet("production")["edited_df"]
+    ex_rate = general["ex_rate"]
+
+    # Per-line costing (RM price -> margin after) incl. the insurance on the products'
+    # selling value; the model keeps its intermediate values and recomputes only
+    # the lines / totals invalidated since the last rerun (see costing.py)
+    if "cost_model" not in st.session_state:
+        st.session_state.cost_model = CostSheetModel(EDITOR_COLUMNS)
+    model = st.session_state.cost_model
+    summary_df = model.update(
+        edited_df, MASTER, general["doc_date"], ex_rate,
+        export_expense_total=export["total_excl_insurance"],
+        insurance_rate=INSURANCE_MULTIPLIERS.get(export["ins_type"], 0.0),
+        factory_expense_rate=FACTORY_EXPENSE_DEFAULT,
+        ar_rate=interest["ar_rate"], ar_days=interest["ar_days"],
+        rm_rate=interest["rm_rate"], rm_days=interest["rm_days"],
+        wh_days=interest["wh_days"]
+    )
+    v_insurance = model.value("insurance")
+
+    # Line x destination matrix: only freight / insurance differ, broadcast over the same lines
+    chosen = [n for n, name in enumerate(general["destinations"]) if name]
+    matrix = destination_matrix(
+        model, [f"{n + 1}. {general['destinations'][n]}" for n in chosen],
+        export["dest_freight"][chosen], export["dest_insurance_rate"][chosen], base_freight=export["v_freight"]
+    )
+    dest_matrix = (pack_destination_matrix(matrix, export["dest_freight"][chosen], export["dest_insurance_rate"][chosen])
+                   if chosen else None)
 
-# Update the display in Section 2 (using placeholder defined earlier)
-ins_display.info(f"**ค่าเบี้ยประกันส่งออก (Insurance) คำนวณอัตโนมัติ:** {v_insurance:,.2f} บาท")
+    st.write("---")
+    st.info(f"**ค่าเบี้ยประกันส่งออก (Insurance) คำนวณอัตโนมัติ:** {v_insurance:,.2f} บาท")
+    publish("summary", v_insurance=v_insurance, results=summary_df.to_dict("records"), dest_matrix=dest_matrix)
 
-# Total Export Expenses Combined (THB)
-total_export_exp_combined = (v_freight + v_shipping + v_truck + survey_total + v_insurance + 
-                              docs_total + v_doc_prep + port_charges_total + other_expense_value)
+    if not summary_df.empty:
+        st.subheader("สรุปต้นทุนและกำไร (Cost & Margin Summary)")
+        st.dataframe(summary_df, use_container_width=True, hide_index=True)
 
-# Fetch Overhead table for Yield Loss and rate
-overhead_table = fetch_overhead()
-oh_yield_map = {item['group_number']: (float(item['overhead_rate']), float(item['yield_loss_percent'])) for item in overhead_table}
+        # Grand Totals
+        grand_total_cost = (summary_df["Total Cost"] * summary_df["Quantity"]).sum()
+        grand_total_curr = grand_total_cost / ex_rate if ex_rate > 0 else 0
 
-for index, row in edited_df.iterrows():
-    qty = row.get("Quantity", 0.0)
-    prod_rm = row.get("Product RM", "")
-    
-    # Filter empty rows
-    if qty <= 0 and not row.get("Product Name") and not prod_rm:
-        continue
-
-    # 1. RM Price Lookup & Conversion
-    # Formula: ((Auto look up price)*1000)/Exchange Rate
-    base_price = get_rm_base_price(prod_rm, doc_date.strftime('%b.%y'))
-    rm_price = (base_price * 1000 / ex_rate) if ex_rate > 0 else (base_price * 1000)
-    
-    # 2. Yield Loss Lookup
-    g_num = row.get("Group", 0)
-    oh_rate, y_loss_pct = oh_yield_map.get(g_num, (0.0, 0.0))
-    # Note: In Master Calculator example, Group 3 has y_loss_pct = 0.95 and Yield loss = Price / 0.95
-    yield_loss_cost = (rm_price / y_loss_pct) if y_loss_pct > 0 else rm_price
-    
-    # 3. BP = (Yield loss - RM Price) / 3
-    bp_val = (yield_loss_cost - rm_price) / 3
-    
-    # 4. RM Net Yield = Yield loss - BP
-    rm_net_yield = yield_loss_cost - bp_val
-    
-    # 5. PACKAGING, Overhead, Factory Expense (already converted in Master Calculator? no, usually per unit)
-    # The image/Excel suggests these are also unit costs.
-    # Overhead: Auto lookup and convert: (Rate * 1000) / Exchange Rate
-    overhead_val = (oh_rate * 1000 / ex_rate) if ex_rate > 0 else (oh_rate * 1000)
-    # Factory Expense: Auto from master and convert: (Rate * 1000) / Exchange Rate
-    factory_exp_val = (FACTORY_EXPENSE_DEFAULT * 1000 / ex_rate) if ex_rate > 0 else (FACTORY_EXPENSE_DEFAULT * 1000)
-    
-    # 6. Export Expense (Unit)
-    # Formula: ((Export Expense + Documents + ...)/Exchange Rate)/Quantity
-    unit_export_exp = 0.0
-    if total_qty_all > 0 and ex_rate > 0:
-        unit_export_exp = (total_export_exp_combined / total_qty_all) / ex_rate
-    
-    # Other components
-    c_pkg = row.get("PACKAGING", 0.0)
-    c_comm = row.get("Commision", 0.0)
-    c_ap = row.get("A&P", 0.0)
-    c_agree = row.get("Agreement", 0.0)
-    c_other = row.get("Other Cost", 0.0)
-    selling = row.get("Selling Price", 0.0)
-
-    # 7. Total Cost
-    # RM Net Yield+ PACKAGING+ Overhead+ Factory Expense+ Freight+ Export Expense+Commission+ A&P+Agreemen+ Other Cost
-    total_cost = (rm_net_yield + c_pkg + overhead_val + factory_exp_val + 
-                  unit_export_exp + c_comm + c_ap + c_agree + c_other)
-    
-    # 8. MarginCost
-    margin_cost = selling - total_cost
-    
-    # 9. Interests (Per Unit) - Based on Master Calculator.xlsx formulas
-    # Formula: ((Selling Price * Rate %) / 365) * Days
-    unit_ar_int = (selling * (ar_rate / 100) / 365) * ar_days if ar_days > 0 else 0.0
-    unit_rm_int = (selling * (rm_rate / 100) / 365) * rm_days if rm_days > 0 else 0.0
-    
-    # 10. WH Storage (Total for the container/lot)
-    # Formula in Master Calculator: (WH Storage Day * Quantity * (30/30)) / Exchange Rate
-    # Note: (30/30) appears to be 1 Baht per Ton per Day.
-    total_wh_storage = (wh_days * qty * 1.0) / ex_rate if (qty > 0 and ex_rate > 0) else 0.0
-    
-    # 11. Margin After (Per Unit) - Following Excel formula exactly: 
-    # Formula: MarginCost - AR Interest - RM Interest - WH Storage
-    # Note: Excel subtracts the TOTAL storage from the UNIT margin.
-    margin_after_unit = margin_cost - unit_ar_int - unit_rm_int - total_wh_storage
-    
-    # Also calculate totals for the summary table
-    total_ar_int = unit_ar_int * qty
-    total_rm_int = unit_rm_int * qty
-    margin_after_total = margin_after_unit * qty
-
-    results.append({
-        "Item": row["Item"],
-        "Product Name": row["Product Name"],
-        "Product RM": prod_rm,
-        "RM Price": round(rm_price, 2),
-        "Group (0-6)": g_num,
-        "Yield loss %": y_loss_pct,
-        "Yield loss": round(yield_loss_cost, 2),
-        "BP": round(bp_val, 2),
-        "RM Net Yield": round(rm_net_yield, 2),
-        "PACKAGING": c_pkg,
-        "Brand": row["Brand"],
-        "Pack Size": row["Pack Size"],
-        "Overhead": round(overhead_val, 2),
-        "Quantity": qty,
-        "Factory Expense": round(factory_exp_val, 2),
-        "Export Expense": round(unit_export_exp, 2),
-        "Commision": c_comm,
-        "A&P": c_ap,
-        "Agreement": c_agree,
-        "Other Cost": c_other,
-        "Total Cost": round(total_cost, 2),
-        "Selling Price": selling,
-        "MarginCost (Unit)": round(margin_cost, 2),
-        "AR Interest (Unit)": round(unit_ar_int, 2),
-        "RM Interest (Unit)": round(unit_rm_int, 2),
-        "WH Storage (Total)": round(total_wh_storage, 2),
-        "Margin After (Unit)": round(margin_after_unit, 2)
-    })
+        st.markdown(f"""
+        <div class="total-card">
+            <h3>Grand Total Cost: {grand_total_curr:,.2f} {general["currency"]}</h3>
+        </div>
+        """, unsafe_allow_html=True)
 
-
-summary_df = pd.DataFrame(results)
-
-if not summary_df.empty:
-    st.write("---")
-    st.subheader("สรุปต้นทุนและกำไร (Cost & Margin Summary)")
-    st.dataframe(summary_df, use_container_width=True, hide_index=True)
-    
-    # Grand Totals
-    grand_total_cost = (summary_df["Total Cost"] * edited_df.loc[summary_df.index, "Quantity"]).sum()
-    grand_total_curr = grand_total_cost / ex_rate if ex_rate > 0 else 0
-    
-    st.markdown(f"""
-    <div class="total-card">
-        <h3>Grand Total Cost: {grand_total_curr:,.2f} {currency}</h3>
-    </div>
-    """, unsafe_allow_html=True)
+        if chosen:
+            st.subheader("ต้นทุนและกำไรตามปลายทาง (Cost & Margin by Destination)")
+            st.dataframe(matrix, use_container_width=True)
 
 # --- Remark Section (20 lines) - Moved to end ---
-st.markdown('<div class="remark-section"><b>📝 Remark</b></div>', unsafe_allow_html=True)
-if 'remark_data' not in st.session_state:
-    st.session_state.remark_data = pd.DataFrame({
-        "No.": list(range(1, 21)),
-        "Remark": [""] * 20
-    })
+@section_fragment("remark")
+def remark_section():
+    st.markdown('<div class="remark-section"><b>📝 Remark</b></div>', unsafe_allow_html=True)
+    if 'remark_data' not in st.session_state:
+        st.session_state.remark_data = pd.DataFrame({
+            "No.": list(range(1, 21)),
+            "Remark": [""] * 20
+        })
 
-remark_cfg = {
-    "No.": st.column_config.NumberColumn(disabled=True, width="small"),
-    "Remark": st.column_config.TextColumn(width="large")
-}
+    remark_cfg = {
+        "No.": st.column_config.NumberColumn(disabled=True, width="small"),
+        "Remark": st.column_config.TextColumn(width="large")
+    }
 
-remark_df = st.data_editor(
-    st.session_state.remark_data,
-    column_config=remark_cfg,
-    num_rows="fixed",
-    use_container_width=True,
-    hide_index=True,
-    key="remark_editor"
-)
+    paged_line_editor("remark_data", "remark_editor", remark_cfg, "No.", {"Remark": ""})
+    publish("remark", remark_df=st.session_state.remark_data)
 
 # --- Loading Table (จัดโหลด) 15 rows x 7 columns - Moved to end ---
-st.markdown('<div class="loading-section"><b>📦 จัดโหลด (Loading)</b></div>', unsafe_allow_html=True)
-if 'loading_data' not in st.session_state:
-    loading_init = []
-    for i in range(15):
-        loading_init.append({
-            "No.": i + 1,
-            "รายการสินค้า": "",
-            "จำนวน (ลัง/กล่อง)": 0,
-            "น้ำหนัก/หน่วย (KG)": 0.0,
-            "น้ำหนักรวม (KG)": 0.0,
-            "ตู้ที่": "",
-            "หมายเหตุ": ""
-        })
-    st.session_state.loading_data = pd.DataFrame(loading_init)
-
-loading_cfg = {
-    "No.": st.column_config.NumberColumn(disabled=True, width="small"),
-    "รายการสินค้า": st.column_config.TextColumn(width="medium"),
-    "จำนวน (ลัง/กล่อง)": st.column_config.NumberColumn(format="%d", width="small"),
-    "น้ำหนัก/หน่วย (KG)": st.column_config.NumberColumn(format="%.2f", width="small"),
-    "น้ำหนักรวม (KG)": st.column_config.NumberColumn(format="%.2f", width="small"),
-    "ตู้ที่": st.column_config.TextColumn(width="small"),
-    "หมายเหตุ": st.column_config.TextColumn(width="medium")
-}
-
-# Ensure stable order for Loading Table
-st.session_state.loading_data = st.session_state.loading_data.sort_values("No.")
+@section_fragment("loading")
+def loading_section():
+    st.markdown('<div class="loading-section"><b>📦 จัดโหลด (Loading)</b></div>', unsafe_allow_html=True)
+    if 'loading_data' not in st.session_state:
+        loading_init = []
+        for i in range(15):
+            loading_init.append({
+                "No.": i + 1,
+                "รายการสินค้า": "",
+                "จำนวน (ลัง/กล่อง)": 0,
+                "น้ำหนัก/หน่วย (KG)": 0.0,
+                "น้ำหนักรวม (KG)": 0.0,
+                "ตู้ที่": "",
+                "หมายเหตุ": ""
+            })
+        st.session_state.loading_data = pd.DataFrame(loading_init)
+
+    loading_cfg = {
+        "No.": st.column_config.NumberColumn(disabled=True, width="small"),
+        "รายการสินค้า": st.column_config.TextColumn(width="medium"),
+        "จำนวน (ลัง/กล่อง)": st.column_config.NumberColumn(format="%d", width="small"),
+        "น้ำหนัก/หน่วย (KG)": st.column_config.NumberColumn(format="%.2f", width="small"),
+        "น้ำหนักรวม (KG)": st.column_config.NumberColumn(format="%.2f", width="small"),
+        "ตู้ที่": st.column_config.TextColumn(width="small"),
+        "หมายเหตุ": st.column_config.TextColumn(width="medium")
+    }
 
-loading_df = st.data_editor(
-    st.session_state.loading_data,
-    column_config=loading_cfg,
-    num_rows="fixed",
-    use_container_width=True,
-    hide_index=True,
-    key="loading_editor"
-)
+    # Ensure stable order for Loading Table
+    st.session_state.loading_data = st.session_state.loading_data.sort_values("No.", ignore_index=True)
 
-# Keep session state in sync
-st.session_state.loading_data = loading_df
+    paged_line_editor("loading_data", "loading_editor", loading_cfg, "No.", {
+        "รายการสินค้า": "", "จำนวน (ลัง/กล่อง)": 0, "น้ำหนัก/หน่วย (KG)": 0.0,
+        "น้ำหนักรวม (KG)": 0.0, "ตู้ที่": "", "หมายเหตุ": ""
+    })
+    publish("loading", loading_df=st.session_state.loading_data)
 
 # --- Save Section ---
-st.markdown("---")
-st.header("💾 บันทึกข้อมูล (Save Data)")
+@section_fragment("save")
+def save_section():
+    st.markdown("---")
+    st.header("💾 บันทึกข้อมูล (Save Data)")
+
+    general, export, interest = sheet("general"), sheet("export"), sheet("interest")
+    if st.button("Save to Database", type="primary"):
+        try:
+            from supabase_client import save_quotation_diff
+
+            # 1. Prepare Header Data (trx_general_infos)
+            destination1, destination2, destination3, destination4 = general["destinations"]
+            general_info = {
+                "doc_no": general["doc_no"],
+                "doc_date": str(general["doc_date"]),
+                "trader_name": general["trader_name"],
+                "team": general["team"],
+                "customer_importer": general["cust1"],
+                "customer_end_user": general["cust2"],
+                "incoterm": general["incoterm"],
+
+                "ship_date_from": str(general["ship_from"]),
+                "ship_date_to": str(general["ship_to"]),
+                "currency": general["currency"],
+                "spot_rate": general["spot_rate"],
+                "discount_rate": general["discount_rate"],
+                "premium_rate": general["premium_rate"],
+                "exchange_rate": general["ex_rate"],
+                "dest_1": destination1,
+                "dest_2": destination2,
+                "dest_3": destination3,
+                "dest_4": destination4
+            }
 
-if st.button("Save to Database", type="primary"):
-    try:
-        from supabase_client import save_quotation
-        
-        # 1. Prepare Header Data (trx_general_infos)
-        # Note: Ensure all variables (doc_no, cust1, etc.) are available from earlier in the script
-        general_info = {
-            "doc_no": doc_no,
-            "doc_date": str(doc_date),
-            "trader_name": trader_name,
-            "team": team,
-            "customer_importer": cust1,
-            "customer_end_user": cust2,
-            "incoterm": incoterm,
-
-            "ship_date_from": str(ship_from),
-            "ship_date_to": str(ship_to),
-            "currency": currency,
-            "spot_rate": spot_rate,
-            "discount_rate": discount_rate,
-            "premium_rate": premium_rate,
-            "exchange_rate": ex_rate,
-            "dest_1": destination1,
-            "dest_2": destination2,
-            "dest_3": destination3,
-            "dest_4": destination4
-        }
-        
-        # 2. Prepare Export Expense Data (trx_export_expenses)
-        export_expenses = {
-            "container_size": container_size,
-            "container_qty": int(container_qty),
-            "invoice_qty": int(invoice_qty),
-            "ton_per_container": ton_per_container,
-            "freight_cost": v_freight,
-            "shipping_cost": v_shipping,
-            "truck_cost": v_truck,
-            "survey_check_cost": v_survey_check,
-            "survey_vehicle_cost": v_survey_vehicle,
-            "insurance_cost": v_insurance,
-            "thc_cost": v_thc,
-            "seal_cost": v_seal,
-            "bl_fee": v_bl_fee,
-            "handling_fee": v_handling,
-            "doc_prep_fee": v_doc_prep,
-            "doc_agri_fee": v_doc_agri,
-            "doc_phyto_fee": v_doc_phyto,
-            "doc_health_fee": v_doc_health,
-            "doc_origin_fee": v_doc_origin,
-            "doc_ms24_fee": v_doc_ms24,
-            "doc_chamber_fee": v_doc_chamber,
-            "doc_dft_fee": v_doc_dft
-        }
-        
-        # 3. Prepare Interest Data (trx_interests)
-        interests = {
-            "payment_term_auto": p_term_auto,
-            "payment_term_ship": p_term_ship,
-            "ar_rate": ar_rate,
-            "ar_days": int(ar_days),
-            "rm_rate": rm_rate,
-            "rm_days": int(rm_days),
-            "wh_days": int(wh_days)
-        }
-        
-        # 4. Prepare Production Costs (trx_production_costs) mapped from results
-        production_costs = []
-        for r in results:
-            item = {
-                "item_order": r["Item"],
-                "product_name": r["Product Name"],
-                "product_rm": r["Product RM"],
-                "rm_price_snapshot": r["RM Price"],
-                "yield_loss_pct": r["Yield loss %"],
-                "yield_loss_val": r["Yield loss"],
-                "bp_val": r["BP"],
-                "rm_net_yield": r["RM Net Yield"],
-                "packaging": r["PACKAGING"],
-                "brand": r["Brand"],
-                "pack_size": r["Pack Size"],
-                "overhead_group": r["Group (0-6)"],
-                "overhead_val": r["Overhead"],
-                "quantity": r["Quantity"],
-                "factory_expense": r["Factory Expense"],
-                "freight_val": 0.0, # Not explicitly in results dict, handled in export expense usually, or calculated
-                "export_expense": r["Export Expense"],
-                "commission": r["Commision"],
-                "ap_expense": r["A&P"],
-                "agreement": r["Agreement"],
-                "other_cost": r["Other Cost"],
-                "total_cost": r["Total Cost"],
-                "selling_price": r["Selling Price"],
-                "margin_cost": r["MarginCost (Unit)"],
-                "ar_interest": r["AR Interest (Unit)"],
-                "rm_interest": r["RM Interest (Unit)"],
-                "wh_storage": r["WH Storage (Total)"],
-                "margin_after": r["Margin After (Unit)"],
-                "status": "Draft"
+            # 2. Prepare Export Expense Data (trx_export_expenses)
+            other_expenses_df = export["other_expenses_df"]
+            export_expenses = {
+                "container_size": export["container_size"],
+                "container_qty": int(export["container_qty"]),
+                "invoice_qty": int(export["invoice_qty"]),
+                "ton_per_container": export["ton_per_container"],
+                "freight_cost": export["v_freight"],
+                "shipping_cost": export["v_shipping"],
+                "insurance_cost": sheet("summary")["v_insurance"],
+                # Standard lines keep their own columns; every line is also kept in expense_lines
+                **{line: amount for line, amount in export["expense_amounts"].items() if line in EXPORT_EXPENSE_COLUMNS},
+                "expense_lines": export["expense_amounts"],
+                "dest_matrix": sheet("summary")["dest_matrix"],
+                "other_expenses": [
+                    {"order_no": int(row["ลำดับ"]), "description": row["รายการค่าใช้จ่าย"],
+                     "amount": float(row["จำนวนเงิน (USD/Ton)"])}
+                    for _, row in other_expenses_df.iterrows()
+                    if row["รายการค่าใช้จ่าย"] or row["จำนวนเงิน (USD/Ton)"]
+                ]
             }
-            production_costs.append(item)
-            
-        # 5. Prepare Loadings
-        loadings = []
-        for idx, row in loading_df.iterrows():
-            if row["รายการสินค้า"]: # Only add if product name exists
-                loadings.append({
-                    "order_no": row["No."],
-                    "product_name": row["รายการสินค้า"],
-                    "qty_cartons": int(row["จำนวน (ลัง/กล่อง)"]),
-                    "weight_per_unit": float(row["น้ำหนัก/หน่วย (KG)"]),
-                    "total_weight": float(row["น้ำหนักรวม (KG)"]),
-                    "container_no": row["ตู้ที่"],
-                    "remark": row["หมายเหตุ"]
-                })
-                
-        # 6. Prepare Remarks
-        remarks = []
-        for idx, row in remark_df.iterrows():
-            if row["Remark"]:
-                remarks.append({
-                    "order_no": row["No."],
-                    "remark_text": row["Remark"]
-                })
-
-        # Bundle everything
-        full_data = {
-            "general_info": general_info,
-            "export_expenses": export_expenses,
-            "interests": interests,
-            "production_costs": production_costs,
-            "loadings": loadings,
-            "remarks": remarks
-        }
-        
-        # Call API
-        quotation_id = save_quotation(full_data)
-        st.success(f"✅ Saved successfully! Quotation ID: {quotation_id}")
-        st.balloons()
-        
-    except Exception as e:
-        st.error(f"❌ Error saving data: {str(e)}")
 
-st.write("---")
-if st.button("💾 บันทึกเอกสาร Cost Sheet", use_container_width=True):
-    st.success(f"บันทึกข้อมูล {doc_no} เรียบร้อยแล้ว")
\ No newline at end of file
+            # 3. Prepare Interest Data (trx_interests)
+            interests = {
+                "payment_term_auto": interest["p_term_auto"],
+                "payment_term_ship": interest["p_term_ship"],
+                "ar_rate": interest["ar_rate"],
+                "ar_days": int(interest["ar_days"]),
+                "rm_rate": interest["rm_rate"],
+                "rm_days": int(interest["rm_days"]),
+                "wh_days": int(interest["wh_days"])
+            }
+
+            # 4. Prepare Production Costs (trx_production_costs) mapped from results
+            production_costs = []
+            for r in sheet("summary")["results"]:
+                item = {
+                    "item_order": r["Item"],
+                    "product_name": r["Product Name"],
+                    "product_rm": r["Product RM"],
+                    "rm_price_snapshot": r["RM Price"],
+                    "yield_loss_pct": r["Yield loss %"],
+                    "yield_loss_val": r["Yield loss"],
+                    "bp_val": r["BP"],
+                    "rm_net_yield": r["RM Net Yield"],
+                    "packaging": r["PACKAGING"],
+                    "brand": r["Brand"],
+                    "pack_size": r["Pack Size"],
+                    "overhead_group": r["Group (0-6)"],
+                    "overhead_val": r["Overhead"],
+                    "quantity": r["Quantity"],
+                    "factory_expense": r["Factory Expense"],
+                    "freight_val": 0.0, # Not explicitly in results dict, handled in export expense usually, or calculated
+                    "export_expense": r["Export Expense"],
+                    "commission": r["Commision"],
+                    "ap_expense": r["A&P"],
+                    "agreement": r["Agreement"],
+                    "other_cost": r["Other Cost"],
+                    "total_cost": r["Total Cost"],
+                    "selling_price": r["Selling Price"],
+                    "margin_cost": r["MarginCost (Unit)"],
+                    "ar_interest": r["AR Interest (Unit)"],
+                    "rm_interest": r["RM Interest (Unit)"],
+                    "wh_storage": r["WH Storage (Total)"],
+                    "margin_after": r["Margin After (Unit)"],
+                    "status": "Draft"
+                }
+                production_costs.append(item)
+
+            # 5. Prepare Loadings
+            loadings = []
+            for idx, row in sheet("loading")["loading_df"].iterrows():
+                if row["รายการสินค้า"]: # Only add if product name exists
+                    loadings.append({
+                        "order_no": row["No."],
+                        "product_name": row["รายการสินค้า"],
+                        "qty_cartons": int(row["จำนวน (ลัง/กล่อง)"]),
+                        "weight_per_unit": float(row["น้ำหนัก/หน่วย (KG)"]),
+                        "total_weight": float(row["น้ำหนักรวม (KG)"]),
+                        "container_no": row["ตู้ที่"],
+                        "remark": row["หมายเหตุ"]
+                    })
+
+            # 6. Prepare Remarks
+            remarks = []
+            for idx, row in sheet("remark")["remark_df"].iterrows():
+                if row["Remark"]:
+                    remarks.append({
+                        "order_no": row["No."],
+                        "remark_text": row["Remark"]
+                    })
+
+            # Bundle everything
+            full_data = {
+                "general_info": general_info,
+                "export_expenses": export_expenses,
+                "interests": interests,
+                "production_costs": production_costs,
+                "loadings": loadings,
+                "remarks": remarks
+            }
+
+            # Call API (only changed detail rows are written)
+            save_result = save_quotation_diff(full_data)
+            quotation_id = save_result["quotation_id"]
+            st.session_state.saved_doc_no = general["doc_no"]
+            st.success(f"✅ Saved successfully! Quotation ID: {quotation_id}")
+            if save_result.get("mode") == "diff":
+                touched = {
+                    table.replace("trx_", ""): counts
+                    for table, counts in save_result.items()
+                    if table.startswith("trx_")
+                }
+                total_touched = sum(c["inserted"] + c["updated"] + c["deleted"] for c in touched.values())
+                st.caption(f"Rows touched: {total_touched}")
+                st.dataframe(pd.DataFrame(touched).T, use_container_width=True)
+            st.balloons()
+
+        except Exception as e:
+            st.error(f"❌ Error saving data: {str(e)}")
+
+    st.write("---")
+    if st.button("💾 บันทึกเอกสาร Cost Sheet", use_container_width=True):
+        st.success(f"บันทึกข้อมูล {general['doc_no']} เรียบร้อยแล้ว")
+
+# Full run: every section in page order (the summary needs sections 1-4 published first)
+general_info_section()
+export_expense_section()
+interest_section()
+production_cost_section()
+cost_summary_section()
+remark_section()
+loading_section()
+save_section()
+st.session_state.section_timings["app"] = round((time.perf_counter() - PAGE_START) * 1000, 1)
@@ -0,0 +1,121 @@
+"""
+Port Geo Index Module for Quotation App
+Spatial lookups over the master_ports coordinates: nearest ports, ports
+within a radius and origin -> destination great-circle distance matrices,
+all vectorized with NumPy so distance-based freight can be estimated in bulk.
+"""
+
+import numpy as np
+import pandas as pd
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_NM = 1.852
+DEFAULT_ORIGIN_PORT = "Laem Chabang"  # main export port for sea freight
+
+
+def haversine_km(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Great-circle distance in km between points in degrees (broadcasts like NumPy)."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _unit_vectors(lat, lon) -> np.ndarray:
+    lat, lon = np.radians(lat), np.radians(lon)
+    return np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+
+def _chord_to_km(dot) -> np.ndarray:
+    """Dot product of unit vectors -> great-circle km (monotone, so ranking by dot is exact)."""
+    return EARTH_RADIUS_KM * np.arccos(np.clip(dot, -1.0, 1.0))
+
+
+def freight_estimate(distance_km, rate_per_1000_km: float, base_rate: float = 0.0) -> np.ndarray:
+    """Linear distance-based freight (base + rate per 1,000 km) for any shape of distances; NaN stays NaN."""
+    return base_rate + np.asarray(distance_km, dtype=float) / 1000.0 * rate_per_1000_km
+
+
+class PortGeoIndex:
+    """
+    Ports with coordinates, indexed two ways:
+    unit vectors on the sphere (k-nearest = largest dot products, one matrix
+    product for a batch of queries) and a latitude-sorted order (radius queries
+    only measure the latitude band that can be within reach).
+    Ports are addressed by main_port_name or by the "[Country] Port" label.
+    """
+
+    def __init__(self, ports):
+        df = pd.DataFrame(list(ports), columns=["main_port_name", "country_code", "latitude", "longitude"])
+        df["latitude"] = pd.to_numeric(df["latitude"], errors="coerce")
+        df["longitude"] = pd.to_numeric(df["longitude"], errors="coerce")
+        df = df.dropna(subset=["main_port_name", "latitude", "longitude"]).reset_index(drop=True)
+        df["display"] = "[" + df["country_code"].fillna("").astype(str) + "] " + df["main_port_name"].astype(str)
+
+        self.names = tuple(df["main_port_name"])
+        self.labels = tuple(df["display"])
+        self.lat = df["latitude"].to_numpy(dtype=float)
+        self.lon = df["longitude"].to_numpy(dtype=float)
+        self._xyz = _unit_vectors(self.lat, self.lon)
+        # A name shared by several ports maps to the first one; labels tell them apart
+        self._position = {name: position for position, name in reversed(list(enumerate(self.names)))}
+        self._position.update({label: position for position, label in enumerate(self.labels)})
+        self._by_lat = np.argsort(self.lat, kind="stable")
+        self._sorted_lat = self.lat[self._by_lat]
+
+    def __len__(self):
+        return len(self.names)
+
+    def locate(self, port):
+        """(lat, lon) of a port name / label, or None when unknown or without coordinates."""
+        position = self._position.get(port)
+        return None if position is None else (float(self.lat[position]), float(self.lon[position]))
+
+    def positions(self, ports) -> np.ndarray:
+        """Index positions of port names / labels (-1 when unknown)."""
+        return np.array([self._position.get(port, -1) if port else -1 for port in ports], dtype=np.int64)
+
+    def nearest_many(self, lats, lons, k: int = 5):
+        """
+        k nearest ports for every query point at once.
+        Returns (positions, km), both shaped (len(lats), k), nearest first.
+        """
+        k = min(k, len(self.names))
+        dots = _unit_vectors(np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)) @ self._xyz.T
+        if k < len(self.names):
+            top = np.argpartition(-dots, k - 1, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(k), (len(dots), 1))
+        top_dots = np.take_along_axis(dots, top, axis=1)
+        order = np.argsort(-top_dots, axis=1, kind="stable")
+        return np.take_along_axis(top, order, axis=1), _chord_to_km(np.take_along_axis(top_dots, order, axis=1))
+
+    def nearest(self, lat, lon, k: int = 5) -> list:
+        """[(label, km), ...] of the k ports nearest to a point."""
+        if not len(self.names):
+            return []
+        positions, km = self.nearest_many([lat], [lon], k)
+        return [(self.labels[p], float(d)) for p, d in zip(positions[0], km[0])]
+
+    def within(self, lat, lon, radius_km: float) -> list:
+        """[(label, km), ...] of every port within radius_km of a point, nearest first."""
+        band = np.degrees(radius_km / EARTH_RADIUS_KM)
+        lo = np.searchsorted(self._sorted_lat, lat - band, side="left")
+        hi = np.searchsorted(self._sorted_lat, lat + band, side="right")
+        candidates = self._by_lat[lo:hi]
+        km = haversine_km(lat, lon, self.lat[candidates], self.lon[candidates])
+        keep = km <= radius_km
+        candidates, km = candidates[keep], km[keep]
+        order = np.argsort(km, kind="stable")
+        return [(self.labels[p], float(d)) for p, d in zip(candidates[order], km[order])]
+
+    def distance_matrix(self, origins, destinations) -> np.ndarray:
+        """
+        Great-circle km from every origin to every destination (port names / labels),
+        shaped (len(origins), len(destinations)); NaN where a port is unknown or blank.
+        """
+        o, d = self.positions(origins), self.positions(destinations)
+        if not len(self.names):
+            return np.full((len(o), len(d)), np.nan)
+        km = haversine_km(self.lat[o][:, None], self.lon[o][:, None], self.lat[d][None, :], self.lon[d][None, :])
+        km[(o < 0)[:, None] | (d < 0)[None, :]] = np.nan
+        return km
@@ -1,14 +1,9 @@
 import streamlit as st
 import pandas as pd
-import os
 from datetime import datetime, date
-import time
-import yfinance as yf
-from supabase_client import (
-    fetch_customers, fetch_currencies, fetch_ports, fetch_overhead, 
-    fetch_factory_expense, fetch_shipping_rates, fetch_rm_costs, fetch_calculator_specs,
-    get_overhead_by_group, get_yield_loss_by_group
-)
+from supabase_client import get_master_data, get_fx_service
+from master_data import MasterData
+from costing import compute_cost_sheet, LEGACY_COLUMNS
 
 
 # --- PAGE CONFIG ---
@@ -138,185 +133,55 @@ st.markdown("""
     </style>
     """, unsafe_allow_html=True)
 
-# --- MASTER DATA MOCKUP (Replace with real logic as needed) ---
-@st.cache_data
-def load_customer_data():
-    """Load customer data from Supabase"""
-    try:
-        data = fetch_customers()
-        if data:
-            df = pd.DataFrame(data)
-            # Map Supabase columns back to the app's internal names
-            # Supabase: customer_code, customer_name, payment_term_customer_name
-            # App: CUSTOMER_CODE, CUSTOMER_NAME, Term
-            df = df.rename(columns={
-                'customer_code': 'CUSTOMER_CODE',
-                'customer_name': 'CUSTOMER_NAME',
-                'payment_term_customer_name': 'Term'
-            })
-            
-            # Sort by CUSTOMER_NAME
-            df = df.sort_values('CUSTOMER_NAME')
-            # Create display format [CODE] NAME
-            df['Display'] = df.apply(lambda x: f"[{x['CUSTOMER_CODE']}] {x['CUSTOMER_NAME']}", axis=1)
-            
-            if 'Term' not in df.columns:
-                df['Term'] = "N/A"
-            
-            return df[['CUSTOMER_CODE', 'CUSTOMER_NAME', 'Display', 'Term']]
-        
-        # Fallback to local file if Supabase is empty
-        file_path = "Master/Master Customer.xlsx"
-        if os.path.exists(file_path):
-            df = pd.read_excel(file_path)
-            df = df.rename(columns={'PAYMENTTERMCUSTOMERNAME': 'Term'})
-            df = df.sort_values('CUSTOMER_NAME')
-            df['Display'] = df.apply(lambda x: f"[{x['CUSTOMER_CODE']}] {x['CUSTOMER_NAME']}", axis=1)
-            return df[['CUSTOMER_CODE', 'CUSTOMER_NAME', 'Display', 'Term']]
-            
-        return pd.DataFrame(columns=['CUSTOMER_CODE', 'CUSTOMER_NAME', 'Display', 'Term'])
-    except Exception as e:
-        st.error(f"Error loading customer data from Supabase: {e}")
-        return pd.DataFrame(columns=['CUSTOMER_CODE', 'CUSTOMER_NAME', 'Display', 'Term'])
+# --- MASTER DATA (shared, indexed lookups; see master_data.py) ---
+try:
+    MASTER = get_master_data()
+except Exception as e:
+    st.error(f"Error loading master data from Supabase: {e}")
+    MASTER = MasterData({})
 
-@st.cache_data
-def load_currency_data():
-    """Load currency data from Supabase"""
-    try:
-        data = fetch_currencies()
-        if data:
-            # Supabase column name is 'code'
-            return sorted([item['code'] for item in data if item.get('code')])
-        
-        # Fallback to local file
-        file_path = "Master/MasterCurrency.xlsx"
-        if os.path.exists(file_path):
-            df = pd.read_excel(file_path)
-            code_col = 'รหัส (Code)'
-            if code_col in df.columns:
-                return sorted(df[code_col].dropna().unique().tolist())
-        return ["USD", "THB", "EUR", "JPY"]
-    except Exception as e:
-        st.error(f"Error loading currency data from Supabase: {e}")
-        return ["USD", "THB", "EUR", "JPY"]
+# Customer data (thousands of customers: the pickers search MASTER.customer_search)
+CUSTOMER_MAP = MASTER.customer_code_by_display
+CUSTOMER_TERMS_MAP = MASTER.customer_term_by_display
+CUSTOMER_HINT = "Code, name (Thai / English) or country"
 
-@st.cache_data
-def load_port_data():
-    """Load port data from Supabase"""
-    try:
-        data = fetch_ports()
-        if data:
-            df = pd.DataFrame(data)
-            # Map Supabase columns: main_port_name, country_code
-            # App: Main Port Name, Country Code
-            df = df.rename(columns={
-                'main_port_name': 'Main Port Name',
-                'country_code': 'Country Code'
-            })
-            
-            # Sort by Main Port Name
-            df = df.sort_values('Main Port Name')
-            # Create display format [Country Code] Main Port Name
-            df['Display'] = df.apply(lambda x: f"[{x['Country Code']}] {x['Main Port Name']}", axis=1)
-            return df[['Country Code', 'Main Port Name', 'Display']]
-        
-        # Fallback to local file
-        file_path = "Master/Master Port.csv"
-        if os.path.exists(file_path):
-            df = pd.read_csv(file_path, encoding='utf-8-sig', low_memory=False)
-            df = df.dropna(subset=['Main Port Name'])
-            df = df.sort_values('Main Port Name')
-            df['Display'] = df.apply(lambda x: f"[{x['Country Code']}] {x['Main Port Name']}", axis=1)
-            return df[['Country Code', 'Main Port Name', 'Display']]
-        return pd.DataFrame(columns=['Country Code', 'Main Port Name', 'Display'])
-    except Exception as e:
-        st.error(f"Error loading port data from Supabase: {e}")
-        return pd.DataFrame(columns=['Country Code', 'Main Port Name', 'Display'])
+CURRENCY_LIST = list(MASTER.currency_codes) or ["USD", "THB", "EUR", "JPY"]
 
-# Load customer data
-CUSTOMER_DF = load_customer_data()
-CUSTOMER_LIST = CUSTOMER_DF['Display'].tolist()
-CUSTOMER_MAP = dict(zip(CUSTOMER_DF['Display'], CUSTOMER_DF['CUSTOMER_CODE']))
-CUSTOMER_TERMS_MAP = dict(zip(CUSTOMER_DF['Display'], CUSTOMER_DF['Term']))
+# Port data (~3,800 ports: the destination pickers search MASTER.port_search)
+PORT_MAP = MASTER.port_name_by_display
 
-CURRENCY_LIST = load_currency_data()
+PORT_HINT = "Port, country or UN/LOCODE"
 
-# Load port data
-PORT_DF = load_port_data()
-PORT_DISPLAY_LIST = PORT_DF['Display'].tolist()
-PORT_MAP = dict(zip(PORT_DF['Display'], PORT_DF['Main Port Name']))
+SEARCH_LIMIT = 20  # matches offered by each type-ahead picker
 
-CUSTOMERS = CUSTOMER_LIST # For backward compatibility in other parts if needed
+def search_picker(label, key, search, placeholder=None):
+    """
+    Type-ahead picker: a live search box plus a selectbox of the top matches only
+    (and the current choice). Widget keys: <key>_q, <key>_sel. Returns the chosen label.
+    """
+    query = st.text_input(label, key=f"{key}_q", type="search", live="200ms", placeholder=placeholder)
+    current = st.session_state.get(f"{key}_sel") or ""
+    options = [""] + search(query, SEARCH_LIMIT) if query else [""]
+    if current and current not in options:
+        options.insert(1, current)
+    return st.selectbox(f"{label} (match)", options, key=f"{key}_sel", label_visibility="collapsed")
 
 PAYMENT_LIST = ["T/T AFTER FAX", "T/T 30 DAYS", "L/C AT SIGHT", "CASH"]
 DESTINATIONS = ["Bangkok", "Laem Chabang", "Singapore", "Hong Kong", "Tokyo", "Shanghai"]
 RM_ITEMS = [f"HM {i}" for i in range(1, 21)]
 SHIPMENT_MONTHS = ["Nov.25", "Dec.25", "Jan.26", "Feb.26"]
 
-# Load data from Supabase
-try:
-    OH_DATA = {item['group_number']: float(item['overhead_rate']) for item in fetch_overhead()}
-    if not OH_DATA:
-        OH_DATA = {0: 0.10, 1: 0.34, 2: 0.51, 3: 0.57, 4: 0.64, 5: 0.97, 6: 1.59}
-except Exception as e:
-    st.error(f"Error loading Overhead from Supabase: {e}")
-    OH_DATA = {0: 0.10, 1: 0.34, 2: 0.51, 3: 0.57, 4: 0.64, 5: 0.97, 6: 1.59}
-
-try:
-    factory_data = fetch_factory_expense()
-    FACTORY_EXPENSE_DEFAULT = float(factory_data[0]['expense_rate']) if factory_data else 0.42
-except Exception as e:
-    st.error(f"Error loading Factory Expense from Supabase: {e}")
-    FACTORY_EXPENSE_DEFAULT = 0.42
-
-# Load Tiered Shipping Rates
-try:
-    SHIPPING_RATES = fetch_shipping_rates()
-except Exception as e:
-    st.error(f"Error loading Shipping Rates from Supabase: {e}")
-    SHIPPING_RATES = []
-
-# Load RM costs
-try:
-    RM_COSTS_DATA = fetch_rm_costs()
-    RM_COSTS_DF = pd.DataFrame(RM_COSTS_DATA) if RM_COSTS_DATA else pd.DataFrame()
-    # Unique product list for dropdown
-    RM_LIST = sorted(list(set([item['product'] for item in RM_COSTS_DATA]))) if RM_COSTS_DATA else []
-except Exception as e:
-    st.error(f"Error loading RM Costs from Supabase: {e}")
-    RM_LIST = []
-    RM_COSTS_DATA = []
+# Overhead & Factory Expense (defaults from Master.xlsx if the master tables are empty)
+OH_DATA = dict(MASTER.overhead_rates) or {0: 0.10, 1: 0.34, 2: 0.51, 3: 0.57, 4: 0.64, 5: 0.97, 6: 1.59}
+FACTORY_EXPENSE_DEFAULT = MASTER.factory_expense_rate if MASTER.factory_expense_rate is not None else 0.42
 
-def get_rm_base_price(product, shipment_date_str):
-    """Match RM price by product and closest update date."""
-    if not RM_COSTS_DATA: return 0.0
-    try:
-        target_date = pd.to_datetime(shipment_date_str, format='%b.%y', errors='coerce')
-        if pd.isna(target_date): return 0.0
-        
-        matches = [r for r in RM_COSTS_DATA if r['product'] == product]
-        if not matches: return 0.0
-        
-        # Sort by date descending
-        matches.sort(key=lambda x: x['update_date'], reverse=True)
-        # Find the latest price that is on or before the target shipment date
-        for r in matches:
-            if pd.to_datetime(r['update_date']) <= target_date:
-                return float(r['price'])
-        # Fallback to the oldest if none match
-        return float(matches[-1]['price'])
-    except:
-        return 0.0
+# RM costs
+# Unique product list for dropdown
+RM_LIST = list(MASTER.rm_products)
 
 def get_shipping_rate(qty):
-    """Find the applicable rate for the given quantity from tiers."""
-    for tier in SHIPPING_RATES:
-        if tier['min_qty'] <= qty <= tier['max_qty']:
-            return float(tier['price_per_container'])
-    # If no tier found, use a default fallback or the last tier
-    if SHIPPING_RATES:
-        return float(SHIPPING_RATES[-1]['price_per_container'])
-    return 1400.0 # Standard fallback
+    """Find the applicable rate for the given quantity from tiers (interval index)."""
+    return MASTER.shipping_rate(qty)
 
 # --- UI START ---
 st.title("📝 Cost Sheet Management System")
@@ -334,11 +199,11 @@ with c1_2:
     doc_date = st.date_input("Document Date (Conclude)", value=date.today())
     team = st.selectbox("Team", ["A1", "A2", "A3", "A4", "A5", "A6", "A7", "A8"])
 with c1_3:
-    cust1_display = st.selectbox("Customer1 (Importer)", CUSTOMER_LIST)
+    cust1_display = search_picker("Customer1 (Importer)", "cust1", MASTER.search_customers, CUSTOMER_HINT)
     cust1 = CUSTOMER_MAP.get(cust1_display, "")
     incoterm = st.selectbox("Incoterm", ["FOB", "CFR", "CIF", "EXW", "DDP"])
 with c1_4:
-    cust2_display = st.selectbox("Customer 2 (End Customer)", [""] + CUSTOMER_LIST)
+    cust2_display = search_picker("Customer 2 (End Customer)", "cust2", MASTER.search_customers, CUSTOMER_HINT)
     cust2 = CUSTOMER_MAP.get(cust2_display, "")
 
 c5, c6 = st.columns(2)
@@ -352,26 +217,22 @@ r1, r2, r3, r4, r5 = st.columns([1.5, 1.5, 1.5, 1.5, 1.5])
 with r1:
     currency = st.selectbox("Currency", CURRENCY_LIST)
 
-# Helper to fetch rate
-def get_yahoo_rate(pair="THB=X"):
-    try:
-        ticker = yf.Ticker(pair)
-        hist = ticker.history(period="1d")
-        if not hist.empty:
-            return hist["Close"].iloc[-1]
-    except Exception as e:
-        st.error(f"Error fetching rate: {e}")
-    return None
+# Shared FX rates: all currencies are downloaded in one batch in the background
+fx = get_fx_service()
+fx.track(CURRENCY_LIST)
 
 with r2:
     if st.button("Get Spot Rate (Yahoo)"):
-        # Map currency to ticker (Approximation)
-        ticker_map = {"USD": "THB=X", "EUR": "EURTHB=X", "JPY": "JPYTHB=X"} 
-        target_ticker = ticker_map.get(currency, "THB=X")
-        fetched_rate = get_yahoo_rate(target_ticker)
-        if fetched_rate:
-            st.session_state['spot_val'] = fetched_rate
-            st.success(f"Fetched: {fetched_rate:.2f}")
+        quote = fx.quote(currency)
+        if quote:
+            st.session_state['spot_val'] = quote["rate"]
+            as_of = datetime.fromtimestamp(quote["fetched_at"]).strftime("%d/%m %H:%M")
+            if quote["stale"]:
+                st.warning(f"Last known rate: {quote['rate']:.2f} (as of {as_of}, refreshing...)")
+            else:
+                st.success(f"Fetched: {quote['rate']:.2f} (as of {as_of})")
+        else:
+            st.warning(f"No rate for {currency} yet, try again in a moment.")
             
     # Use session state for spot rate
     if 'spot_val' not in st.session_state:
@@ -392,17 +253,13 @@ with r5:
 st.markdown("##### Destination")
 dest_col1, dest_col2, dest_col3, dest_col4 = st.columns(4)
 with dest_col1:
-    dest1_display = st.selectbox("Destination 1", [""] + PORT_DISPLAY_LIST, key="dest1_sel")
-    destination1 = PORT_MAP.get(dest1_display, "")
+    destination1 = PORT_MAP.get(search_picker("Destination 1", "dest1", MASTER.search_ports, PORT_HINT), "")
 with dest_col2:
-    dest2_display = st.selectbox("Destination 2", [""] + PORT_DISPLAY_LIST, key="dest2_sel")
-    destination2 = PORT_MAP.get(dest2_display, "")
+    destination2 = PORT_MAP.get(search_picker("Destination 2", "dest2", MASTER.search_ports, PORT_HINT), "")
 with dest_col3:
-    dest3_display = st.selectbox("Destination 3", [""] + PORT_DISPLAY_LIST, key="dest3_sel")
-    destination3 = PORT_MAP.get(dest3_display, "")
+    destination3 = PORT_MAP.get(search_picker("Destination 3", "dest3", MASTER.search_ports, PORT_HINT), "")
 with dest_col4:
-    dest4_display = st.selectbox("Destination 4", [""] + PORT_DISPLAY_LIST, key="dest4_sel")
-    destination4 = PORT_MAP.get(dest4_display, "")
+    destination4 = PORT_MAP.get(search_picker("Destination 4", "dest4", MASTER.search_ports, PORT_HINT), "")
 
 # --- 2. Export Expense & Freight ---
 st.markdown('<div class="section-header">2. ค่าใช้จ่ายส่งออก (Export Expense & Freight)</div>', unsafe_allow_html=True)
@@ -512,7 +369,9 @@ with i_col1:
     st.write("**AR Interest**")
     # Auto fill payment term
     # AR Interest calculation usually needs a customer lookup
-    ar_customer_display = st.selectbox("เลือก Customer (จากลิสต์)", CUSTOMER_LIST, key="ar_cust")
+    # Left blank, the AR customer is Customer1 (no second lookup needed)
+    ar_customer_display = search_picker("เลือก Customer (จากลิสต์)", "ar_cust", MASTER.search_customers,
+                                        "Same as Customer1") or cust1_display
     ar_customer_code = CUSTOMER_MAP.get(ar_customer_display, "")
     p_term_auto = CUSTOMER_TERMS_MAP.get(ar_customer_display, "N/A")
     st.info(f"Payment Term (Auto): {p_term_auto}")
@@ -607,124 +466,21 @@ for idx in edited_df.index:
 
 
 # --- CALCULATIONS BASED ON MASTER CALCULATOR ---
-results = []
-total_qty_all = edited_df["Quantity"].sum()
 
 # Total Export Expenses Combined (THB)
 total_export_exp_combined = (v_freight + v_shipping + v_truck + survey_total + v_insurance + 
                               docs_total + v_doc_prep + port_charges_total + other_expense_value)
 
-# Fetch Overhead table for Yield Loss and rate
-overhead_table = fetch_overhead()
-oh_yield_map = {item['group_number']: (float(item['overhead_rate']), float(item['yield_loss_percent'])) for item in overhead_table}
-
-for index, row in edited_df.iterrows():
-    qty = row.get("Quantity", 0.0)
-    prod_rm = row.get("Product RM", "")
-    
-    # Filter empty rows
-    if qty <= 0 and not row.get("Product Name") and not prod_rm:
-        continue
-
-    # 1. RM Price Lookup & Conversion
-    # Formula: ((Auto look up price)*1000)/Exchange Rate
-    base_price = get_rm_base_price(prod_rm, doc_date.strftime('%b.%y'))
-    rm_price = (base_price * 1000 / ex_rate) if ex_rate > 0 else (base_price * 1000)
-    
-    # 2. Yield Loss Lookup
-    g_num = row.get("Group", 0)
-    oh_rate, y_loss_pct = oh_yield_map.get(g_num, (0.0, 0.0))
-    # Note: In Master Calculator example, Group 3 has y_loss_pct = 0.95 and Yield loss = Price / 0.95
-    yield_loss_cost = (rm_price / y_loss_pct) if y_loss_pct > 0 else rm_price
-    
-    # 3. BP = (Yield loss - RM Price) / 3
-    bp_val = (yield_loss_cost - rm_price) / 3
-    
-    # 4. RM Net Yield = Yield loss - BP
-    rm_net_yield = yield_loss_cost - bp_val
-    
-    # 5. PACKAGING, Overhead, Factory Expense (already converted in Master Calculator? no, usually per unit)
-    # The image/Excel suggests these are also unit costs.
-    # Overhead: Auto lookup and convert: (Rate * 1000) / Exchange Rate
-    overhead_val = (oh_rate * 1000 / ex_rate) if ex_rate > 0 else (oh_rate * 1000)
-    # Factory Expense: Auto from master and convert: (Rate * 1000) / Exchange Rate
-    factory_exp_val = (FACTORY_EXPENSE_DEFAULT * 1000 / ex_rate) if ex_rate > 0 else (FACTORY_EXPENSE_DEFAULT * 1000)
-    
-    # 6. Export Expense (Unit)
-    # Formula: ((Export Expense + Documents + ...)/Exchange Rate)/Quantity
-    unit_export_exp = 0.0
-    if total_qty_all > 0 and ex_rate > 0:
-        unit_export_exp = (total_export_exp_combined / total_qty_all) / ex_rate
-    
-    # Other components
-    c_pkg = row.get("PACKAGING", 0.0)
-    c_comm = row.get("Commision", 0.0)
-    c_ap = row.get("A&P", 0.0)
-    c_agree = row.get("Agreement", 0.0)
-    c_other = row.get("Other Cost", 0.0)
-    selling = row.get("Selling Price", 0.0)
-
-    # 7. Total Cost
-    # RM Net Yield+ PACKAGING+ Overhead+ Factory Expense+ Freight+ Export Expense+Commission+ A&P+Agreemen+ Other Cost
-    total_cost = (rm_net_yield + c_pkg + overhead_val + factory_exp_val + 
-                  unit_export_exp + c_comm + c_ap + c_agree + c_other)
-    
-    # 8. MarginCost
-    margin_cost = selling - total_cost
-    
-    # 9. Interests (Per Unit) - Based on Master Calculator.xlsx formulas
-    # AR Interest Formula: =(Selling_Price * AR_Rate% / 365) * AR_Days
-    # RM Interest Formula: =(Selling_Price * RM_Rate% / 365) * RM_Days
-    unit_ar_int = (selling * (ar_rate / 100) / 365) * ar_days if ar_days > 0 else 0.0
-    unit_rm_int = (selling * (rm_rate / 100) / 365) * rm_days if rm_days > 0 else 0.0
-    
-    # WH Storage Formula: =(30 * (30/30) * Quantity) / Exchange Rate
-    # Per Unit: (30 * (30/30)) / Exchange Rate = 30 / Exchange Rate
-    # Total: (30 * (30/30) * Quantity) / Exchange Rate
-    unit_wh_storage = (30 * (30/30)) / ex_rate if ex_rate > 0 else 0.0
-    total_wh_storage = (30 * (30/30) * qty) / ex_rate if (qty > 0 and ex_rate > 0) else 0.0
-    
-    # 10. Margin After (Per Unit) - Following Excel: MarginCost - AR Interest - RM Interest - WH Storage
-    # Note: Excel uses WH Storage TOTAL in per-unit calculation (as per Master Calculator.xlsx)
-    margin_after_unit = margin_cost - unit_ar_int - unit_rm_int - total_wh_storage
-    
-    # Also calculate totals for reference
-    total_ar_int = unit_ar_int * qty
-    total_rm_int = unit_rm_int * qty
-    margin_after_total = margin_after_unit * qty
-
-    results.append({
-        "Item": row["Item"],
-        "Product Name": row["Product Name"],
-        "Product RM": prod_rm,
-        "RM Price": round(rm_price, 2),
-        "Group (0-6)": g_num,
-        "Yield loss %": y_loss_pct,
-        "Yield loss": round(yield_loss_cost, 2),
-        "BP": round(bp_val, 2),
-        "RM Net Yield": round(rm_net_yield, 2),
-        "PACKAGING": c_pkg,
-        "Brand": row["Brand"],
-        "Pack Size": row["Pack Size"],
-        "Overhead": round(overhead_val, 2),
-        "Quantity": qty,
-        "Factory Expense": round(factory_exp_val, 2),
-        "Export Expense": round(unit_export_exp, 2),
-        "Commision": c_comm,
-        "A&P": c_ap,
-        "Agreement": c_agree,
-        "Other Cost": c_other,
-        "Total Cost": round(total_cost, 2),
-        "Selling Price": selling,
-        "MarginCost (Unit)": round(margin_cost, 2),
-        "AR Interest (Total)": round(total_ar_int, 2),
-        "RM Interest (Total)": round(total_rm_int, 2),
-        "WH Storage (Total)": round(total_wh_storage, 2),
-        "Margin After (Total)": round(margin_after_total, 2)
-    })
-
-
-summary_df = pd.DataFrame(results)
+# Per-line costing (RM price -> margin after), vectorized in costing.py
+# WH Storage here is always 30 days x 1 Baht/Ton/Day (Master Calculator.xlsx)
+summary_df = compute_cost_sheet(
+    edited_df, MASTER, doc_date, ex_rate,
+    export_expense_total=total_export_exp_combined,
+    factory_expense_rate=FACTORY_EXPENSE_DEFAULT,
+    ar_rate=ar_rate, ar_days=ar_days, rm_rate=rm_rate, rm_days=rm_days,
+    wh_days=30, columns=LEGACY_COLUMNS
+)
+results = summary_df.to_dict("records")
 
 if not summary_df.empty:
     st.write("---")
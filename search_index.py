@@ -0,0 +1,170 @@
+"""
+Search Index Module for Quotation App
+In-memory prefix / trigram indexes over master tables, built once per
+MasterData snapshot and shared by every session. Pages ask for the top-k
+matches of what the user typed instead of sending whole master lists to the
+browser.
+"""
+
+import re
+import unicodedata
+from bisect import bisect_left
+
+import numpy as np
+import pandas as pd
+
+_LATIN_ACCENTS = re.compile("[\u0300-\u036f]")  # combining diacritics left by NFKD (é -> e)
+
+# Ranking weights: exact code > name / code prefix > word prefix > tag prefix > fuzzy (0..1)
+EXACT_CODE_SCORE = 4.0
+NAME_PREFIX_SCORE = 3.0
+WORD_PREFIX_SCORE = 2.0
+TAG_PREFIX_SCORE = 1.5
+MIN_TRIGRAM_SIMILARITY = 0.34  # share of the query's trigrams a fuzzy match must contain
+
+
+def normalize(text) -> str:
+    """
+    Lower-case, single-spaced text without Latin accents ('' for None / NaN / blank).
+    Punctuation separates words; combining vowel / tone marks of scripts such as Thai are kept.
+    """
+    if text is None or (isinstance(text, float) and np.isnan(text)):
+        return ""
+    text = _LATIN_ACCENTS.sub("", unicodedata.normalize("NFKD", str(text)).lower())
+    return " ".join("".join(ch if ch.isalnum() or unicodedata.category(ch)[0] == "M" else " " for ch in text).split())
+
+
+def trigrams(text: str) -> set:
+    """Character trigrams of each word, padded so short words and word starts count."""
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class PrefixTrigramIndex:
+    """
+    Prefix + trigram index over short text documents.
+    Per document: `texts` (names, prefix and fuzzy matched), `codes` (exact /
+    prefix matched, spaces ignored) and `tags` (e.g. country, prefix matched
+    with a lower weight). `labels` are what search() returns. Prefix lookups
+    bisect one sorted term list; fuzzy lookups count trigram hits per document
+    with one np.bincount over the posting arrays.
+    """
+
+    def __init__(self, labels, texts, codes=None, tags=None):
+        self.labels = tuple(labels)
+        n = len(self.labels)
+        texts = [[normalize(t) for t in doc] for doc in texts]
+        codes = [[normalize(c).replace(" ", "") for c in doc] for doc in codes] if codes is not None else [[]] * n
+        tags = [[normalize(t) for t in doc] for doc in tags] if tags is not None else [[]] * n
+
+        # Sorted (term, doc, score) entries: every full text, word, code and tag
+        terms = []
+        for doc_id, (doc_texts, doc_codes, doc_tags) in enumerate(zip(texts, codes, tags)):
+            for text in doc_texts:
+                if text:
+                    terms.append((text, doc_id, NAME_PREFIX_SCORE))
+                    terms.extend((word, doc_id, WORD_PREFIX_SCORE) for word in text.split()[1:])
+            terms.extend((code, doc_id, NAME_PREFIX_SCORE) for code in doc_codes if code)
+            terms.extend((tag, doc_id, TAG_PREFIX_SCORE) for tag in doc_tags if tag)
+        terms.sort()
+        self._terms = [t for t, _, _ in terms]
+        self._term_docs = np.array([d for _, d, _ in terms], dtype=np.int32)
+        self._term_scores = np.array([s for _, _, s in terms], dtype=float)
+        self._codes = {}
+        for doc_id, doc_codes in enumerate(codes):
+            for code in doc_codes:
+                if code:
+                    self._codes.setdefault(code, []).append(doc_id)
+
+        # Trigram postings: trigram -> sorted doc ids
+        postings = {}
+        for doc_id, doc_texts in enumerate(texts):
+            for gram in trigrams(" ".join(doc_texts)):
+                postings.setdefault(gram, []).append(doc_id)
+        self._postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+        # Secondary sort key: label order (alphabetical results among equal scores)
+        self._alphabetical = np.argsort(np.array(self.labels, dtype=object), kind="stable")
+        self._rank = np.empty(n, dtype=np.int64)
+        self._rank[self._alphabetical] = np.arange(n)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def scores(self, query: str) -> np.ndarray:
+        """Relevance of every document for `query` (0 = no match)."""
+        n = len(self.labels)
+        out = np.zeros(n)
+        q = normalize(query)
+        if not q or not n:
+            return out
+
+        # Prefix hits on full texts, words and codes
+        lo = bisect_left(self._terms, q)
+        hi = bisect_left(self._terms, q + "\uffff", lo)
+        if hi > lo:
+            np.maximum.at(out, self._term_docs[lo:hi], self._term_scores[lo:hi])
+        for doc_id in self._codes.get(q.replace(" ", ""), ()):
+            out[doc_id] = EXACT_CODE_SCORE
+
+        # Fuzzy: share of the query's trigrams present in the document (typos, inner words)
+        query_grams = trigrams(q)
+        grams = [self._postings[g] for g in query_grams if g in self._postings]
+        if grams:
+            hits = np.bincount(np.concatenate(grams), minlength=n) / len(query_grams)
+            out = np.maximum(out, np.where(hits >= MIN_TRIGRAM_SIMILARITY, hits, 0.0))
+        return out
+
+    def search(self, query: str, k: int = 20) -> list:
+        """Labels of the top-k matches, best first; the first k labels for an empty query."""
+        if not normalize(query):
+            return [self.labels[i] for i in self._alphabetical[:k]]
+        scores = self.scores(query)
+        matched = np.flatnonzero(scores > 0)
+        if len(matched) > k:
+            # Partial sort: only the k best candidates are ordered
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        order = np.lexsort((self._rank[matched], -scores[matched]))
+        return [self.labels[i] for i in matched[order]]
+
+
+class PortSearchIndex(PrefixTrigramIndex):
+    """
+    Port search over master_ports: main name, alternate name, country and
+    UN/LOCODE. Returns the "[Country] Port" display labels used by the pickers
+    (one entry per label, like MasterData.port_display_list).
+    """
+
+    def __init__(self, ports):
+        df = pd.DataFrame(list(ports), columns=["main_port_name", "alternate_port_name", "un_locode", "country_code"])
+        df = df.dropna(subset=["main_port_name"])
+        df["display"] = "[" + df["country_code"].fillna("").astype(str) + "] " + df["main_port_name"].astype(str)
+        df = df.drop_duplicates(subset=["display"], keep="first")
+        super().__init__(
+            df["display"],
+            zip(df["main_port_name"], df["alternate_port_name"]),
+            codes=[[code] for code in df["un_locode"]],
+            tags=[[country] for country in df["country_code"]],
+        )
+
+
+class CustomerSearchIndex(PrefixTrigramIndex):
+    """
+    Fuzzy customer search over master_customers: customer_code, customer_name
+    (Thai or English) and country. Returns the "[CODE] NAME" display labels of
+    MasterData.customer_display_list.
+    """
+
+    def __init__(self, customers):
+        df = pd.DataFrame(list(customers), columns=["customer_code", "customer_name", "country"])
+        df = df.dropna(subset=["customer_code"])
+        df["display"] = "[" + df["customer_code"].astype(str) + "] " + df["customer_name"].astype(str)
+        df = df.drop_duplicates(subset=["display"], keep="first")
+        super().__init__(
+            df["display"],
+            [[name] for name in df["customer_name"]],
+            codes=[[code] for code in df["customer_code"]],
+            tags=[[country] for country in df["country"]],
+        )
@@ -4,18 +4,93 @@ Provides connection and helper functions for Supabase database operations.
 """
 
 import os
+import math
+import threading
+import time
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+import httpx
 from postgrest import SyncPostgrestClient
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from master_sync import MasterTableMirror
+from master_snapshot import MasterSnapshotStore, DEFAULT_SNAPSHOT_PATH
+from master_data import MasterData
+from fx_rates import FxRateService, YahooFxProvider, StubFxProvider, DEFAULT_FX_TTL
 
 # Load environment variables
 load_dotenv()
 
+# Connection pool defaults (override via Streamlit Secrets or environment variables)
+DEFAULT_POOL_MAX_CONNECTIONS = 20
+DEFAULT_POOL_MAX_KEEPALIVE = 10
+DEFAULT_POOL_KEEPALIVE_EXPIRY = 30.0
+DEFAULT_HTTP_TIMEOUT = 30.0
+
+
+def _get_setting(name: str, default=None):
+    """Read a setting from Streamlit Secrets, falling back to environment variables."""
+    try:
+        value = st.secrets.get(name)
+    except Exception:
+        # No secrets.toml available (e.g. running outside `streamlit run`)
+        value = None
+    return value or os.getenv(name) or default
+
+
+def _http2_available() -> bool:
+    """HTTP/2 in httpx needs the optional `h2` package."""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+@st.cache_resource
+def _get_http_client(rest_url: str, key: str) -> httpx.Client:
+    """
+    Build the process-wide HTTP client shared by every Streamlit session.
+    httpx.Client is thread-safe and keeps connections alive between requests,
+    so each save/fetch reuses an open TLS connection instead of a new handshake.
+    """
+    limits = httpx.Limits(
+        max_connections=int(_get_setting("SUPABASE_POOL_MAX_CONNECTIONS", DEFAULT_POOL_MAX_CONNECTIONS)),
+        max_keepalive_connections=int(_get_setting("SUPABASE_POOL_MAX_KEEPALIVE", DEFAULT_POOL_MAX_KEEPALIVE)),
+        keepalive_expiry=float(_get_setting("SUPABASE_POOL_KEEPALIVE_EXPIRY", DEFAULT_POOL_KEEPALIVE_EXPIRY)),
+    )
+    return httpx.Client(
+        base_url=rest_url,
+        headers={
+            "apikey": key,
+            "Authorization": f"Bearer {key}"
+        },
+        timeout=float(_get_setting("SUPABASE_HTTP_TIMEOUT", DEFAULT_HTTP_TIMEOUT)),
+        limits=limits,
+        http2=_http2_available(),
+        follow_redirects=True,
+    )
+
+
+@st.cache_resource
+def _get_shared_postgrest_client(rest_url: str, key: str) -> SyncPostgrestClient:
+    """Create the shared PostgREST client on top of the pooled HTTP client."""
+    return SyncPostgrestClient(
+        rest_url,
+        headers={
+            "apikey": key,
+            "Authorization": f"Bearer {key}"
+        },
+        http_client=_get_http_client(rest_url, key)
+    )
+
+
 def get_postgrest_client() -> SyncPostgrestClient:
-    """Get a PostgREST client for Supabase database operations."""
+    """Get the shared PostgREST client for Supabase database operations."""
     # Prioritize Streamlit Secrets, fallback to environment variables
-    url = st.secrets.get("SUPABASE_URL") or os.getenv("SUPABASE_URL")
-    key = st.secrets.get("SUPABASE_KEY") or os.getenv("SUPABASE_KEY")
+    url = _get_setting("SUPABASE_URL")
+    key = _get_setting("SUPABASE_KEY")
 
     if not url or not key:
         error_msg = (
@@ -26,103 +101,439 @@ def get_postgrest_client() -> SyncPostgrestClient:
         raise ValueError(error_msg)
     
     rest_url = f"{url}/rest/v1"
-    return SyncPostgrestClient(
-        rest_url,
-        headers={
-            "apikey": key,
-            "Authorization": f"Bearer {key}"
-        }
-    )
+    return _get_shared_postgrest_client(rest_url, key)
+
+
+def get_pool_stats() -> dict:
+    """
+    Report connection pool statistics for the shared client.
+    Returns counts of open, idle (keep-alive) and waiting (queued) connections.
+    """
+    client = get_postgrest_client()
+    stats = {"open": 0, "idle": 0, "waiting": 0, "http2": False}
+    # httpx does not expose pool metrics publicly; read them from the httpcore pool
+    pool = getattr(client.session, "_transport", None)
+    pool = getattr(pool, "_pool", None)
+    if pool is None:
+        return stats
+
+    connections = list(getattr(pool, "connections", []))
+    stats["open"] = len(connections)
+    stats["idle"] = sum(1 for conn in connections if conn.is_idle())
+    stats["waiting"] = sum(1 for req in list(getattr(pool, "_requests", [])) if req.is_queued())
+    stats["http2"] = bool(getattr(pool, "_http2", False))
+    return stats
+
+
+# Master tables mirrored locally: table -> (order_by, descending)
+MASTER_TABLES = {
+    "master_customers": ("id", False),
+    "master_currencies": ("id", False),
+    "master_ports": ("id", False),
+    "master_overhead": ("id", False),
+    "master_factory_expense": ("id", False),
+    "shipping_rates": ("min_qty", False),
+    "master_rm_cost": ("update_date", True),
+    "master_calculator": ("id", False),
+    "master_fx_rates": ("rate_date", True),
+    "master_export_expense": ("effective_date", True),
+}
+# Tables added after the first release: served empty until supabase_schema.sql creates them
+OPTIONAL_MASTER_TABLES = {"master_fx_rates", "master_export_expense"}
+DEFAULT_MASTER_SYNC_INTERVAL = 300  # seconds between delta syncs
+
+
+@st.cache_resource
+def _get_snapshot_store() -> MasterSnapshotStore:
+    """On-disk master-data snapshot used for warm starts and offline operation."""
+    return MasterSnapshotStore(_get_setting("MASTER_SNAPSHOT_PATH", DEFAULT_SNAPSHOT_PATH))
+
+
+@st.cache_resource
+def _get_master_mirrors() -> dict:
+    """Process-wide mirrors of the master tables, shared by every session."""
+    mirrors = {
+        table: MasterTableMirror(table, order_by=order_by, desc=desc)
+        for table, (order_by, desc) in MASTER_TABLES.items()
+    }
+    # Warm start: seed from the local snapshot, Supabase catches up in the background
+    for table, snapshot in _get_snapshot_store().load_all().items():
+        if table in mirrors:
+            mirrors[table].load_rows(snapshot["rows"], snapshot["watermark"])
+    return mirrors
+
+
+def _save_snapshot(store: MasterSnapshotStore, mirror: MasterTableMirror, stats: dict):
+    """Persist a mirror to the local snapshot when its data changed."""
+    if stats.get("changed") or stats.get("deleted"):
+        store.save(mirror.table, mirror.rows(), mirror.watermark)
+
+
+def _fetch_master(table: str) -> list:
+    """
+    Return the mirrored rows of a master table.
+    Only the very first load (no snapshot yet) waits on Supabase; afterwards a
+    stale mirror is delta-synced in the background while the current rows are served.
+    """
+    mirror = _get_master_mirrors()[table]
+    store = _get_snapshot_store()
+    interval = float(_get_setting("MASTER_SYNC_INTERVAL", DEFAULT_MASTER_SYNC_INTERVAL))
+
+    if mirror.version == 0:
+        try:
+            stats = mirror.refresh_if_stale(get_postgrest_client(), interval)
+        except Exception as e:
+            # PGRST205 / 42P01: table does not exist yet
+            if table not in OPTIONAL_MASTER_TABLES or not ("PGRST205" in str(e) or "42P01" in str(e)):
+                raise
+            print(f"[WARNING] {table} not found, serving it empty: {e}")
+            mirror.load_rows([])
+            mirror.last_sync = time.time()
+            return mirror.rows()
+        _save_snapshot(store, mirror, stats)
+    elif mirror.is_stale(interval):
+        try:
+            client = get_postgrest_client()
+        except Exception as e:
+            # Offline / not configured: keep serving the snapshot
+            print(f"[WARNING] Sync skipped for {table}, using cached rows: {e}")
+            return mirror.rows()
+        mirror.refresh_in_background(client, on_done=lambda m, stats: _save_snapshot(store, m, stats))
+    return mirror.rows()
+
+
+def sync_master_data(force_full: bool = False) -> list:
+    """Refresh every master mirror now. Returns per-table sync statistics."""
+    client = get_postgrest_client()
+    store = _get_snapshot_store()
+    results = []
+    for mirror in _get_master_mirrors().values():
+        stats = mirror.refresh(client, force_full=force_full)
+        _save_snapshot(store, mirror, stats)
+        results.append(stats)
+    return results
+
+
+def get_master_sync_stats() -> list:
+    """Last sync statistics (mode, fetched, changed, deleted, rows, elapsed_ms) per master table."""
+    return [mirror.last_stats for mirror in _get_master_mirrors().values()]
 
 
-@st.cache_data(ttl=3600)  # Cache for 1 hour
 def fetch_customers():
     """Fetch all customers from Supabase."""
-    client = get_postgrest_client()
-    response = client.from_("master_customers").select("*").execute()
-    return response.data
+    return _fetch_master("master_customers")
 
 
-@st.cache_data(ttl=3600)
 def fetch_currencies():
     """Fetch all currencies from Supabase."""
-    client = get_postgrest_client()
-    response = client.from_("master_currencies").select("*").execute()
-    return response.data
+    return _fetch_master("master_currencies")
 
 
-@st.cache_data(ttl=3600)
 def fetch_ports():
     """Fetch all ports from Supabase."""
-    client = get_postgrest_client()
-    response = client.from_("master_ports").select("*").execute()
-    return response.data
+    return _fetch_master("master_ports")
 
 
-@st.cache_data(ttl=3600)
 def fetch_overhead():
     """Fetch overhead rates from Supabase."""
-    client = get_postgrest_client()
-    response = client.from_("master_overhead").select("*").execute()
-    return response.data
+    return _fetch_master("master_overhead")
 
 
-@st.cache_data(ttl=3600)
 def fetch_factory_expense():
     """Fetch factory expense rates from Supabase."""
-    client = get_postgrest_client()
-    response = client.from_("master_factory_expense").select("*").execute()
-    return response.data
-
-
+    return _fetch_master("master_factory_expense")
 
 
-@st.cache_data(ttl=3600)
 def fetch_shipping_rates():
-    """Fetch tiered shipping rates from Supabase."""
-    client = get_postgrest_client()
-    response = client.from_("shipping_rates").select("*").order("min_qty").execute()
-    return response.data
+    """Fetch tiered shipping rates from Supabase (ordered by min_qty)."""
+    return _fetch_master("shipping_rates")
 
 
-@st.cache_data(ttl=3600)
 def fetch_rm_costs():
-    """Fetch RM costs from Supabase."""
-    client = get_postgrest_client()
-    response = client.from_("master_rm_cost").select("*").order("update_date", desc=True).execute()
-    return response.data
+    """Fetch RM costs from Supabase (latest update_date first)."""
+    return _fetch_master("master_rm_cost")
 
 
-@st.cache_data(ttl=3600)
 def fetch_calculator_specs():
     """Fetch calculator specifications from Supabase."""
-    client = get_postgrest_client()
-    response = client.from_("master_calculator").select("*").order("id").execute()
-    return response.data
+    return _fetch_master("master_calculator")
+
+
+def fetch_fx_history():
+    """Fetch the FX rate history from Supabase (latest rate_date first)."""
+    return _fetch_master("master_fx_rates")
+
+
+def fetch_export_expense():
+    """Fetch export expense rates from Supabase (latest effective_date first)."""
+    return _fetch_master("master_export_expense")
+
+
+def bootstrap_master_data() -> dict:
+    """
+    Warm every master-data mirror concurrently (one thread per table).
+    Cold-start latency is bounded by the slowest table instead of the sum of all.
+    Returns {name: rows} for the tables that loaded; failures are logged and
+    left to the regular fetch_* call (which will retry and surface the error).
+    """
+    fetchers = {
+        "customers": fetch_customers,
+        "currencies": fetch_currencies,
+        "ports": fetch_ports,
+        "overhead": fetch_overhead,
+        "factory_expense": fetch_factory_expense,
+        "shipping_rates": fetch_shipping_rates,
+        "rm_costs": fetch_rm_costs,
+        "calculator_specs": fetch_calculator_specs,
+        "fx_history": fetch_fx_history,
+        "export_expense": fetch_export_expense,
+    }
+    # Let worker threads use the caller's Streamlit context (st.cache_resource needs it)
+    ctx = get_script_run_ctx()
+
+    def run(fetch):
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        return fetch()
+
+    with ThreadPoolExecutor(max_workers=len(fetchers)) as pool:
+        futures = {name: pool.submit(run, fetch) for name, fetch in fetchers.items()}
+
+    results = {}
+    for name, future in futures.items():
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            print(f"[WARNING] Bootstrap failed for {name}: {e}")
+    return results
+
+
+@st.cache_resource
+def _get_master_data_cache() -> dict:
+    """Holder for the shared MasterData index and the mirror versions it was built from."""
+    return {"versions": None, "data": None, "lock": threading.Lock()}
+
+
+def get_master_data() -> MasterData:
+    """
+    Shared, indexed master data (hash lookups by group / customer / port and an
+    interval index for shipping tiers). Rebuilt only when a mirror changes.
+    """
+    mirrors = _get_master_mirrors()
+    if any(mirror.version == 0 for mirror in mirrors.values()):
+        # Cold start without a snapshot: load all tables concurrently
+        bootstrap_master_data()
+    for table in MASTER_TABLES:
+        _fetch_master(table)
+    # Read versions before rows: a concurrent publish then only causes an extra rebuild
+    versions = tuple(mirror.version for mirror in mirrors.values())
+    cache = _get_master_data_cache()
+    with cache["lock"]:
+        if cache["versions"] != versions:
+            tables = {table: mirror.rows() for table, mirror in mirrors.items()}
+            cache["data"] = MasterData(tables, version=versions)
+            cache["versions"] = versions
+        return cache["data"]
 
 
 def get_overhead_by_group(group_number: int) -> float:
     """Get overhead rate for a specific group number."""
-    overheads = fetch_overhead()
-    for item in overheads:
-        if item.get('group_number') == group_number:
-            return item.get('overhead_rate', 0.0)
-    return 0.0
+    return get_master_data().overhead_rate(group_number)
 
 
 def get_yield_loss_by_group(group_number: int) -> float:
     """Get yield loss percentage for a specific group number from master_overhead."""
-    overheads = fetch_overhead()
-    for item in overheads:
-        if item.get('group_number') == group_number:
-            return float(item.get('yield_loss_percent', 0.0))
-    return 0.0
+    return get_master_data().yield_loss(group_number)
+
+
+# --- FX rates ---
+DEFAULT_FX_REFRESH_INTERVAL = 600  # seconds between scheduled batched downloads
+FX_SNAPSHOT_TABLE = "fx_rates"  # key of the last known rates in the local snapshot
+FX_HISTORY_CHUNK_SIZE = 500  # rows per master_fx_rates upsert
+
+
+@st.cache_resource
+def get_fx_service() -> FxRateService:
+    """
+    Process-wide FX rate service shared by every session.
+    All tracked pairs are downloaded in one batch on a background schedule;
+    the last known rates are kept in the local snapshot for restarts / offline use.
+    FX_PROVIDER=stub uses fixed local rates instead of Yahoo Finance.
+    """
+    provider = StubFxProvider() if _get_setting("FX_PROVIDER", "yahoo") == "stub" else YahooFxProvider()
+    store = _get_snapshot_store()
+    service = FxRateService(
+        provider,
+        ttl=float(_get_setting("FX_RATE_TTL", DEFAULT_FX_TTL)),
+        on_refresh=lambda svc: _on_fx_refresh(store, svc),
+    )
+    snapshot = store.load_all().get(FX_SNAPSHOT_TABLE)
+    if snapshot:
+        service.load_rows(snapshot["rows"])
+    service.start(float(_get_setting("FX_REFRESH_INTERVAL", DEFAULT_FX_REFRESH_INTERVAL)))
+    return service
+
+
+def _on_fx_refresh(store: MasterSnapshotStore, service: FxRateService):
+    """Keep the last known rates locally and record today's fixings in the FX history."""
+    store.save(FX_SNAPSHOT_TABLE, service.rows())
+    if service.provider.name == "stub":
+        return  # never write stub rates into the shared history
+    try:
+        record_fx_rates(service.rows())
+    except Exception as e:
+        print(f"[WARNING] FX history not recorded: {e}")
 
 
-def save_quotation(data: dict) -> str:
+def record_fx_rates(rates: list) -> int:
+    """
+    Upsert rates into master_fx_rates, one fixing per currency and day.
+    rates: [{"currency", "rate", and "rate_date" or "fetched_at" (epoch seconds)}, ...]
+    """
+    rows = [
+        {
+            "currency": r["currency"],
+            "rate_date": str(r.get("rate_date") or date.fromtimestamp(r["fetched_at"])),
+            "rate": r["rate"],
+            "source": r.get("source"),
+        }
+        for r in rates
+    ]
+    if rows:
+        get_postgrest_client().table("master_fx_rates").upsert(rows, on_conflict="currency,rate_date").execute()
+    return len(rows)
+
+
+def backfill_fx_history(currencies, days: int = 365) -> int:
+    """Load daily closing rates for the last `days` days from the FX provider into master_fx_rates."""
+    service = get_fx_service()
+    rows = service.provider.history(list(currencies), days)
+    for start in range(0, len(rows), FX_HISTORY_CHUNK_SIZE):
+        record_fx_rates(rows[start:start + FX_HISTORY_CHUNK_SIZE])
+    return len(rows)
+
+
+def _json_safe(value):
+    """Convert numpy/pandas scalars, dates and NaN to plain JSON values (recursively)."""
+    if isinstance(value, dict):
+        return {k: _json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(v) for v in value]
+    if hasattr(value, "item") and not isinstance(value, (str, bytes)):
+        # numpy.int64 / numpy.float64 / numpy.bool_
+        value = value.item()
+    if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+        return None
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def save_quotation(data: dict, atomic: bool = True) -> str:
     """
     Save the full quotation data to Supabase (6 tables).
+    atomic=True: one RPC call (save_quotation_full) writes header + all details
+    in a single request and a single database transaction.
+    Falls back to the multi-request path if the function is not deployed yet.
+    """
+    if atomic:
+        try:
+            return save_quotation_rpc(data)
+        except Exception as e:
+            # PGRST202: function not found -> Master/db_functions.sql not applied yet
+            if "PGRST202" not in str(e):
+                raise
+            print("[WARNING] save_quotation_full RPC not found, using multi-request save. "
+                  "Run Master/db_functions.sql in Supabase SQL Editor.")
+    return save_quotation_legacy(data)
+
+
+def save_quotation_rpc(data: dict) -> str:
+    """Save header + all details via the save_quotation_full RPC (1 round trip, atomic)."""
+    client = get_postgrest_client()
+    print("Saving quotation (RPC)...")
+    response = client.rpc("save_quotation_full", {"p_data": _json_safe(data)}).execute()
+    if not response.data:
+        raise Exception("Failed to save quotation")
+    return response.data
+
+
+def save_quotation_diff(data: dict) -> dict:
+    """
+    Save a quotation, writing only the detail rows that changed (save_quotation_diff RPC).
+    Detail rows are matched on item_order / order_no against what is stored.
+    Returns {"quotation_id": ..., "mode": "diff", "<trx table>": {"inserted", "updated", "deleted"}}.
+    """
+    client = get_postgrest_client()
+    try:
+        response = client.rpc("save_quotation_diff", {"p_data": _json_safe(data)}).execute()
+    except Exception as e:
+        if "PGRST202" not in str(e):
+            raise
+        print("[WARNING] save_quotation_diff RPC not found, saving with full replace. "
+              "Run Master/db_functions.sql in Supabase SQL Editor.")
+        return {"quotation_id": save_quotation(data), "mode": "replace"}
+
+    if not response.data:
+        raise Exception("Failed to save quotation")
+    result = dict(response.data)
+    result["mode"] = "diff"
+    return result
+
+
+BULK_SAVE_CHUNK_SIZE = 200  # Quotations per save_quotations_bulk request
+
+
+def save_quotations(quotations: list, chunk_size: int = BULK_SAVE_CHUNK_SIZE) -> dict:
+    """
+    Save many quotations (each shaped like save_quotation's payload) in chunks.
+    Each chunk is one save_quotations_bulk RPC: one batched INSERT for all headers
+    and one per detail table. A quotation that fails is reported without
+    failing the rest of its chunk.
+    Returns {"results": [{"doc_no", "quotation_id"} or {"doc_no", "error"}, ...],
+             "saved", "failed", "elapsed_s", "quotations_per_sec"}.
+    """
+    client = get_postgrest_client()
+    results = []
+    start = time.perf_counter()
+    use_rpc = True
+    for offset in range(0, len(quotations), chunk_size):
+        chunk = quotations[offset:offset + chunk_size]
+        if use_rpc:
+            try:
+                response = client.rpc("save_quotations_bulk", {"p_items": _json_safe(chunk)}).execute()
+                results.extend(response.data or [])
+                continue
+            except Exception as e:
+                # PGRST202: function not found -> Master/db_functions.sql not applied yet
+                if "PGRST202" not in str(e):
+                    raise
+                print("[WARNING] save_quotations_bulk RPC not found, saving one quotation at a time. "
+                      "Run Master/db_functions.sql in Supabase SQL Editor.")
+                use_rpc = False
+        for data in chunk:
+            doc_no = (data.get("general_info") or {}).get("doc_no")
+            try:
+                results.append({"doc_no": doc_no, "quotation_id": save_quotation(data)})
+            except Exception as e:
+                results.append({"doc_no": doc_no, "error": str(e)})
+
+    elapsed = time.perf_counter() - start
+    failed = sum(1 for r in results if r.get("error"))
+    return {
+        "results": results,
+        "saved": len(results) - failed,
+        "failed": failed,
+        "elapsed_s": round(elapsed, 3),
+        "quotations_per_sec": round(len(quotations) / elapsed, 1) if elapsed > 0 else None,
+    }
+
+
+def save_quotation_legacy(data: dict) -> str:
+    """
+    Save the full quotation data to Supabase (6 tables) with one request per table.
     Uses Upsert for Header (on doc_no) to allow overwriting/retrying.
+    Not atomic: a failure partway through can leave a half-written quotation.
     """
     client = get_postgrest_client()
     
@@ -164,7 +575,11 @@ def save_quotation(data: dict) -> str:
 
     try:
         # 2. Insert Export Expenses
-        insert_related("trx_export_expenses", data.get("export_expenses", {}), is_list=False)
+        # (other_expenses / dest_matrix / expense_lines are added by Master/db_functions.sql;
+        # this path only runs without it)
+        export_expenses = {k: v for k, v in (data.get("export_expenses") or {}).items()
+                           if k not in ("other_expenses", "dest_matrix", "expense_lines")}
+        insert_related("trx_export_expenses", export_expenses, is_list=False)
         
         # 3. Insert Interests
         insert_related("trx_interests", data.get("interests", {}), is_list=False)
@@ -188,9 +603,8 @@ def save_quotation(data: dict) -> str:
 def fetch_quotations():
     """Fetch all quotations header info for the dashboard."""
     client = get_postgrest_client()
-    # Select all columns to ensure we get what exists. 
-    # Note: 'status' and 'total_cost' are currently NOT in the header table schema, 
-    # so they will be missing. Logic in Home.py should handle this.
+    # Select all columns to ensure we get what exists.
+    # Note: 'status' / 'total_cost' exist only once Master/db_functions.sql is applied.
     response = client.from_("trx_general_infos").select("*").order("created_at", desc=True).execute()
     return response.data
 
@@ -200,9 +614,163 @@ def delete_quotation(quotation_id: str):
     # Supabase cascade delete should handle the relations if set up, 
     # but our migration script said 'ON DELETE CASCADE', so we just delete header.
     client.from_("trx_general_infos").delete().eq("id", quotation_id).execute()
+
+
+# --- Dashboard listing (keyset pagination) ---
+DASHBOARD_COLUMNS = "id,doc_no,doc_date,trader_name,team,customer_importer,currency,exchange_rate,created_at"
+# Header summary maintained by the save RPCs (Master/db_functions.sql)
+DASHBOARD_SUMMARY_COLUMNS = "status,total_qty,total_cost,total_margin,line_count"
+DASHBOARD_PAGE_SIZE = 50
+DASHBOARD_CACHE_TTL = 30  # seconds; short so new saves show up quickly
+
+
+@st.cache_data(ttl=DASHBOARD_CACHE_TTL, show_spinner=False)
+def fetch_quotation_page(cursor=None, page_size: int = DASHBOARD_PAGE_SIZE, date_from=None, date_to=None,
+                         team=None, trader=None, customer=None) -> dict:
+    """
+    One page of quotation headers for the dashboard, newest first.
+    cursor: (created_at, id) of the last row of the previous page, None for the first page.
+    Filters run server-side: doc_date range, team (exact), trader / customer (contains).
+    Rows include the header summary (status, totals, line_count) when available.
+    Returns {"rows": [...], "next_cursor": (created_at, id) or None}.
+    Cost is O(page_size) regardless of table size (index on created_at DESC, id DESC).
+    """
+    try:
+        return _fetch_quotation_page(f"{DASHBOARD_COLUMNS},{DASHBOARD_SUMMARY_COLUMNS}", cursor, page_size,
+                                     date_from, date_to, team, trader, customer)
+    except Exception as e:
+        # 42703: undefined column (summary columns from db_functions.sql not applied yet)
+        if "42703" not in str(e):
+            raise
+        print("[WARNING] Quotation summary columns missing, listing without totals. "
+              "Run Master/db_functions.sql in Supabase SQL Editor.")
+        return _fetch_quotation_page(DASHBOARD_COLUMNS, cursor, page_size,
+                                     date_from, date_to, team, trader, customer)
+
+
+def _fetch_quotation_page(columns, cursor, page_size, date_from, date_to, team, trader, customer) -> dict:
+    client = get_postgrest_client()
+    query = client.from_("trx_general_infos").select(columns)
+    if date_from:
+        query = query.gte("doc_date", str(date_from))
+    if date_to:
+        query = query.lte("doc_date", str(date_to))
+    if team:
+        query = query.eq("team", team)
+    if trader:
+        query = query.ilike("trader_name", f"*{trader}*")
+    if customer:
+        query = query.ilike("customer_importer", f"*{customer}*")
+    if cursor is not None:
+        created_at, last_id = cursor
+        # Rows strictly after the cursor in (created_at DESC, id DESC) order
+        query = query.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{last_id})')
+
+    # Ask for one extra row to know whether another page exists
+    rows = query.order("created_at", desc=True).order("id", desc=True) \
+        .limit(page_size + 1).execute().data or []
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    next_cursor = (rows[-1]["created_at"], rows[-1]["id"]) if has_more else None
+    return {"rows": rows, "next_cursor": next_cursor}
+
+
+# Header + all detail tables, embedded through the quotation_id foreign keys
+QUOTATION_EMBED = (
+    "*,trx_export_expenses(*),trx_interests(*),trx_production_costs(*),"
+    "trx_loadings(*),trx_remarks(*)"
+)
+
+
+def load_quotation(doc_no: str):
+    """
+    Load one quotation with all its details in a single request (PostgREST embedding).
+    Returns the same shape save_quotation() takes:
+    {general_info, export_expenses, interests, production_costs, loadings, remarks},
+    with detail lists ordered by item_order / order_no. None if doc_no does not exist.
+    """
+    client = get_postgrest_client()
+    rows = client.from_("trx_general_infos").select(QUOTATION_EMBED).eq("doc_no", doc_no).limit(1).execute().data
+    if not rows:
+        return None
+    header = dict(rows[0])
+
+    def ordered(table, key):
+        return sorted(header.pop(table, None) or [], key=lambda r: (r.get(key) is None, r.get(key) or 0))
+
+    def single(table):
+        items = header.pop(table, None) or []
+        return items[0] if items else {}
+
+    return {
+        "export_expenses": single("trx_export_expenses"),
+        "interests": single("trx_interests"),
+        "production_costs": ordered("trx_production_costs", "item_order"),
+        "loadings": ordered("trx_loadings", "order_no"),
+        "remarks": ordered("trx_remarks", "order_no"),
+        "general_info": header,
+    }
+
+
+def clone_quotation(source_doc_no: str, new_doc_no: str = None, **overrides) -> dict:
+    """
+    Copy a quotation (header + all details) to a new doc_no inside the database (clone_quotation RPC).
+    new_doc_no=None reserves the next CSYYYYMMDD-XXXX number for the copy's doc_date.
+    overrides replace header fields, e.g. doc_date=date(2026, 3, 1), exchange_rate=35.2,
+    ship_date_from=..., ship_date_to=...
+    Returns {"quotation_id", "doc_no", "source_doc_no"}.
+    """
+    client = get_postgrest_client()
+    response = client.rpc("clone_quotation", {
+        "p_source_doc_no": source_doc_no,
+        "p_new_doc_no": new_doc_no,
+        "p_overrides": _json_safe(overrides),
+    }).execute()
+    return response.data
+
+
+def clone_quotations(items: list) -> list:
+    """
+    Bulk clone in one request (clone_quotations RPC).
+    items: [{"source_doc_no": ..., "new_doc_no": ... (optional), "overrides": {...} (optional)}, ...]
+    Returns one result per item; failed items carry {"source_doc_no", "error"} instead of aborting the batch.
+    """
+    client = get_postgrest_client()
+    response = client.rpc("clone_quotations", {"p_items": _json_safe(list(items))}).execute()
+    return response.data or []
+
+
+def find_quotation_id(doc_no: str):
+    """Header id for a Document No., or None (unique index lookup)."""
+    client = get_postgrest_client()
+    rows = client.from_("trx_general_infos").select("id").eq("doc_no", doc_no).limit(1).execute().data
+    return rows[0]["id"] if rows else None
+
+
+def reserve_doc_no_sequence(prefix: str) -> int:
+    """
+    Atomically reserve the next sequence number for a Document No. prefix
+    (e.g. CS20260212-) via the reserve_doc_no RPC: one round trip, and
+    concurrent callers never receive the same number.
+    Falls back to scanning existing doc_no values if the function is not deployed yet.
+    """
+    client = get_postgrest_client()
+    try:
+        response = client.rpc("reserve_doc_no", {"p_prefix": prefix}).execute()
+    except Exception as e:
+        # PGRST202: function not found -> Master/db_functions.sql not applied yet
+        if "PGRST202" not in str(e):
+            raise
+        print("[WARNING] reserve_doc_no RPC not found, scanning existing doc_no values. "
+              "Run Master/db_functions.sql in Supabase SQL Editor.")
+        return get_next_doc_no_sequence(prefix)
+    return int(response.data)
+
+
 def get_next_doc_no_sequence(prefix: str) -> int:
     """
     Get the next sequence number for a given Document No. prefix (e.g. CS20260212-).
+    Not atomic (two callers can get the same number); prefer reserve_doc_no_sequence().
     """
     client = get_postgrest_client()
     # Find all documents starting with the prefix
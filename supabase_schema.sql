@@ -149,6 +149,72 @@ CREATE TABLE IF NOT EXISTS master_rm_cost (
     created_at TIMESTAMPTZ DEFAULT NOW()
 );
 
+-- Table: master_fx_rates (FX history, THB per unit of currency)
+-- One fixing per currency and day; filled by the app's FX service and backfills.
+CREATE TABLE IF NOT EXISTS master_fx_rates (
+    id SERIAL PRIMARY KEY,
+    currency VARCHAR(10) NOT NULL,
+    rate_date DATE NOT NULL,
+    rate DECIMAL(14,6) NOT NULL,
+    source VARCHAR(20),
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    UNIQUE (currency, rate_date)
+);
+
+-- Table: master_export_expense (export expense lines of the Cost Sheet Editor)
+-- amount = rate x driver quantity: containers, invoices or tons (containers x ton/container).
+-- A new rate is a new row with a later effective_date; quotations use the rate as of their doc_date.
+CREATE TABLE IF NOT EXISTS master_export_expense (
+    id SERIAL PRIMARY KEY,
+    line_code VARCHAR(50) NOT NULL,
+    expense_group TEXT,
+    description TEXT,
+    driver VARCHAR(10) NOT NULL CHECK (driver IN ('container', 'invoice', 'ton')),
+    rate DECIMAL(14,4) NOT NULL,
+    effective_date DATE NOT NULL,
+    sort_order INTEGER,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    UNIQUE (line_code, effective_date)
+);
+
 -- If you need to migrate existing table (Manual Step):
 -- ALTER TABLE master_overhead ADD COLUMN IF NOT EXISTS yield_loss_percent DECIMAL(10,4) DEFAULT 0.0;
 -- DROP TABLE IF EXISTS master_yield_loss;
+
+-- Delta sync support (master_sync.py): every master table carries updated_at,
+-- kept current by a trigger, so the app only downloads rows changed since its
+-- last high-water mark.
+ALTER TABLE master_currencies ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();
+ALTER TABLE master_ports ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();
+ALTER TABLE master_overhead ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();
+ALTER TABLE master_factory_expense ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();
+ALTER TABLE shipping_rates ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();
+ALTER TABLE master_rm_cost ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();
+ALTER TABLE master_calculator ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();
+ALTER TABLE master_fx_rates ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();
+ALTER TABLE master_export_expense ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();
+
+CREATE OR REPLACE FUNCTION set_updated_at() RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at = NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    t TEXT;
+BEGIN
+    FOREACH t IN ARRAY ARRAY[
+        'master_customers', 'master_currencies', 'master_ports', 'master_overhead',
+        'master_factory_expense', 'shipping_rates', 'master_rm_cost', 'master_calculator',
+        'master_fx_rates', 'master_export_expense'
+    ] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_%1$s_updated_at ON %1$I', t);
+        EXECUTE format(
+            'CREATE TRIGGER trg_%1$s_updated_at BEFORE UPDATE ON %1$I '
+            'FOR EACH ROW EXECUTE FUNCTION set_updated_at()', t);
+        EXECUTE format('CREATE INDEX IF NOT EXISTS idx_%1$s_updated_at ON %1$I(updated_at)', t);
+    END LOOP;
+END;
+$$;